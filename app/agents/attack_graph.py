@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.metrics import Trace, current_trace
+from app.mcp.backends import MCP_BATCH_DEADLINE, MITRE_BACKEND, get_backend
+from app.mcp.resilience import EnrichmentBudget
+from app.mcp.technique_cache import get_cache
+
+ATTACK_GRAPH_ENABLED = os.getenv("ATTACK_GRAPH", "1").lower() not in ("0", "false", "no", "off")
+# 1: relaciones de las técnicas semilla; 2: además las de sus sub-técnicas, etc.
+ATTACK_GRAPH_DEPTH = int(os.getenv("ATTACK_GRAPH_DEPTH", "1"))
+
+# Los vecindarios comparten la cache de técnicas con un prefijo propio.
+_CACHE_PREFIX = "graph:"
+
+
+class AttackGraph:
+    """
+    Vecindario ATT&CK de las técnicas del catálogo como listas de adyacencia:
+    `nodes` guarda id -> nombre (técnicas, sub-técnicas, tácticas, mitigaciones)
+    y `edges` técnica -> {"tactics" | "subtechniques" | "mitigations" | "parent": [ids]}.
+
+    Se arma una vez por clasificación y lo comparten todos los detectores: cada
+    uno solo toma las relaciones de sus técnicas con `relations()`.
+    """
+
+    def __init__(self, depth: int = ATTACK_GRAPH_DEPTH):
+        self.depth = depth
+        self.nodes: Dict[str, str] = {}
+        self.edges: Dict[str, Dict[str, List[str]]] = {}
+        self.requests = 0
+        self.cache_hits = 0
+        self.missing: List[str] = []
+        self.skipped = 0
+        self.unsupported = False
+
+    def add(self, technique_id: str, hood: Dict[str, Any]) -> List[str]:
+        """Agrega el vecindario de una técnica; devuelve las sub-técnicas a expandir."""
+        technique = hood.get("technique") or {}
+        self.nodes[technique_id] = technique.get("name") or self.nodes.get(technique_id, "")
+        adj: Dict[str, List[str]] = {}
+
+        for tactic in hood.get("tactics") or []:
+            key = tactic.get("shortname") or tactic.get("id")
+            if key:
+                self.nodes.setdefault(key, tactic.get("name") or key)
+                adj.setdefault("tactics", []).append(key)
+        for rel in ("subtechniques", "mitigations"):
+            for item in hood.get(rel) or []:
+                if item.get("id"):
+                    self.nodes.setdefault(item["id"], item.get("name") or "")
+                    adj.setdefault(rel, []).append(item["id"])
+        parent = hood.get("parent")
+        if parent and parent.get("id"):
+            self.nodes.setdefault(parent["id"], parent.get("name") or "")
+            adj["parent"] = [parent["id"]]
+
+        self.edges[technique_id] = adj
+        return adj.get("subtechniques", [])
+
+    def relations(self, technique_id: str) -> Dict[str, List[Dict[str, str]]]:
+        adj = self.edges.get(technique_id)
+        if not adj:
+            return {}
+        return {
+            rel: [{"id": nid, "name": self.nodes.get(nid, "")} for nid in ids]
+            for rel, ids in adj.items()
+        }
+
+    @property
+    def status(self) -> str:
+        if self.unsupported:
+            return "unsupported"
+        if not self.missing:
+            return "ok"
+        return "partial" if self.edges else "unavailable"
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "depth": self.depth,
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "techniques": len(self.edges),
+            "nodes": len(self.nodes),
+            "edges": sum(len(ids) for adj in self.edges.values() for ids in adj.values()),
+            "missing": self.missing,
+            **({"skipped": self.skipped} if self.skipped else {}),
+        }
+
+
+def build_graph(
+    seed_ids: Iterable[str],
+    depth: int = ATTACK_GRAPH_DEPTH,
+    backend: Optional[str] = None,
+    deadline: Optional[float] = MCP_BATCH_DEADLINE,
+    use_cache: bool = True,
+    trace: Optional[Trace] = None,
+    budget: Optional[EnrichmentBudget] = None,
+) -> AttackGraph:
+    """
+    Recorre el grafo ATT&CK en anchura desde `seed_ids`: por nivel, una sola
+    llamada en lote al backend (get_neighborhood) para las técnicas que no están
+    en cache. La cantidad de requests queda acotada por `depth`, no por
+    detectores × relaciones.
+
+    Como en enrich_techniques, con `budget` agotado no se llama al backend y lo
+    que falta sale de la cache aunque esté vencida.
+    """
+    graph = AttackGraph(depth)
+    backend_name = backend or MITRE_BACKEND
+    mitre = get_backend(backend)
+    cache = get_cache() if use_cache and mitre.remote else None
+    trace = trace or current_trace()
+
+    frontier = list(dict.fromkeys(seed_ids))
+    for level in range(max(1, depth)):
+        if not frontier:
+            break
+        with trace.span("mitre.graph", level=level, backend=backend_name, requested=len(frontier)) as span:
+            keys = [_CACHE_PREFIX + tid for tid in frontier]
+            cached = {k[len(_CACHE_PREFIX):]: v for k, v in cache.get_many(keys).items()} if cache else {}
+            graph.cache_hits += len(cached)
+            misses = [tid for tid in frontier if tid not in cached]
+
+            fetched: Dict[str, Optional[Dict[str, Any]]] = {}
+            if misses:
+                if budget is not None and mitre.remote and budget.exhausted:
+                    graph.skipped += len(misses)
+                    budget.skipped += len(misses)
+                else:
+                    t0 = time.perf_counter()
+                    fetched = mitre.get_neighborhood(
+                        misses, deadline=budget.deadline(deadline) if budget is not None and mitre.remote else deadline
+                    )
+                    graph.requests += 1
+                    span.set(request_ms=round((time.perf_counter() - t0) * 1000, 3))
+                resolved = {_CACHE_PREFIX + tid: hood for tid, hood in fetched.items() if hood}
+                # Fallback a vecindarios vencidos antes de escribir los resueltos.
+                failed = [_CACHE_PREFIX + tid for tid in misses if not fetched.get(tid)]
+                if failed and cache:
+                    stale = cache.get_stale(failed)
+                    fetched.update({k[len(_CACHE_PREFIX):]: v for k, v in stale.items()})
+                if mitre.remote:
+                    get_cache().put_many(resolved)
+
+            missing_before = len(graph.missing)
+            discovered: List[str] = []
+            for tid in frontier:
+                hood = cached.get(tid) or fetched.get(tid)
+                if hood:
+                    discovered.extend(graph.add(tid, hood))
+                else:
+                    graph.missing.append(tid)
+            span.set(cache_hits=len(cached), missing=len(graph.missing) - missing_before)
+
+        frontier = [tid for tid in dict.fromkeys(discovered) if tid not in graph.edges]
+
+    # Servidor MCP sin la tool en lote (mitre-mcp upstream): no es una falla transitoria.
+    graph.unsupported = getattr(mitre, "neighborhood_supported", None) is False
+    return graph
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import sys
+from collections import Counter
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+DETECTOR_CATALOG_PATH = os.getenv("DETECTOR_CATALOG_PATH", str(PROJECT_ROOT / "data" / "detector_catalog.json"))
+
+# Bit order of the telemetry mask. Same keys as AnalyzerAgent._infer_telemetry_flags.
+TELEMETRY_FLAGS: Tuple[str, ...] = ("idp", "edr", "cloud", "dns", "proxy", "db")
+TELEMETRY_BITS: Dict[str, int] = {flag: 1 << i for i, flag in enumerate(TELEMETRY_FLAGS)}
+
+
+def telemetry_mask(flags: Dict[str, bool]) -> int:
+    mask = 0
+    for flag, present in flags.items():
+        if present:
+            mask |= TELEMETRY_BITS.get(flag, 0)
+    return mask
+
+
+def mask_flags(mask: int) -> List[str]:
+    return [flag for flag, bit in TELEMETRY_BITS.items() if mask & bit]
+
+
+class DetectorTemplate:
+    """One catalog entry. Required telemetry is a bitmask over TELEMETRY_FLAGS."""
+
+    __slots__ = (
+        "id", "name", "category_hint", "priority", "required_mask", "order",
+        "goal", "data_needed", "detection_logic", "expected_false_positives",
+        "tuning_ideas", "rationale", "dbir_query", "telemetry_check", "_rationales",
+    )
+
+    def __init__(self, entry: Dict, order: int):
+        unknown = [f for f in entry.get("requires", []) if f not in TELEMETRY_BITS]
+        if unknown:
+            raise ValueError(f"Detector {entry.get('id')!r} requires unknown telemetry: {unknown}")
+
+        self.id: str = sys.intern(entry["id"])
+        self.name: str = entry["name"]
+        self.category_hint: str = sys.intern(entry["category_hint"])
+        self.priority: int = int(entry.get("priority", 0))
+        self.required_mask: int = telemetry_mask({f: True for f in entry.get("requires", [])})
+        self.order: int = order
+        self.goal: str = entry["goal"]
+        self.data_needed: Tuple[str, ...] = tuple(entry["data_needed"])
+        self.detection_logic: str = entry["detection_logic"]
+        self.expected_false_positives: str = entry["expected_false_positives"]
+        self.tuning_ideas: str = entry["tuning_ideas"]
+        self.rationale: str = entry["rationale"]
+        # Consulta al índice DBIR para los pasajes que respaldan el rationale.
+        self.dbir_query: str = entry.get("dbir_query") or f"{self.name} {self.goal}"
+        self.telemetry_check: Tuple[Tuple[str, str], ...] = tuple(
+            (label, sys.intern(flag)) for label, flag in entry.get("telemetry_check", [])
+        )
+        # rationale_for_mask(): un solo str por máscara, compartido por todas las sesiones.
+        self._rationales: Dict[int, str] = {}
+
+    def rationale_for(self, telemetry: Dict[str, bool]) -> str:
+        if not self.telemetry_check:
+            return self.rationale
+        checks = ", ".join(
+            f"{label}={'yes' if telemetry.get(flag) else 'no/unknown'}" for label, flag in self.telemetry_check
+        )
+        return f"{self.rationale} Telemetry check: {checks}."
+
+    def rationale_for_mask(self, mask: int) -> str:
+        text = self._rationales.get(mask)
+        if text is None:
+            text = self._rationales.setdefault(
+                mask, self.rationale_for({flag: bool(mask & bit) for flag, bit in TELEMETRY_BITS.items()})
+            )
+        return text
+
+
+class DetectorCatalog:
+    """
+    Detector templates bucketed by required-telemetry mask (at most 2^len(TELEMETRY_FLAGS)
+    buckets), each bucket pre-sorted by priority.
+
+    Ranking for a tenant: first templates whose required telemetry is fully available,
+    then those missing one source, and so on; by priority (then catalog order) inside
+    each level. Selection only walks bucket heads, so picking the top k does not scan
+    or materialize the whole catalog.
+    """
+
+    def __init__(self, templates: Sequence[DetectorTemplate], version: int = 1):
+        self.version = version
+        self.size = len(templates)
+        self.templates: Tuple[DetectorTemplate, ...] = tuple(sorted(templates, key=lambda t: t.order))
+        self.buckets: Dict[int, List[DetectorTemplate]] = {}
+        for t in templates:
+            self.buckets.setdefault(t.required_mask, []).append(t)
+        for bucket in self.buckets.values():
+            bucket.sort(key=lambda t: (-t.priority, t.order))
+
+    @classmethod
+    def from_file(cls, path: str = DETECTOR_CATALOG_PATH) -> "DetectorCatalog":
+        p = Path(path)
+        if not p.exists():
+            raise FileNotFoundError(f"Missing file: {p}")
+        with p.open("r", encoding="utf-8") as f:
+            raw = json.load(f)
+
+        flags = tuple(raw.get("telemetry_flags", TELEMETRY_FLAGS))
+        if flags != TELEMETRY_FLAGS:
+            raise ValueError(f"Catalog telemetry_flags {flags} do not match {TELEMETRY_FLAGS}")
+
+        templates = [DetectorTemplate(entry, i) for i, entry in enumerate(raw.get("detectors", []))]
+        duplicated = sorted(i for i, n in Counter(t.id for t in templates).items() if n > 1)
+        if duplicated:
+            raise ValueError(f"Duplicate detector ids in catalog: {duplicated}")
+        return cls(templates, version=int(raw.get("version", 1)))
+
+    def iter_ranked(self, available_mask: int) -> Iterator[DetectorTemplate]:
+        levels: Dict[int, List[List[DetectorTemplate]]] = {}
+        for mask, bucket in self.buckets.items():
+            missing = bin(mask & ~available_mask).count("1")
+            levels.setdefault(missing, []).append(bucket)
+
+        for missing in sorted(levels):
+            yield from heapq.merge(*levels[missing], key=lambda t: (-t.priority, t.order))
+
+    def select(self, available_mask: int, k: Optional[int] = None) -> List[DetectorTemplate]:
+        return list(islice(self.iter_ranked(available_mask), k))
+
+
+_CATALOGS: Dict[Path, Tuple[int, DetectorCatalog]] = {}
+
+
+def load_catalog(path: str = DETECTOR_CATALOG_PATH) -> DetectorCatalog:
+    """Catalog parsed once per process (reloaded if the file changes)."""
+    p = Path(path)
+    mtime = p.stat().st_mtime_ns if p.exists() else -1
+    cached = _CATALOGS.get(p)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    catalog = DetectorCatalog.from_file(path)
+    _CATALOGS[p] = (mtime, catalog)
+    return catalog
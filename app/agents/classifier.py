@@ -1,7 +1,18 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List
-from app.mcp.mitre_client import get_technique_by_id
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from app.agents.attack_graph import ATTACK_GRAPH_ENABLED, AttackGraph, build_graph
+from app.agents.catalog import telemetry_mask
+from app.agents.scoring import ScoreBatch, load_scoring_model, rank
+from app.metrics import Trace, current_trace
+from app.mcp.backends import MCP_BATCH_DEADLINE, MCP_CONCURRENCY, MITRE_BACKEND, get_backend
+from app.mcp.resilience import EnrichmentBudget
+from app.mcp.technique_cache import get_cache
+from app.schemas import ClassifiedBatch, DetectorBatch, as_detector_batch
 
 # --- MITRE mapping ---
 MITRE_ID_MAP = {
@@ -12,126 +23,306 @@ MITRE_ID_MAP = {
     "THIRD_PARTY": ["T1199", "T1078"],
 }
 
+# Bloques de la salida que describen la corrida (lookups, cache de técnicas, backend),
+# no el resultado: la cache de etapas no los guarda.
+RUN_STATS_KEYS = ("mitre_lookup", "mitre_cache", "mcp", "local_attack")
+
 
 def _risk_level_from_score(score: int) -> str:
-    if score >= 200:
-        return "High"
-    if score >= 120:
-        return "Medium"
-    return "Low"
+    return load_scoring_model().level_for(score)
 
 
 def _score_from_category(category: str, telemetry: Dict[str, bool]) -> Dict[str, Any]:
-    base = {
-        "RANSOMWARE":      (5, 5),  
-        "ATO":             (5, 5),  
-        "EXFIL":           (5, 4),
-        "EXPLOIT_PRIVESC": (5, 4),
-        "THIRD_PARTY":     (4, 3), 
+    # Un detector a la vez; para lotes usar score_detectors() (vectorizado).
+    return load_scoring_model().score(category, telemetry)
+
+
+def score_detectors(detectors: Iterable[Any]) -> ScoreBatch:
+    """Scoring de todos los detectores en una sola pasada del modelo (data/scoring_model.json)."""
+    if isinstance(detectors, DetectorBatch):
+        # Directo de las columnas: categorías y máscaras de telemetría.
+        return load_scoring_model().score_batch(detectors.category_hint, detectors.telemetry_mask)
+    detectors = list(detectors)
+    return load_scoring_model().score_batch(
+        [d.get("category_hint", "UNKNOWN") for d in detectors],
+        [telemetry_mask(d.get("telemetry_flags") or {}) for d in detectors],
+    )
+
+
+def scoring_fingerprints(categories: Iterable[str]) -> Dict[str, str]:
+    """
+    Huella por categoría del modelo de scoring + MITRE_ID_MAP vigentes. Queda en
+    classifier.json para que `python -m app.rescore` sepa qué sesiones cambiarían.
+    """
+    model = load_scoring_model()
+    out: Dict[str, str] = {}
+    for category in sorted(set(categories)):
+        mapping = ",".join(MITRE_ID_MAP.get(category, []))
+        out[category] = f"{model.fingerprint(category)}:{mapping}"
+    return out
+
+
+def _mitre_entry(tid: str, info: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    if not info:
+        return {"technique": tid, "name": "Unknown (MCP lookup failed)"}
+
+    name = (
+        info.get("name")
+        or info.get("technique_name")
+        or info.get("title")
+        or "Unknown"
+    )
+    return {"technique": tid, "name": name}
+
+
+def enrich_techniques(
+    technique_ids: Iterable[str],
+    concurrency: int = MCP_CONCURRENCY,
+    deadline: Optional[float] = MCP_BATCH_DEADLINE,
+    use_cache: bool = True,
+    backend: Optional[str] = None,
+    trace: Optional[Trace] = None,
+    budget: Optional[EnrichmentBudget] = None,
+) -> Tuple[Dict[str, Dict[str, str]], Dict[str, int]]:
+    """
+    Etapa de enriquecimiento en lote: resuelve cada técnica una sola vez
+    (primero cache local, después el backend MITRE en paralelo para los misses)
+    y devuelve ({technique_id: {"technique", "name"}}, contadores de cache).
+    El backend "local" no pasa por la cache: ya responde desde memoria.
+    Cada técnica queda como span "mitre.lookup" en `trace` (default: el de la sesión en curso).
+
+    Con `budget` los lookups remotos usan como deadline lo que queda del presupuesto
+    de la sesión y, agotado, no se intentan. Lo que no resuelve el backend sale de
+    la cache aunque esté vencida ("stale") o queda como "Unknown".
+    """
+    ids = list(dict.fromkeys(technique_ids))
+    backend_name = backend or MITRE_BACKEND
+    mitre = get_backend(backend)
+    cache = get_cache() if use_cache and mitre.remote else None
+    trace = trace or current_trace()
+    cache_state = "miss" if cache else "bypass"
+
+    start = time.perf_counter()
+    infos: Dict[str, Optional[Dict[str, Any]]] = cache.get_many(ids) if cache else {}
+    hits = len(infos)
+    misses = [tid for tid in ids if tid not in infos]
+    if trace.enabled:
+        elapsed = time.perf_counter() - start
+        for tid in infos:
+            trace.add("mitre.lookup", start, elapsed, technique=tid, backend=backend_name, cache="hit", result="ok")
+
+    stale = skipped = 0
+    if misses:
+        on_lookup = None
+        reported: Dict[str, bool] = {}
+        if trace.enabled:
+            def on_lookup(tid: str, t0: float, seconds: float, reason: Optional[str]) -> None:
+                reported[tid] = True
+                trace.add(
+                    "mitre.lookup", t0, seconds, technique=tid, backend=backend_name, cache=cache_state,
+                    result="fail" if reason else "ok", reason=reason,
+                )
+
+        t0 = time.perf_counter()
+        if budget is not None and mitre.remote and budget.exhausted:
+            # Presupuesto de la sesión agotado: ni un round trip más.
+            fetched: Dict[str, Optional[Dict[str, Any]]] = {}
+            skipped = len(misses)
+            budget.skipped += skipped
+            unreported = "budget_exhausted"
+        else:
+            if budget is not None and mitre.remote:
+                deadline = budget.deadline(deadline)
+            fetched = mitre.get_techniques(misses, concurrency=concurrency, deadline=deadline, on_lookup=on_lookup)
+            unreported = "backend_unavailable"
+        if trace.enabled:
+            # Lo que el backend no llegó a reportar (lote caído, backend no disponible, sin presupuesto).
+            elapsed = time.perf_counter() - t0
+            for tid in misses:
+                if tid not in reported:
+                    trace.add(
+                        "mitre.lookup", t0, elapsed, technique=tid, backend=backend_name, cache=cache_state,
+                        result="ok" if fetched.get(tid) else "fail",
+                        reason=None if fetched.get(tid) else unreported,
+                    )
+        infos.update(fetched)
+
+        # Fallback a entradas vencidas antes de escribir las resueltas.
+        failed = [tid for tid in misses if not infos.get(tid)]
+        if failed and cache:
+            fallback = cache.get_stale(failed)
+            stale = len(fallback)
+            infos.update(fallback)
+        if mitre.remote:
+            get_cache().put_many({tid: info for tid, info in fetched.items() if info})
+
+    entries = {tid: _mitre_entry(tid, infos.get(tid)) for tid in ids}
+    return entries, {"hits": hits, "misses": len(misses), "stale": stale, "skipped": skipped}
+
+
+def prefetch_mitre(
+    concurrency: int = MCP_CONCURRENCY,
+    deadline: Optional[float] = MCP_BATCH_DEADLINE,
+    backend: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Refresca en la cache local todas las técnicas de MITRE_ID_MAP."""
+    ids = list(dict.fromkeys(tid for tids in MITRE_ID_MAP.values() for tid in tids))
+    entries, _ = enrich_techniques(
+        ids, concurrency=concurrency, deadline=deadline, use_cache=False, backend=backend
+    )
+    failed = [tid for tid, e in entries.items() if e["name"].startswith("Unknown")]
+    summary: Dict[str, Any] = {
+        "requested": len(ids),
+        "cached": len(ids) - len(failed),
+        "failed": failed,
     }
+    if ATTACK_GRAPH_ENABLED:
+        graph = build_graph(ids, deadline=deadline, use_cache=False, backend=backend)
+        summary["attack_graph"] = graph.snapshot()
+    summary["cache"] = get_cache().stats_snapshot()
+    return summary
 
-    impact, likelihood = base.get(category, (3, 3))
-
-    bonus = 0
-    if category == "ATO" and telemetry.get("idp"):
-        bonus = 0 
-    elif category == "RANSOMWARE" and telemetry.get("edr"):
-        bonus = 0
-    elif category == "EXFIL" and (telemetry.get("proxy") or telemetry.get("db")):
-        bonus = 1
-    elif category == "EXPLOIT_PRIVESC" and telemetry.get("cloud"):
-        bonus = 1
-    elif category == "THIRD_PARTY" and telemetry.get("idp"):
-        bonus = 1
-
-    likelihood = min(5, likelihood + bonus)
-
-    if category == "RANSOMWARE":
-        risk_rationale = (
-            "Critical availability impact aligned with DBIR system intrusion patterns. "
-            "Ransomware remains one of the most disruptive and prevalent attack outcomes."
-        )
-    elif category == "ATO":
-        risk_rationale = (
-            "High-impact credential abuse scenario aligned with DBIR credential-based breaches. "
-            "MFA fatigue and valid account misuse remain highly prevalent initial access vectors."
-        )
-    elif category == "EXFIL":
-        risk_rationale = (
-            "High data exposure impact aligned with DBIR data breach outcomes. "
-            "Exfiltration following abnormal export activity represents elevated business risk."
-        )
-    elif category == "EXPLOIT_PRIVESC":
-        risk_rationale = (
-            "Privilege escalation following vulnerability exploitation reflects DBIR system intrusion trends. "
-            "Administrative access compromise significantly increases blast radius."
-        )
-    elif category == "THIRD_PARTY":
-        risk_rationale = (
-            "Third-party access abuse reflects DBIR supply chain and partner risk trends. "
-            "Impact depends on privilege scope and monitoring maturity."
-        )
-    else:
-        risk_rationale = (
-            "Default scoring applied due to unknown category."
-        )
 
-    risk_score = impact * likelihood * 10
-    risk_level = _risk_level_from_score(risk_score)
+def _classify(
+    d: Dict[str, Any],
+    enriched: Dict[str, Dict[str, str]],
+    scoring: Optional[Dict[str, Any]] = None,
+    graph: Optional[AttackGraph] = None,
+) -> Dict[str, Any]:
+    category = d.get("category_hint", "UNKNOWN")
+    telemetry = d.get("telemetry_flags", {}) or {}
+
+    if scoring is None:
+        scoring = _score_from_category(category, telemetry)
 
     return {
-        "impact": impact,
-        "likelihood": likelihood,
-        "risk_score": risk_score,
-        "risk_level": risk_level,
-        "risk_rationale": risk_rationale,
+        "detector_id": d.get("detector_id"),
+        "name": d.get("name"),
+        "category": category,
+        "mitre": _category_mitre(category, enriched, graph),
+        **scoring,
     }
 
 
-def run(session_id: str, analyzer_out: Dict[str, Any]) -> Dict[str, Any]:    
-    detectors = analyzer_out.get("detectors")
-    if detectors is None:
-        detectors = (analyzer_out.get("payload") or {}).get("detectors", [])
-    if detectors is None:
-        detectors = []
+def _category_mitre(
+    category: str,
+    enriched: Dict[str, Dict[str, str]],
+    graph: Optional[AttackGraph] = None,
+) -> List[Dict[str, Any]]:
+    mitre: List[Dict[str, Any]] = [enriched[tid] for tid in MITRE_ID_MAP.get(category, [])]
+    if graph is not None:
+        # Tácticas, sub-técnicas y mitigaciones del grafo compartido.
+        mitre = [{**m, **graph.relations(m["technique"])} for m in mitre]
+    return mitre
+
 
-    classified: List[Dict[str, Any]] = []
+def stream(
+    detectors: Iterable[Dict[str, Any]],
+    concurrency: int = MCP_CONCURRENCY,
+    window: int = 32,
+    backend: Optional[str] = None,
+) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Clasifica detectores a medida que llegan y emite (detector, clasificación)
+    en el mismo orden. Los lookups MITRE de los próximos `window` detectores
+    corren en paralelo mientras se emiten los anteriores; cada técnica se
+    resuelve una sola vez por stream. Sin ordenar: el ranking es del consumidor.
+    """
+    lookups: Dict[str, Future] = {}
+    pending: Deque[Dict[str, Any]] = deque()
+    trace = current_trace()
+    budget = EnrichmentBudget()
+    graph: Optional[Future] = None
 
-    for d in detectors:
+    def _lookup(tid: str) -> Dict[str, str]:
+        entries, _ = enrich_techniques(
+            [tid], deadline=MCP_BATCH_DEADLINE, backend=backend, trace=trace, budget=budget
+        )
+        return entries[tid]
+
+    def _emit(d: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         category = d.get("category_hint", "UNKNOWN")
-        telemetry = d.get("telemetry_flags", {}) or {}
+        enriched = {tid: lookups[tid].result() for tid in MITRE_ID_MAP.get(category, [])}
+        return d, _classify(d, enriched, graph=graph.result() if graph is not None else None)
 
-        scoring = _score_from_category(category, telemetry)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="mitre-lookup") as pool:
+        if ATTACK_GRAPH_ENABLED:
+            # Sin saber de antemano qué categorías van a llegar: vecindario de todo MITRE_ID_MAP.
+            seeds = [tid for tids in MITRE_ID_MAP.values() for tid in tids]
+            graph = pool.submit(build_graph, seeds, backend=backend, trace=trace, budget=budget)
+        for d in detectors:
+            for tid in MITRE_ID_MAP.get(d.get("category_hint", "UNKNOWN"), []):
+                if tid not in lookups:
+                    lookups[tid] = pool.submit(_lookup, tid)
+            pending.append(d)
+            if len(pending) >= window:
+                yield _emit(pending.popleft())
 
-        mitre: List[Dict[str, str]] = []
-        for tid in MITRE_ID_MAP.get(category, []):
-            info = get_technique_by_id(tid)
+        while pending:
+            yield _emit(pending.popleft())
 
-            if not info:
-                mitre.append({"technique": tid, "name": "Unknown (MCP lookup failed)"})
-                continue
 
-            name = (
-                info.get("name")
-                or info.get("technique_name")
-                or info.get("title")
-                or "Unknown"
-            )
+def run(
+    session_id: str,
+    analyzer_out: Dict[str, Any],
+    concurrency: int = MCP_CONCURRENCY,
+    deadline: Optional[float] = MCP_BATCH_DEADLINE,
+    backend: Optional[str] = None,
+    budget: Optional[EnrichmentBudget] = None,
+) -> Dict[str, Any]:
+    """
+    Clasifica el DetectorBatch del Analyzer (o los dicts de un analyzer.json, que
+    se pasan a columnas). "classified_detectors" es un ClassifiedBatch sobre el
+    mismo batch: no copia los detectores y el mapeo MITRE se arma una vez por categoría.
+    """
+    detectors = analyzer_out.get("detectors")
+    if detectors is None:
+        detectors = (analyzer_out.get("payload") or {}).get("detectors", [])
+    detectors = as_detector_batch(detectors)
+
+    technique_ids = [
+        tid
+        for category in detectors.category_hint
+        for tid in MITRE_ID_MAP.get(category, [])
+    ]
+    budget = budget or EnrichmentBudget()
+    enriched, cache_counters = enrich_techniques(
+        technique_ids, concurrency=concurrency, deadline=deadline, backend=backend, budget=budget
+    )
 
-            mitre.append({"technique": tid, "name": name})
+    graph = (
+        build_graph(enriched, deadline=deadline, backend=backend, budget=budget)
+        if ATTACK_GRAPH_ENABLED else None
+    )
 
-        classified.append({
-            "name": d.get("name"),
-            "category": category,
-            "mitre": mitre,
-            **scoring,
-        })
+    mitre_backend = get_backend(backend)
+    scores = score_detectors(detectors)
 
-    # Orden por risk_score final
-    classified.sort(key=lambda x: x.get("risk_score", 0), reverse=True)
+    # Orden por risk_score final (descendente, estable)
+    classified = ClassifiedBatch(
+        detectors,
+        scores,
+        rank(scores.risk_score),
+        {c: _category_mitre(c, enriched, graph) for c in dict.fromkeys(detectors.category_hint)},
+    )
 
     return {
         "message": "classifier ok",
         "session_id_seen": session_id,
         "classified_detectors": classified,
+        "scoring_fingerprints": scoring_fingerprints(detectors.category_hint),
+        "mitre_lookup": {
+            "requested": len(technique_ids),
+            "unique": len(enriched),
+            "concurrency": concurrency,
+            "deadline_s": deadline,
+            **({"budget": budget.snapshot()} if mitre_backend.remote else {}),
+        },
+        "mitre_cache": {
+            **cache_counters,
+            "attack_version": get_cache().attack_version,
+        },
+        **({"attack_graph": graph.snapshot()} if graph is not None else {}),
+        "mitre_backend": backend or MITRE_BACKEND,
+        ("mcp" if mitre_backend.remote else "local_attack"): mitre_backend.stats_snapshot(),
     }
@@ -0,0 +1,392 @@
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from app.agents.catalog import PROJECT_ROOT
+
+logger = logging.getLogger(__name__)
+
+# Corpus: archivos, directorios (*.txt / *.md) o globs separados por os.pathsep.
+DBIR_CORPUS = os.getenv(
+    "DBIR_CORPUS",
+    os.pathsep.join([str(PROJECT_ROOT / "data" / "dbir_2025_subset.txt"), str(PROJECT_ROOT / "data" / "dbir")]),
+)
+DBIR_INDEX_DIR = os.getenv("DBIR_INDEX_DIR", str(PROJECT_ROOT / ".cache" / "dbir_index"))
+DBIR_TOP_K = int(os.getenv("DBIR_TOP_K", "2"))
+
+INDEX_FORMAT = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+CHUNK_MAX_WORDS = 120
+CHUNK_MIN_WORDS = 8
+SNIPPET_CHARS = 320
+# Versiones viejas del índice: se borran recién pasado este tiempo (otro proceso puede tenerlas abiertas).
+PRUNE_AFTER_S = 3600
+CURRENT_FILE = "CURRENT"
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be been by for from has have in into is it its of on or that the this to was were "
+    "with within which than then these those their there not no can may also more most such via per".split()
+)
+_UNIT_SPLIT = re.compile(r"\n\s*\n|\n(?=\s*(?:[-*•]|\d+[.)])\s)")
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def corpus_files(spec: str = DBIR_CORPUS) -> List[Path]:
+    files: List[Path] = []
+    for item in filter(None, spec.split(os.pathsep)):
+        p = Path(item)
+        if p.is_dir():
+            files.extend(sorted(f for f in p.iterdir() if f.is_file() and f.suffix.lower() in (".txt", ".md")))
+        elif p.is_file():
+            files.append(p)
+        else:
+            files.extend(Path(m) for m in sorted(glob.glob(item)) if Path(m).is_file())
+    return list(dict.fromkeys(f.resolve() for f in files))
+
+
+def chunk_text(text: str, max_words: int = CHUNK_MAX_WORDS, min_words: int = CHUNK_MIN_WORDS) -> List[str]:
+    """
+    Pasajes del corpus: un párrafo o bullet por chunk. Los muy cortos (títulos) se pegan
+    al siguiente; los largos se cortan en ventanas de `max_words` palabras.
+    """
+    chunks: List[str] = []
+    pending = ""
+    for unit in _UNIT_SPLIT.split(text):
+        unit = " ".join(unit.split())
+        if not unit:
+            continue
+        unit = f"{pending} {unit}".strip() if pending else unit
+        words = unit.split(" ")
+        if len(words) < min_words:
+            pending = unit
+            continue
+        pending = ""
+        for i in range(0, len(words), max_words):
+            chunks.append(" ".join(words[i:i + max_words]))
+    if pending:
+        chunks.append(pending)
+    return chunks
+
+
+def _sources_state(files: Sequence[Path]) -> List[Dict[str, Any]]:
+    out = []
+    for f in files:
+        st = f.stat()
+        out.append({"path": str(f), "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    return out
+
+
+def build_index(files: Sequence[Path], out_dir: Path = Path(DBIR_INDEX_DIR)) -> Dict[str, Any]:
+    """
+    Chunking + índice invertido BM25 precomputado, en arrays .npy (mmap) + text.bin:
+    - offsets[t]..offsets[t+1]: postings del término t en doc_ids / weights (peso BM25 final)
+    - chunk_offsets[d]..chunk_offsets[d+1]: bytes UTF-8 del pasaje d en text.bin
+
+    Cada build escribe una versión nueva en un directorio propio (<out_dir>/v-<pid>-<uuid>)
+    y la publica reemplazando <out_dir>/CURRENT con os.replace (atómico): builds
+    concurrentes no pisan sus archivos y nunca se borra la versión que otro proceso
+    tiene abierta por mmap (las viejas se limpian pasado PRUNE_AFTER_S).
+    """
+    start = time.perf_counter()
+    texts: List[bytes] = []
+    chunk_sources: List[int] = []
+    term_freqs: List[Counter] = []
+    digest = hashlib.sha256()
+
+    for src_idx, f in enumerate(files):
+        raw = f.read_bytes()
+        digest.update(raw)
+        for chunk in chunk_text(raw.decode("utf-8", errors="replace")):
+            texts.append(chunk.encode("utf-8"))
+            chunk_sources.append(src_idx)
+            term_freqs.append(Counter(tokenize(chunk)))
+
+    n_docs = len(texts)
+    lengths = np.array([sum(tf.values()) for tf in term_freqs], dtype=np.float64)
+    avgdl = float(lengths.mean()) if n_docs else 0.0
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for doc, tf in enumerate(term_freqs):
+        for term, count in tf.items():
+            postings.setdefault(term, []).append((doc, count))
+
+    vocab = sorted(postings)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    doc_ids: List[int] = []
+    weights: List[float] = []
+    for t, term in enumerate(vocab):
+        plist = postings[term]
+        idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+        for doc, count in plist:
+            norm = count + BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / avgdl)
+            doc_ids.append(doc)
+            weights.append(idf * count * (BM25_K1 + 1) / norm)
+        offsets[t + 1] = len(doc_ids)
+
+    chunk_offsets = np.zeros(n_docs + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in texts], out=chunk_offsets[1:])
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    version = f"v-{os.getpid()}-{uuid4().hex}"
+    tmp_dir = out_dir / f"{version}.tmp"
+    tmp_dir.mkdir()
+    np.save(tmp_dir / "offsets.npy", offsets)
+    np.save(tmp_dir / "doc_ids.npy", np.array(doc_ids, dtype=np.int32))
+    np.save(tmp_dir / "weights.npy", np.array(weights, dtype=np.float32))
+    np.save(tmp_dir / "chunk_offsets.npy", chunk_offsets)
+    np.save(tmp_dir / "chunk_sources.npy", np.array(chunk_sources, dtype=np.int32))
+    (tmp_dir / "text.bin").write_bytes(b"".join(texts))
+    (tmp_dir / "vocab.json").write_text(json.dumps({term: i for i, term in enumerate(vocab)}), encoding="utf-8")
+
+    meta = {
+        "format": INDEX_FORMAT,
+        "k1": BM25_K1,
+        "b": BM25_B,
+        "chunk_max_words": CHUNK_MAX_WORDS,
+        "documents": n_docs,
+        "terms": len(vocab),
+        "postings": len(doc_ids),
+        "avgdl": round(avgdl, 3),
+        "digest": digest.hexdigest(),
+        "sources": _sources_state(files),
+        "build_seconds": round(time.perf_counter() - start, 4),
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    tmp_dir.rename(out_dir / version)
+    pointer = out_dir / f"{CURRENT_FILE}.{version}.tmp"
+    pointer.write_text(version, encoding="utf-8")
+    os.replace(pointer, out_dir / CURRENT_FILE)
+    _prune_versions(out_dir, keep=version)
+    return meta
+
+
+def current_index_dir(out_dir: Path) -> Optional[Path]:
+    """Versión publicada en <out_dir>/CURRENT (o el layout plano anterior, sin versiones)."""
+    out_dir = Path(out_dir)
+    try:
+        version = (out_dir / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return out_dir if (out_dir / "meta.json").exists() else None
+    return out_dir / version if version else None
+
+
+def _prune_versions(out_dir: Path, keep: str) -> None:
+    cutoff = time.time() - PRUNE_AFTER_S
+    for entry in out_dir.iterdir():
+        if entry.name == keep or not entry.name.startswith("v-"):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry, ignore_errors=True)
+        except OSError:
+            pass
+
+
+@contextmanager
+def build_lock(out_dir: Path) -> Iterator[None]:
+    """Lock de archivo entre procesos: un solo build a la vez por DBIR_INDEX_DIR."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with (out_dir / "build.lock").open("a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class DbirIndex:
+    """Índice BM25 ya construido, abierto por mmap (solo se paginan los postings consultados)."""
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self.meta: Dict[str, Any] = json.loads((self.index_dir / "meta.json").read_text(encoding="utf-8"))
+        self.vocab: Dict[str, int] = json.loads((self.index_dir / "vocab.json").read_text(encoding="utf-8"))
+        self.offsets = np.load(self.index_dir / "offsets.npy", mmap_mode="r")
+        self.doc_ids = np.load(self.index_dir / "doc_ids.npy", mmap_mode="r")
+        self.weights = np.load(self.index_dir / "weights.npy", mmap_mode="r")
+        self.chunk_offsets = np.load(self.index_dir / "chunk_offsets.npy", mmap_mode="r")
+        self.chunk_sources = np.load(self.index_dir / "chunk_sources.npy", mmap_mode="r")
+        self.sources = [Path(s["path"]).name for s in self.meta["sources"]]
+        self.n_docs = int(self.meta["documents"])
+
+        self._text_file = (self.index_dir / "text.bin").open("rb")
+        size = os.fstat(self._text_file.fileno()).st_size
+        self._text = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @property
+    def digest(self) -> str:
+        return self.meta["digest"]
+
+    def passage(self, doc: int) -> str:
+        start, end = int(self.chunk_offsets[doc]), int(self.chunk_offsets[doc + 1])
+        return bytes(self._text[start:end]).decode("utf-8")
+
+    def search(self, query: str, k: int = DBIR_TOP_K) -> List[Dict[str, Any]]:
+        term_ids = [self.vocab[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocab]
+        if not term_ids or k <= 0:
+            return []
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for t in term_ids:
+            s, e = self.offsets[t], self.offsets[t + 1]
+            scores[self.doc_ids[s:e]] += self.weights[s:e]
+
+        if k < self.n_docs:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(self.n_docs)
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        hits = []
+        for doc in top:
+            score = float(scores[doc])
+            if score <= 0:
+                break
+            text = self.passage(int(doc))
+            hits.append({
+                "source": self.sources[int(self.chunk_sources[doc])],
+                "chunk": int(doc),
+                "score": round(score, 4),
+                "text": text if len(text) <= SNIPPET_CHARS else text[: SNIPPET_CHARS - 1].rstrip() + "…",
+            })
+        return hits
+
+    def is_stale(self, files: Sequence[Path]) -> bool:
+        try:
+            return self.meta.get("format") != INDEX_FORMAT or self.meta["sources"] != _sources_state(files)
+        except OSError:
+            return True
+
+    def close(self) -> None:
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._text_file.close()
+
+
+_index: Optional[DbirIndex] = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_dbir_index() -> Optional[DbirIndex]:
+    """
+    Índice del proceso, cargado en el primer uso. Si falta o el corpus cambió
+    (tamaño / mtime de las fuentes) se reconstruye; sin corpus devuelve None.
+    """
+    global _index, _index_loaded
+    with _index_lock:
+        if _index_loaded:
+            return _index
+
+        files = corpus_files()
+        index_dir = Path(DBIR_INDEX_DIR)
+        if not files:
+            logger.info("No DBIR corpus found (%s); rationales without DBIR passages", DBIR_CORPUS)
+        else:
+            try:
+                index = _open_fresh(index_dir, files)
+                if index is None:
+                    # Otro proceso (worker de --batch / jobs) puede estar construyendo: se
+                    # espera su build y se usa si quedó al día, sin construir dos veces.
+                    with build_lock(index_dir):
+                        index = _open_fresh(index_dir, files)
+                        if index is None:
+                            build_index(files, index_dir)
+                            index = DbirIndex(current_index_dir(index_dir))
+                _index = index
+            except Exception:
+                logger.warning("DBIR index unavailable", exc_info=True)
+        _index_loaded = True
+        return _index
+
+
+def _open_fresh(index_dir: Path, files: Sequence[Path]) -> Optional[DbirIndex]:
+    current = current_index_dir(index_dir)
+    if current is None:
+        return None
+    index = DbirIndex(current)
+    if index.is_stale(files):
+        index.close()
+        return None
+    return index
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Índice BM25 del corpus DBIR")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="Chunking + índice invertido en DBIR_INDEX_DIR")
+    p.add_argument("--corpus", default=DBIR_CORPUS, help="Archivos/directorios/globs separados por os.pathsep")
+    p.add_argument("--out", default=DBIR_INDEX_DIR)
+
+    p = sub.add_parser("search", help="Pasajes más relevantes para una consulta")
+    p.add_argument("query")
+    p.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        files = corpus_files(args.corpus)
+        if not files:
+            print(f"No corpus files in {args.corpus}", file=sys.stderr)
+            return 1
+        with build_lock(Path(args.out)):
+            meta = build_index(files, Path(args.out))
+        print(json.dumps({k: v for k, v in meta.items() if k != "sources"}, indent=2))
+        print(f"Index: {args.out} ({len(files)} files)")
+        return 0
+
+    index = get_dbir_index()
+    if index is None:
+        print("DBIR index unavailable", file=sys.stderr)
+        return 1
+    print(json.dumps(index.search(args.query, args.k), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
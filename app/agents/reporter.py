@@ -1,111 +1,494 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List
-from pathlib import Path
+import heapq
+import html
+import json
+import os
+from collections import deque
+from itertools import count
+from string import Formatter
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
+from app.logger import ArtifactSink, FileSink, RecordWriter
+from app.schemas import ClassifiedBatch, join_key, to_jsonable
 
-def _index_by_name(items: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    idx: Dict[str, Dict[str, Any]] = {}
-    for it in items:
-        name = it.get("name")
-        if name:
-            idx[name] = it
-    return idx
+# md: report.md (el de siempre); html / csv / json: para dashboards.
+REPORT_FORMATS: Tuple[str, ...] = ("md", "html", "csv", "json")
+REPORT_FILENAMES: Dict[str, str] = {fmt: f"report.{fmt}" for fmt in REPORT_FORMATS}
+REPORT_FORMATS_DEFAULT = os.getenv("REPORT_FORMATS", "md")
 
 
-def run(
-    session_id: str,
-    analyzer_out: Dict[str, Any],
-    classifier_out: Dict[str, Any],
-) -> Dict[str, Any]:
+def parse_formats(formats: Union[str, Sequence[str], None] = None) -> Tuple[str, ...]:
+    """"md,html" / ["md", "html"] -> ("md", "html"); None: REPORT_FORMATS_DEFAULT."""
+    if formats is None:
+        formats = REPORT_FORMATS_DEFAULT
+    if isinstance(formats, str):
+        formats = [f.strip() for f in formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in REPORT_FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown report formats {unknown} (use any of {REPORT_FORMATS})")
+    return tuple(dict.fromkeys(formats))
+
+
+class ReportTemplate:
+    """
+    Plantilla con campos `{nombre}`, parseada una sola vez al importar el módulo.
+    Cada valor pasa por el escape del formato (HTML, CSV; markdown va tal cual).
+    """
+
+    __slots__ = ("parts", "escape")
+
+    def __init__(self, text: str, escape: Callable[[Any], str] = str):
+        self.parts: Tuple[Tuple[str, Optional[str]], ...] = tuple(
+            (literal, field) for literal, field, _, _ in Formatter().parse(text)
+        )
+        self.escape = escape
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        esc = self.escape
+        return "".join([literal if field is None else literal + esc(values[field]) for literal, field in self.parts])
+
+
+def escape_html(value: Any) -> str:
+    return "" if value is None else html.escape(str(value))
+
+
+def escape_csv(value: Any) -> str:
+    text = "" if value is None else str(value)
+    if any(ch in text for ch in ',"\r\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+# Relaciones del grafo ATT&CK (app/agents/attack_graph.py) que se listan bajo cada técnica.
+_RELATION_LABELS = (
+    ("parent", "Parent"),
+    ("tactics", "Tactics"),
+    ("subtechniques", "Sub-techniques"),
+    ("mitigations", "Mitigations"),
+)
+
+
+def _fmt_related(rel: str, item: Dict[str, str]) -> str:
+    if rel == "tactics":
+        return item.get("name") or item.get("id", "")
+    return f"{item.get('id', '')} {item.get('name', '')}".strip()
+
+
+def _related_ids(mitre: Iterable[Mapping[str, Any]], rel: str) -> str:
+    return ";".join(dict.fromkeys(
+        (it.get("name") or it.get("id", "")) if rel == "tactics" else it.get("id", "")
+        for m in mitre for it in m.get(rel) or []
+    ))
+
+
+class TopK:
+    """
+    Buffer acotado con los k detectores de mayor risk_score (modo streaming).
+    A igual score se conserva el que llegó primero, como el sort estable del classifier.
+    """
 
-    project_root = Path(__file__).resolve().parents[2]
-    runs_dir = project_root / "runs" / session_id
-    runs_dir.mkdir(parents=True, exist_ok=True)
+    def __init__(self, k: int):
+        self.k = max(1, k)
+        self.seen = 0
+        self._heap: List[Tuple[int, int, Dict[str, Any], Dict[str, Any]]] = []
+        self._seq = count()
 
+    def push(self, detector: Dict[str, Any], classified: Dict[str, Any]) -> None:
+        self.seen += 1
+        item = (classified.get("risk_score", 0), -next(self._seq), detector, classified)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def ranked(self) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        return [(d, c) for _, _, d, c in sorted(self._heap, key=lambda it: it[:2], reverse=True)]
+
+
+def iter_rows(analyzer_out: Dict[str, Any], classifier_out: Dict[str, Any]) -> Iterator[Tuple[Any, Any]]:
+    """
+    (detector, clasificación) en el orden del Classifier. Sobre el ClassifiedBatch
+    del mismo DetectorBatch se empareja por posición; sobre JSON, por detector_id
+    (o nombre, en sesiones anteriores a los ids). Los repetidos se emparejan en
+    orden: ninguno se pierde.
+    """
     detectors = analyzer_out.get("detectors", [])
     classified = classifier_out.get("classified_detectors", [])
 
-    classified_by_name = _index_by_name(classified)
-    detectors_by_name = _index_by_name(detectors)
+    if isinstance(classified, ClassifiedBatch) and classified.detectors is detectors:
+        for c in classified:
+            yield detectors[c.detector], c
+        return
 
-    ordered_names = [c.get("name") for c in classified if c.get("name")]
-    ordered_detectors = [detectors_by_name[n] for n in ordered_names if n in detectors_by_name]
+    pending: Dict[Tuple[str, Any], Deque[Any]] = {}
+    for d in detectors:
+        pending.setdefault(join_key(d), deque()).append(d)
+    for c in classified:
+        queue = pending.get(join_key(c))
+        if queue:
+            yield queue.popleft(), c
 
-    report_path = runs_dir / "report.md"
 
-    with report_path.open("w", encoding="utf-8") as f:
-        f.write("# UEBA Detection Proposal\n\n")
-        f.write(f"**Session ID:** `{session_id}`\n\n")
+def _row_values(session_id: str, rank: int, d: Mapping[str, Any], c: Mapping[str, Any]) -> Dict[str, Any]:
+    """Campos de un detector, leídos una sola vez para todos los formatos."""
+    return {
+        "session_id": session_id,
+        "rank": rank,
+        "detector_id": d.get("detector_id"),
+        "name": d.get("name"),
+        "category": c.get("category"),
+        "risk_level": c.get("risk_level", "unknown"),
+        "risk_score": c.get("risk_score"),
+        "impact": c.get("impact"),
+        "likelihood": c.get("likelihood"),
+        "risk_rationale": c.get("risk_rationale"),
+        "mitre": c.get("mitre") or [],
+        "goal": d.get("goal"),
+        "data_needed": d.get("data_needed") or [],
+        "detection_logic": d.get("detection_logic"),
+        "expected_false_positives": d.get("expected_false_positives"),
+        "tuning_ideas": d.get("tuning_ideas"),
+        "rationale": d.get("rationale"),
+        "dbir_evidence": d.get("dbir_evidence") or [],
+    }
+
+
+class ReportFormat:
+    """Un formato de salida: begin() una vez, row() por detector (ya ordenados), end() al cierre."""
+
+    name = ""
+
+    def begin(self, session_id: str) -> str:
+        return ""
+
+    def row(self, v: Dict[str, Any]) -> str:
+        return ""
+
+    def end(self) -> str:
+        return ""
+
+
+class MarkdownFormat(ReportFormat):
+    """report.md. begin() no incluye el encabezado de la sesión: el cuerpo es memoizable."""
+
+    name = "md"
+
+    HEADER = ReportTemplate("# UEBA Detection Proposal\n\n**Session ID:** `{session_id}`\n\n")
+    INTRO = (
+        "## Summary\n\n"
+        "This report summarizes detection proposals (Analyzer) and their enrichment "
+        "(Classifier: MITRE mapping + risk scoring), aligned with DBIR 2025 themes.\n\n"
+        "> Detectors are ordered by classifier risk_score (descending).\n\n"
+        "## Proposed Detectors\n\n"
+    )
+    TITLE = ReportTemplate("### {rank}. {name}\n\n**Risk Level:** {risk_level}\n\n")
+    SCORE = ReportTemplate("**Risk Score:** {risk_score}")
+    FACTORS = ReportTemplate(" (Impact {impact}/5 × Likelihood {likelihood}/5)")
+    RISK_RATIONALE = ReportTemplate("**Risk Rationale:**\n{risk_rationale}\n\n")
+    TECHNIQUE = ReportTemplate("- {technique} — {name}\n")
+    RELATION = ReportTemplate("  - {label}: {items}\n")
+    GOAL = ReportTemplate("**Goal:** {goal}\n\n**Data Needed:**\n")
+    ITEM = ReportTemplate("- {item}\n")
+    DETAILS = ReportTemplate(
+        "\n**Detection Logic:**\n{detection_logic}\n\n"
+        "**Expected False Positives:**\n{expected_false_positives}\n\n"
+        "**Tuning Ideas:**\n{tuning_ideas}\n\n"
+        "**Rationale (Analyzer):**\n{rationale}\n\n"
+    )
+    EVIDENCE = ReportTemplate("- {text} _({source})_\n")
+
+    def begin(self, session_id: str) -> str:
+        return self.INTRO
+
+    def row(self, v: Dict[str, Any]) -> str:
+        out: List[str] = [self.TITLE.render(v)]
+        w = out.append
+
+        if v["risk_score"] is not None:
+            w(self.SCORE.render(v))
+            if v["impact"] is not None and v["likelihood"] is not None:
+                w(self.FACTORS.render(v))
+            w("\n\n")
+        if v["risk_rationale"]:
+            w(self.RISK_RATIONALE.render(v))
+
+        if v["mitre"]:
+            w("**MITRE ATT&CK Mapping:**\n")
+            for m in v["mitre"]:
+                tech, nm = m.get("technique", ""), m.get("name", "")
+                if tech or nm:
+                    w(self.TECHNIQUE.render({"technique": tech, "name": nm}))
+                for rel, label in _RELATION_LABELS:
+                    items = m.get(rel) or []
+                    if items:
+                        w(self.RELATION.render({"label": label, "items": ", ".join(_fmt_related(rel, it) for it in items)}))
+            w("\n")
+
+        w(self.GOAL.render(v))
+        for item in v["data_needed"]:
+            w(self.ITEM.render({"item": item}))
+        w(self.DETAILS.render(v))
+
+        if v["dbir_evidence"]:
+            w("**DBIR Evidence:**\n")
+            for ev in v["dbir_evidence"]:
+                w(self.EVIDENCE.render({"text": ev.get("text"), "source": ev.get("source")}))
+            w("\n")
+
+        w("---\n\n")
+        return "".join(out)
 
-        f.write("## Summary\n\n")
-        f.write(
-            "This report summarizes detection proposals (Analyzer) and their enrichment "
-            "(Classifier: MITRE mapping + risk scoring), aligned with DBIR 2025 themes.\n\n"
-        )
 
-        f.write("> Detectors are ordered by classifier risk_score (descending).\n\n")
+class HtmlFormat(ReportFormat):
+    name = "html"
 
-        f.write("## Proposed Detectors\n\n")
+    BEGIN = ReportTemplate(
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\">\n"
+        "<title>UEBA Detection Proposal - {session_id}</title>\n"
+        "<style>body{{font-family:sans-serif;max-width:960px;margin:2rem auto;line-height:1.45}}"
+        "table{{border-collapse:collapse}}th,td{{border:1px solid #ccc;padding:.25rem .5rem;text-align:left}}"
+        ".risk-High{{color:#b00020}}.risk-Medium{{color:#b26a00}}.risk-Low{{color:#2e7d32}}"
+        "pre{{white-space:pre-wrap}}</style>\n</head>\n<body>\n"
+        "<h1>UEBA Detection Proposal</h1>\n<p><strong>Session ID:</strong> <code>{session_id}</code></p>\n"
+        "<p>Detectors are ordered by classifier risk_score (descending).</p>\n",
+        escape_html,
+    )
+    SECTION = ReportTemplate(
+        "<section class=\"detector\" id=\"{detector_id}\">\n<h2>{rank}. {name}</h2>\n<table>\n"
+        "<tr><th>Risk Level</th><td class=\"risk-{risk_level}\">{risk_level}</td></tr>\n"
+        "<tr><th>Risk Score</th><td>{risk_score}</td></tr>\n"
+        "<tr><th>Impact × Likelihood</th><td>{impact}/5 × {likelihood}/5</td></tr>\n"
+        "<tr><th>Category</th><td>{category}</td></tr>\n</table>\n"
+        "<p><strong>Risk Rationale:</strong> {risk_rationale}</p>\n",
+        escape_html,
+    )
+    TECHNIQUE = ReportTemplate("<li><strong>{technique}</strong> — {name}", escape_html)
+    RELATION = ReportTemplate("<li>{label}: {items}</li>", escape_html)
+    ITEM = ReportTemplate("<li>{item}</li>\n", escape_html)
+    DETAILS = ReportTemplate(
+        "<h3>Goal</h3>\n<p>{goal}</p>\n"
+        "<h3>Detection Logic</h3>\n<pre>{detection_logic}</pre>\n"
+        "<h3>Expected False Positives</h3>\n<p>{expected_false_positives}</p>\n"
+        "<h3>Tuning Ideas</h3>\n<p>{tuning_ideas}</p>\n"
+        "<h3>Rationale (Analyzer)</h3>\n<p>{rationale}</p>\n",
+        escape_html,
+    )
+    EVIDENCE = ReportTemplate("<li>{text} <em>({source})</em></li>\n", escape_html)
 
-        for i, d in enumerate(ordered_detectors, 1):
-            name = d.get("name")
-            c = classified_by_name.get(name, {})
+    def begin(self, session_id: str) -> str:
+        return self.BEGIN.render({"session_id": session_id})
 
-            f.write(f"### {i}. {name}\n\n")
+    def row(self, v: Dict[str, Any]) -> str:
+        out: List[str] = [self.SECTION.render(v)]
+        w = out.append
 
-            # Risk from classifier
-            f.write(f"**Risk Level:** {c.get('risk_level', 'unknown')}\n\n")
+        if v["mitre"]:
+            w("<h3>MITRE ATT&amp;CK Mapping</h3>\n<ul>\n")
+            for m in v["mitre"]:
+                w(self.TECHNIQUE.render({"technique": m.get("technique", ""), "name": m.get("name", "")}))
+                related = [
+                    self.RELATION.render({"label": label, "items": ", ".join(_fmt_related(rel, it) for it in m[rel])})
+                    for rel, label in _RELATION_LABELS if m.get(rel)
+                ]
+                if related:
+                    w("<ul>" + "".join(related) + "</ul>")
+                w("</li>\n")
+            w("</ul>\n")
 
-            score = c.get("risk_score")
-            impact = c.get("impact")
-            likelihood = c.get("likelihood")
-            if score is not None:
-                line = f"**Risk Score:** {score}"
-                if impact is not None and likelihood is not None:
-                    line += f" (Impact {impact}/5 × Likelihood {likelihood}/5)"
-                f.write(line + "\n\n")
+        w("<h3>Data Needed</h3>\n<ul>\n")
+        for item in v["data_needed"]:
+            w(self.ITEM.render({"item": item}))
+        w("</ul>\n")
+        w(self.DETAILS.render(v))
 
-            rr = c.get("risk_rationale")
-            if rr:
-                f.write("**Risk Rationale:**\n")
-                f.write(f"{rr}\n\n")
+        if v["dbir_evidence"]:
+            w("<h3>DBIR Evidence</h3>\n<ul>\n")
+            for ev in v["dbir_evidence"]:
+                w(self.EVIDENCE.render({"text": ev.get("text"), "source": ev.get("source")}))
+            w("</ul>\n")
 
-            # MITRE from classifier
-            mitre = c.get("mitre", [])
-            if mitre:
-                f.write("**MITRE ATT&CK Mapping:**\n")
-                for m in mitre:
-                    tech = m.get("technique", "")
-                    nm = m.get("name", "")
-                    if tech or nm:
-                        f.write(f"- {tech} — {nm}\n")
-                f.write("\n")
+        w("</section>\n")
+        return "".join(out)
 
-            # Details from analyzer
-            f.write(f"**Goal:** {d.get('goal')}\n\n")
+    def end(self) -> str:
+        return "</body>\n</html>\n"
 
-            f.write("**Data Needed:**\n")
-            for item in d.get("data_needed", []):
-                f.write(f"- {item}\n")
-            f.write("\n")
 
-            f.write("**Detection Logic:**\n")
-            f.write(f"{d.get('detection_logic')}\n\n")
+class CsvFormat(ReportFormat):
+    """Una fila por detector (RFC 4180); técnicas, tácticas y mitigaciones separadas por ';'."""
 
-            f.write("**Expected False Positives:**\n")
-            f.write(f"{d.get('expected_false_positives')}\n\n")
+    name = "csv"
 
-            f.write("**Tuning Ideas:**\n")
-            f.write(f"{d.get('tuning_ideas')}\n\n")
+    COLUMNS = (
+        "session_id", "rank", "detector_id", "name", "category", "risk_level", "risk_score",
+        "impact", "likelihood", "techniques", "tactics", "mitigations",
+    )
+    ROW = ReportTemplate(",".join("{%s}" % c for c in COLUMNS) + "\r\n", escape_csv)
 
-            f.write("**Rationale (Analyzer):**\n")
-            f.write(f"{d.get('rationale')}\n\n")
+    def begin(self, session_id: str) -> str:
+        return ",".join(self.COLUMNS) + "\r\n"
 
-            f.write("---\n\n")
+    def row(self, v: Dict[str, Any]) -> str:
+        mitre = v["mitre"]
+        return self.ROW.render({
+            **v,
+            "techniques": ";".join(dict.fromkeys(m.get("technique", "") for m in mitre)),
+            "tactics": _related_ids(mitre, "tactics"),
+            "mitigations": _related_ids(mitre, "mitigations"),
+        })
+
+
+class JsonFormat(ReportFormat):
+    """{"session_id", "detectors": [...]} escrito de a un detector."""
+
+    name = "json"
+
+    def begin(self, session_id: str) -> str:
+        return '{"session_id":' + json.dumps(session_id) + ',"detectors":['
+
+    def row(self, v: Dict[str, Any]) -> str:
+        record = {k: val for k, val in v.items() if k != "session_id"}
+        text = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=to_jsonable)
+        return text if v["rank"] == 1 else "," + text
+
+    def end(self) -> str:
+        return "]}\n"
+
+
+FORMAT_RENDERERS: Dict[str, ReportFormat] = {
+    f.name: f for f in (MarkdownFormat(), HtmlFormat(), CsvFormat(), JsonFormat())
+}
+
+
+def _render(
+    session_id: str,
+    analyzer_out: Dict[str, Any],
+    classifier_out: Dict[str, Any],
+    formats: Sequence[str],
+) -> Iterator[Tuple[str, str]]:
+    """Una sola pasada por los detectores para todos los formatos: (formato, fragmento) en orden."""
+    renderers = [FORMAT_RENDERERS[fmt] for fmt in formats]
+    for r in renderers:
+        yield r.name, r.begin(session_id)
+    for rank, (d, c) in enumerate(iter_rows(analyzer_out, classifier_out), 1):
+        values = _row_values(session_id, rank, d, c)
+        for r in renderers:
+            yield r.name, r.row(values)
+    for r in renderers:
+        yield r.name, r.end()
+
+
+def render_report(
+    session_id: str,
+    analyzer_out: Dict[str, Any],
+    classifier_out: Dict[str, Any],
+) -> str:
+    return render_header(session_id) + render_body(analyzer_out, classifier_out)
+
+
+def render_header(session_id: str) -> str:
+    return MarkdownFormat.HEADER.render({"session_id": session_id})
+
+
+def render_body(analyzer_out: Dict[str, Any], classifier_out: Dict[str, Any]) -> str:
+    """Todo el report salvo el encabezado: no depende de la sesión (memoizable)."""
+    return "".join(chunk for _, chunk in _render("", analyzer_out, classifier_out, ("md",)))
+
+
+def render_documents(
+    session_id: str,
+    analyzer_out: Dict[str, Any],
+    classifier_out: Dict[str, Any],
+    formats: Union[str, Sequence[str], None] = None,
+) -> Dict[str, str]:
+    """Todos los formatos pedidos en memoria, {formato: texto} (report.md con su encabezado)."""
+    formats = parse_formats(formats)
+    parts: Dict[str, List[str]] = {fmt: [] for fmt in formats}
+    if "md" in parts:
+        parts["md"].append(render_header(session_id))
+    for fmt, chunk in _render(session_id, analyzer_out, classifier_out, formats):
+        parts[fmt].append(chunk)
+    return {fmt: "".join(chunks) for fmt, chunks in parts.items()}
+
+
+def render_reports(
+    session_id: str,
+    analyzer_out: Dict[str, Any],
+    classifier_out: Dict[str, Any],
+    formats: Union[str, Sequence[str], None] = None,
+    sink: Optional[ArtifactSink] = None,
+    body: Optional[str] = None,
+) -> Tuple[str, Dict[str, Optional[str]]]:
+    """
+    Renderiza todos los `formats` en una sola pasada y los escribe en streaming al
+    sink (runs/<session_id>/report.<fmt>). El markdown siempre se arma en memoria
+    (va en la salida del agente); con `body` (desde la cache de etapas) no se
+    vuelve a renderizar. Devuelve (markdown, {formato: ruta}).
+    """
+    formats = parse_formats(formats)
+    sink = sink or FileSink()
+    streams: Dict[str, RecordWriter] = {fmt: sink.open_stream(session_id, REPORT_FILENAMES[fmt]) for fmt in formats}
+    rendered = [fmt for fmt in formats if fmt != "md"]
+    if body is None:
+        rendered.insert(0, "md")
+
+    markdown: List[str] = [render_header(session_id)]
+    try:
+        for fmt, chunk in _render(session_id, analyzer_out, classifier_out, rendered):
+            if fmt == "md":
+                markdown.append(chunk)
+            elif chunk:
+                streams[fmt].write_encoded(chunk.encode("utf-8"))
+        if body is not None:
+            markdown.append(body)
+        report = "".join(markdown)
+        if "md" in streams:
+            streams["md"].write_encoded(report.encode("utf-8"))
+    finally:
+        for stream in streams.values():
+            stream.close()
+
+    return report, {fmt: str(s.path) if s.path else None for fmt, s in streams.items()}
+
+
+def run(
+    session_id: str,
+    analyzer_out: Dict[str, Any],
+    classifier_out: Dict[str, Any],
+    sink: Optional[ArtifactSink] = None,
+    body: Optional[str] = None,
+    formats: Union[str, Sequence[str], None] = None,
+) -> Dict[str, Any]:
+    """
+    Genera los reports de la sesión en los `formats` pedidos (default REPORT_FORMATS:
+    report.md) y los entrega al sink (por defecto runs/<session_id>/). El markdown
+    queda también en la salida bajo "report". Con `body` (ya renderizado, p. ej.
+    desde la cache de etapas) solo se agrega el encabezado de la sesión.
+    """
+    report, paths = render_reports(session_id, analyzer_out, classifier_out, formats, sink=sink, body=body)
 
     return {
         "message": "report generated",
-        "report_path": str(report_path),
+        "report_path": paths.get("md"),
+        "report_paths": paths,
         "session_id_seen": session_id,
+        "report": report,
     }
+
+
+def run_top_k(
+    session_id: str,
+    top: TopK,
+    sink: Optional[ArtifactSink] = None,
+    formats: Union[str, Sequence[str], None] = None,
+) -> Dict[str, Any]:
+    """Reports del modo streaming: solo los k mejores, ya ordenados."""
+    ranked = top.ranked()
+    return run(
+        session_id,
+        {"detectors": [d for d, _ in ranked]},
+        {"classified_detectors": [c for _, c in ranked]},
+        sink=sink,
+        formats=formats,
+    )
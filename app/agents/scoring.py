@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.agents.catalog import PROJECT_ROOT, TELEMETRY_BITS, telemetry_mask
+
+SCORING_MODEL_PATH = os.getenv("SCORING_MODEL_PATH", str(PROJECT_ROOT / "data" / "scoring_model.json"))
+
+MaskLike = Union[int, Sequence[int], np.ndarray]
+
+
+@dataclass
+class ScoreBatch:
+    """
+    Scores for a batch of (category, telemetry mask) pairs. Every array has the
+    broadcast shape of the inputs: (n,) for a detector list, (tenants, detectors)
+    for score_matrix().
+    """
+
+    model: "ScoringModel"
+    category_idx: np.ndarray
+    impact: np.ndarray
+    likelihood: np.ndarray
+    bonus: np.ndarray
+    risk_score: np.ndarray
+    level_idx: np.ndarray
+
+    @property
+    def risk_level(self) -> np.ndarray:
+        return self.model.level_names[self.level_idx]
+
+    def record(self, i: Union[int, Tuple[int, ...]]) -> Dict[str, Any]:
+        """Same dict as classifier._score_from_category, for one element of the batch."""
+        return {
+            "impact": int(self.impact[i]),
+            "likelihood": int(self.likelihood[i]),
+            "risk_score": int(self.risk_score[i]),
+            "risk_level": str(self.model.level_names[self.level_idx[i]]),
+            "risk_rationale": self.model.rationales[int(self.category_idx[i])],
+        }
+
+    def records(self) -> List[Dict[str, Any]]:
+        return [self.record(i) for i in range(self.risk_score.shape[0])]
+
+
+class ScoringModel:
+    """
+    Table-driven risk model loaded from data/scoring_model.json.
+
+    Per category: impact, base likelihood and telemetry bonuses ({"any_of": [...flags],
+    "bonus": n}; every matching rule adds up, likelihood capped at max_likelihood).
+    risk_score = impact * likelihood * score_multiplier; the level is the last entry of
+    `levels` whose min_score is <= risk_score. Unknown categories use "default".
+
+    Everything is compiled into arrays indexed by category (the last row is the
+    default), so a whole batch is scored with a handful of NumPy operations.
+    """
+
+    def __init__(self, raw: Mapping[str, Any]):
+        self.version = int(raw.get("version", 1))
+        self.name = str(raw.get("name", "default"))
+        self.score_multiplier = int(raw.get("score_multiplier", 10))
+        self.max_likelihood = int(raw.get("max_likelihood", 5))
+
+        levels = sorted(raw["levels"], key=lambda lv: lv["min_score"])
+        self.level_names = np.array([lv["level"] for lv in levels], dtype=object)
+        self.level_min_scores = np.array([lv["min_score"] for lv in levels], dtype=np.int64)
+
+        categories: Dict[str, Dict[str, Any]] = dict(raw.get("categories", {}))
+        default = raw.get("default", {"impact": 3, "likelihood": 3, "rationale": ""})
+        rows = list(categories.values()) + [default]
+
+        self.categories: Tuple[str, ...] = tuple(categories)
+        self.category_index: Dict[str, int] = {c: i for i, c in enumerate(self.categories)}
+        self.default_idx = len(self.categories)
+        self.rationales: Tuple[str, ...] = tuple(r.get("rationale", "") for r in rows)
+
+        self.impact = np.array([int(r["impact"]) for r in rows], dtype=np.int64)
+        self.likelihood = np.array([int(r["likelihood"]) for r in rows], dtype=np.int64)
+
+        n_rules = max((len(r.get("bonuses", [])) for r in rows), default=0) or 1
+        self.rule_mask = np.zeros((len(rows), n_rules), dtype=np.int64)
+        self.rule_bonus = np.zeros((len(rows), n_rules), dtype=np.int64)
+        for i, r in enumerate(rows):
+            for j, rule in enumerate(r.get("bonuses", [])):
+                unknown = [f for f in rule["any_of"] if f not in TELEMETRY_BITS]
+                if unknown:
+                    raise ValueError(f"Scoring rule for row {i} uses unknown telemetry: {unknown}")
+                self.rule_mask[i, j] = telemetry_mask({f: True for f in rule["any_of"]})
+                self.rule_bonus[i, j] = int(rule["bonus"])
+
+        # Same tables as plain Python values, for single-detector scoring.
+        self._rows: Tuple[Tuple[int, int, Tuple[Tuple[int, int], ...]], ...] = tuple(
+            (int(self.impact[i]), int(self.likelihood[i]),
+             tuple((int(m), int(b)) for m, b in zip(self.rule_mask[i], self.rule_bonus[i]) if m))
+            for i in range(len(rows))
+        )
+        self._min_scores: List[int] = [int(v) for v in self.level_min_scores]
+        self._level_names: List[str] = [str(v) for v in self.level_names]
+
+        # Fingerprint per row: the row itself plus everything shared (levels, multiplier, cap).
+        shared = [self.score_multiplier, self.max_likelihood, list(zip(self._level_names, self._min_scores))]
+        self._fingerprints: Tuple[str, ...] = tuple(
+            hashlib.blake2b(
+                json.dumps([shared, r], sort_keys=True, ensure_ascii=False).encode("utf-8"), digest_size=8
+            ).hexdigest()
+            for r in rows
+        )
+
+    @classmethod
+    def from_file(cls, path: str = SCORING_MODEL_PATH) -> "ScoringModel":
+        p = Path(path)
+        if not p.exists():
+            raise FileNotFoundError(f"Missing file: {p}")
+        with p.open("r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    # --- batch scoring ---
+
+    def category_indices(self, categories: Sequence[str]) -> np.ndarray:
+        get = self.category_index.get
+        default = self.default_idx
+        return np.fromiter((get(c, default) for c in categories), dtype=np.intp, count=len(categories))
+
+    def score_indices(self, category_idx: np.ndarray, masks: MaskLike) -> ScoreBatch:
+        idx, mask = np.broadcast_arrays(np.asarray(category_idx, dtype=np.intp), np.asarray(masks, dtype=np.int64))
+
+        hits = (self.rule_mask[idx] & mask[..., None]) != 0
+        bonus = (hits * self.rule_bonus[idx]).sum(axis=-1)
+        likelihood = np.minimum(self.likelihood[idx] + bonus, self.max_likelihood)
+        impact = self.impact[idx]
+        score = impact * likelihood * self.score_multiplier
+        level_idx = np.maximum(np.searchsorted(self.level_min_scores, score, side="right") - 1, 0)
+
+        return ScoreBatch(
+            model=self,
+            category_idx=idx,
+            impact=impact,
+            likelihood=likelihood,
+            bonus=bonus,
+            risk_score=score,
+            level_idx=level_idx,
+        )
+
+    def score_batch(self, categories: Sequence[str], masks: MaskLike) -> ScoreBatch:
+        """One score per detector: categories[i] scored with masks[i] (or a single shared mask)."""
+        return self.score_indices(self.category_indices(categories), masks)
+
+    def score_matrix(self, categories: Sequence[str], tenant_masks: Sequence[int]) -> ScoreBatch:
+        """Every detector category against every tenant: arrays of shape (tenants, detectors)."""
+        idx = self.category_indices(categories)
+        masks = np.asarray(tenant_masks, dtype=np.int64)[:, None]
+        return self.score_indices(idx[None, :], masks)
+
+    # --- single values ---
+
+    def score(self, category: str, telemetry: Dict[str, bool]) -> Dict[str, Any]:
+        # Plain Python for one detector: a size-1 NumPy batch costs more than the math.
+        i = self.category_index.get(category, self.default_idx)
+        mask = telemetry_mask(telemetry)
+        impact, likelihood, rules = self._rows[i]
+        likelihood = min(likelihood + sum(b for m, b in rules if m & mask), self.max_likelihood)
+        risk_score = impact * likelihood * self.score_multiplier
+        return {
+            "impact": impact,
+            "likelihood": likelihood,
+            "risk_score": risk_score,
+            "risk_level": self.level_for(risk_score),
+            "risk_rationale": self.rationales[i],
+        }
+
+    def fingerprint(self, category: str) -> str:
+        """Changes only when something that can move this category's score or level changes."""
+        return self._fingerprints[self.category_index.get(category, self.default_idx)]
+
+    def level_for(self, score: int) -> str:
+        i = bisect_right(self._min_scores, score) - 1
+        return self._level_names[max(i, 0)]
+
+
+def rank(scores: np.ndarray) -> np.ndarray:
+    """Indices by descending score; ties keep input order (same as a stable sort)."""
+    return np.argsort(-np.asarray(scores), kind="stable")
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    First k indices of rank(scores) without sorting the whole array: a partition finds
+    the k-th score, then only the candidates at or above it are sorted.
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[0]
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return rank(scores)
+
+    kth = np.partition(scores, n - k)[n - k]
+    candidates = np.flatnonzero(scores >= kth)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Per-row top_k for a (tenants, detectors) matrix: shape (tenants, min(k, detectors))."""
+    return np.argsort(-np.asarray(scores), axis=1, kind="stable")[:, :k]
+
+
+_MODELS: Dict[str, Tuple[int, ScoringModel]] = {}
+
+
+def load_scoring_model(path: Optional[str] = None) -> ScoringModel:
+    """Model parsed once per process (reloaded if the file changes)."""
+    path = path or SCORING_MODEL_PATH
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = -1
+    cached = _MODELS.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    model = ScoringModel.from_file(path)
+    _MODELS[path] = (mtime, model)
+    return model
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Keyword dictionary for telemetry inference (flag -> substrings, case-insensitive).
+# Flags must match app.agents.catalog.TELEMETRY_FLAGS; add keywords here, not in code.
+TELEMETRY_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "idp": ("idp", "sign-in", "sso", "azure ad", "okta"),
+    "edr": ("edr", "endpoint", "process telemetry"),
+    "cloud": ("cloud audit", "cloudtrail", "azure activity", "gcp audit"),
+    "dns": ("dns",),
+    "proxy": ("proxy",),
+    "db": ("db audit", "database", "db logs"),
+}
+
+MAX_POSITIONS = 100
+CHUNK_CHARS = 1 << 20
+
+
+@dataclass
+class FlagHits:
+    count: int = 0
+    positions: List[int] = field(default_factory=list)
+    keywords: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class TelemetryScan:
+    chars: int
+    hits: Dict[str, FlagHits]
+
+    @property
+    def flags(self) -> Dict[str, bool]:
+        return {flag: h.count > 0 for flag, h in self.hits.items()}
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Alternation factored as a trie (shared prefixes are matched once), longest branch
+    first so each position reports the longest keyword that starts there.
+    """
+    trie: Dict[str, dict] = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: Dict[str, dict]) -> str:
+        terminal = "" in node
+        branches = sorted((ch for ch in node if ch), key=lambda ch: -_depth(node[ch]))
+        alts = [re.escape(ch) + emit(node[ch]) for ch in branches]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if terminal else body
+
+    return emit(trie)
+
+
+def _depth(node: Dict[str, dict]) -> int:
+    return 1 + max((_depth(child) for ch, child in node.items() if ch), default=0)
+
+
+class KeywordMatcher:
+    """
+    Multi-pattern matcher compiled once from a {flag: keywords} dictionary.
+
+    All keywords go into a single trie-shaped regex, so the text is scanned in one
+    left-to-right pass by the regex engine (in C), Aho-Corasick style. Each search
+    resumes one char after the previous match start, so every keyword occurrence is
+    found even when occurrences overlap ("idproxy" hits both idp and proxy): same
+    flags as a substring check per keyword. At each position the regex reports the
+    longest keyword; the shorter keywords that are prefixes of it (also starting
+    there) are counted from a precomputed table. A flag counts each start once.
+    Input can be streamed in chunks: match starts in the last (longest keyword - 1)
+    chars are deferred to the next chunk, so matches spanning a chunk boundary are
+    found exactly once.
+    """
+
+    def __init__(self, keywords: Dict[str, Tuple[str, ...]] = TELEMETRY_KEYWORDS, max_positions: int = MAX_POSITIONS):
+        self.keywords = {flag: tuple(k.lower() for k in kws) for flag, kws in keywords.items()}
+        self.max_positions = max_positions
+        self.flag_of: Dict[str, str] = {}
+        for flag, kws in self.keywords.items():
+            for k in kws:
+                self.flag_of.setdefault(k, flag)
+        self.max_len = max((len(k) for k in self.flag_of), default=1)
+        # Keywords that also start wherever `keyword` matches: itself and its prefixes.
+        self._starting: Dict[str, Tuple[str, ...]] = {
+            k: tuple(p for p in self.flag_of if k.startswith(p)) for k in self.flag_of
+        }
+        self._regex = re.compile(_trie_pattern(self.flag_of))
+
+    def scan(self, text: str) -> TelemetryScan:
+        return self.scan_chunks([text])
+
+    def scan_file(self, path: Path, chunk_chars: int = CHUNK_CHARS) -> TelemetryScan:
+        def chunks() -> Iterable[str]:
+            with Path(path).open("r", encoding="utf-8", errors="replace") as f:
+                while True:
+                    chunk = f.read(chunk_chars)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return self.scan_chunks(chunks())
+
+    def scan_chunks(self, chunks: Iterable[str]) -> TelemetryScan:
+        hits = {flag: FlagHits() for flag in self.keywords}
+        keep = self.max_len - 1
+        carry = ""
+        offset = 0  # absolute position of carry[0]
+
+        for chunk in chunks:
+            window = carry + chunk.lower()
+            # Starts in the last `keep` chars may belong to a keyword that continues in
+            # the next chunk: leave them for the next window.
+            limit = len(window) - keep
+            if limit <= 0:
+                carry = window
+                continue
+            self._collect(window, offset, limit, hits)
+            offset += limit
+            carry = window[limit:]
+
+        self._collect(carry, offset, len(carry), hits)
+        return TelemetryScan(chars=offset + len(carry), hits=hits)
+
+    def _collect(self, window: str, offset: int, limit: int, hits: Dict[str, FlagHits]) -> None:
+        """Counts keyword occurrences starting before `limit` (they may end past it)."""
+        search = self._regex.search
+        m = search(window)
+        while m is not None:
+            start = m.start()
+            if start >= limit:
+                break
+            seen = None
+            for keyword in self._starting[m.group()]:
+                flag = self.flag_of[keyword]
+                h = hits[flag]
+                h.keywords[keyword] = h.keywords.get(keyword, 0) + 1
+                if flag == seen:
+                    continue
+                seen = flag
+                h.count += 1
+                if len(h.positions) < self.max_positions:
+                    h.positions.append(offset + start)
+            m = search(window, start + 1)
+
+
+_default_matcher: Optional[KeywordMatcher] = None
+
+
+def default_matcher() -> KeywordMatcher:
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = KeywordMatcher()
+    return _default_matcher
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from app.logger import ensure_session_dir, utc_now_iso, write_json
+from app.metrics import MetricsRegistry
+
+BATCH_TEXT_KEYS = ("text", "input", "body")
+BATCH_ID_KEYS = ("id", "input_id", "request_id")
+
+
+def iter_batch_inputs(source: str) -> Iterator[Dict[str, Any]]:
+    """
+    Jobs de un batch:
+    - directorio: un job por archivo *.txt / *.md (orden alfabético); el worker lee el archivo
+    - .jsonl: un job por línea, texto en "text" / "input" / "body" e ID opcional en "id" / "request_id"
+    """
+    src = Path(source)
+    if src.is_dir():
+        for p in sorted(src.iterdir()):
+            if p.is_file() and p.suffix.lower() in (".txt", ".md"):
+                yield {"id": p.name, "path": str(p)}
+        return
+
+    with src.open("r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"id": f"line-{lineno}", "error": f"invalid JSON: {e}"}
+                continue
+
+            text = next((obj[k] for k in BATCH_TEXT_KEYS if isinstance(obj.get(k), str)), None)
+            input_id = next((str(obj[k]) for k in BATCH_ID_KEYS if obj.get(k) is not None), f"line-{lineno}")
+            if text is None:
+                yield {"id": input_id, "error": f"no text field ({', '.join(BATCH_TEXT_KEYS)})"}
+            else:
+                yield {"id": input_id, "text": text}
+
+
+def _init_worker() -> None:
+    # Cada worker calienta una vez la cache de técnicas; el cliente MCP (pool de
+    # sesiones) se crea con el primer lookup y se reutiliza en los jobs siguientes.
+    from app.mcp.technique_cache import get_cache
+
+    get_cache()
+
+
+def _run_job(job: Dict[str, Any], backend: Optional[str], artifacts: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    from app.logger import make_sink
+    from app.pipeline import run_pipeline
+
+    start = time.perf_counter()
+    sink = make_sink(**(artifacts or {}))
+    try:
+        if "error" in job:
+            raise ValueError(job["error"])
+        text = job["text"] if "text" in job else Path(job["path"]).read_text(encoding="utf-8")
+        result = run_pipeline(text, backend=backend, sink=sink)
+        return {
+            "id": job["id"],
+            "ok": True,
+            "session_id": result.session_id,
+            "seconds": round(time.perf_counter() - start, 4),
+            "metrics": result.metrics,
+        }
+    except Exception as e:
+        return {
+            "id": job["id"],
+            "ok": False,
+            "error": repr(e),
+            "traceback": traceback.format_exc(limit=5),
+            "seconds": round(time.perf_counter() - start, 4),
+        }
+    finally:
+        # Los workers terminan sin atexit: el job no termina hasta que sus artefactos están en disco.
+        sink.close()
+
+
+def run_batch(
+    source: str,
+    workers: Optional[int] = None,
+    backend: Optional[str] = None,
+    artifacts: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Corre el pipeline para todos los inputs de `source` en un pool de procesos.
+    Una falla en un input queda registrada en el resumen y no corta el batch.
+    `artifacts` son los argumentos de make_sink() para cada worker (default: entorno).
+    Los traces de cada sesión vuelven al proceso padre y se agregan en
+    runs/batch_<id>/metrics.json y metrics.prom (formato de texto de Prometheus).
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    batch_id = uuid4().hex
+    started_at = utc_now_iso()
+    start = time.perf_counter()
+
+    done: List[Tuple[int, Dict[str, Any]]] = []
+    registry = MetricsRegistry()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(_run_job, job, backend, artifacts): (pos, job["id"])
+            for pos, job in enumerate(iter_batch_inputs(source))
+        }
+        for fut in as_completed(futures):
+            pos, input_id = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                # El worker murió (BrokenProcessPool, etc.): se registra y se sigue.
+                result = {"id": input_id, "ok": False, "error": repr(e)}
+            registry.record_trace(result.pop("metrics", None) or {})
+            done.append((pos, result))
+    # Orden de los inputs; los IDs pueden repetirse en un .jsonl.
+    results = [r for _, r in sorted(done, key=lambda item: item[0])]
+
+    wall = time.perf_counter() - start
+    failures = [r for r in results if not r["ok"]]
+    summary = {
+        "batch_id": batch_id,
+        "source": str(source),
+        "started_at_utc": started_at,
+        "workers": workers,
+        "backend": backend,
+        "total": len(results),
+        "ok": len(results) - len(failures),
+        "failed": len(failures),
+        "wall_seconds": round(wall, 3),
+        "throughput_per_s": round(len(results) / wall, 3) if wall > 0 else None,
+        "failures": failures,
+        "sessions": [{"id": r["id"], "session_id": r["session_id"]} for r in results if r["ok"]],
+    }
+
+    out_dir = ensure_session_dir(f"batch_{batch_id}")
+    if registry.counters:
+        write_json(out_dir / "metrics.json", registry.snapshot())
+        (out_dir / "metrics.prom").write_text(registry.render_prometheus(), encoding="utf-8")
+        summary["metrics_path"] = str(out_dir / "metrics.prom")
+
+    out_path = out_dir / "summary.json"
+    write_json(out_path, summary)
+    summary["summary_path"] = str(out_path)
+    return summary
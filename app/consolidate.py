@@ -0,0 +1,434 @@
+"""
+Reporte consolidado de la flota: agrega todas las sesiones guardadas en runs/
+(directorios y .zip) en un único reporte, sin cargarlas todas a la vez.
+
+Cada tarea del pool lee solo el classifier.json de un lote de sesiones y devuelve
+un FleetAggregate parcial (acumuladores de tamaño acotado: por nivel, categoría,
+detector, técnica y un top-N de sesiones) más las filas de sessions.csv de ese
+lote. El padre fusiona los parciales a medida que llegan, escribe las filas en
+streaming y mantiene a lo sumo 2 x workers lotes en vuelo: la memoria no crece
+con la cantidad de sesiones.
+
+    python -m app.consolidate [--runs-dir runs] [--formats md,html,csv,json] [--workers N]
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+from uuid import uuid4
+
+from app.agents.reporter import ReportTemplate, escape_csv, escape_html, parse_formats
+from app.logger import RUNS_DIR, ArtifactSink, FileSink, utc_now_iso
+from app.rescore import iter_chunks, iter_sessions, read_session_members
+from app.schemas import join_key
+
+CONSOLIDATE_CHUNK_SIZE = int(os.getenv("CONSOLIDATE_CHUNK_SIZE", "512"))
+CONSOLIDATE_TOP = int(os.getenv("CONSOLIDATE_TOP", "20"))
+
+SESSION_COLUMNS = (
+    "session_id", "timestamp_utc", "detectors", "high_detectors",
+    "top_detector_id", "top_name", "top_category", "top_risk_score", "top_risk_level",
+)
+_SESSION_ROW = ReportTemplate(",".join("{%s}" % c for c in SESSION_COLUMNS) + "\r\n", escape_csv)
+
+
+class _DetectorStats:
+    __slots__ = ("detector_id", "name", "category", "occurrences", "score_sum", "max_score", "ranked_first", "levels")
+
+    def __init__(self, detector_id: Optional[str], name: str, category: str):
+        self.detector_id = detector_id
+        self.name = name
+        self.category = category
+        self.occurrences = 0
+        self.score_sum = 0
+        self.max_score = 0
+        self.ranked_first = 0
+        self.levels: Counter = Counter()
+
+    def merge(self, other: "_DetectorStats") -> None:
+        self.occurrences += other.occurrences
+        self.score_sum += other.score_sum
+        self.max_score = max(self.max_score, other.max_score)
+        self.ranked_first += other.ranked_first
+        self.levels.update(other.levels)
+
+
+class FleetAggregate:
+    """
+    Acumuladores del reporte consolidado. El tamaño depende del catálogo y de
+    ATT&CK (detectores, categorías, técnicas) y de `top`, no de la cantidad de
+    sesiones. Los detectores se agrupan por detector_id (join_key); las sesiones
+    viejas sin id caen por nombre. Dos agregados se fusionan con merge().
+    """
+
+    def __init__(self, top: int = CONSOLIDATE_TOP):
+        self.top = top
+        self.sessions = 0
+        self.detectors = 0
+        self.first_seen: Optional[str] = None
+        self.last_seen: Optional[str] = None
+        self.levels: Counter = Counter()
+        self.categories: Dict[str, List[int]] = {}  # categoría -> [detectores, suma de score, máximo]
+        self.by_detector: Dict[Tuple[str, Any], _DetectorStats] = {}
+        self.techniques: Counter = Counter()
+        self.technique_names: Dict[str, str] = {}
+        self.top_sessions: List[Tuple[int, str, str]] = []  # heap de (score del primero, session_id, detector)
+
+    def _seen(self, ts: Optional[str]) -> None:
+        if not ts:
+            return
+        if self.first_seen is None or ts < self.first_seen:
+            self.first_seen = ts
+        if self.last_seen is None or ts > self.last_seen:
+            self.last_seen = ts
+
+    def _push_session(self, item: Tuple[int, str, str]) -> None:
+        if len(self.top_sessions) < self.top:
+            heapq.heappush(self.top_sessions, item)
+        elif item > self.top_sessions[0]:
+            heapq.heapreplace(self.top_sessions, item)
+
+    def add_session(self, session_id: str, timestamp: Optional[str], classified: Sequence[Dict[str, Any]]) -> None:
+        """Suma una sesión (classified_detectors ya ordenados por riesgo)."""
+        self.sessions += 1
+        self._seen(timestamp)
+        for rank, c in enumerate(classified):
+            score = int(c.get("risk_score") or 0)
+            level = c.get("risk_level") or "Unknown"
+            category = c.get("category") or "UNKNOWN"
+            self.detectors += 1
+            self.levels[level] += 1
+
+            cat = self.categories.get(category)
+            if cat is None:
+                cat = self.categories[category] = [0, 0, 0]
+            cat[0] += 1
+            cat[1] += score
+            cat[2] = max(cat[2], score)
+
+            key = join_key(c)
+            stats = self.by_detector.get(key)
+            if stats is None:
+                stats = self.by_detector[key] = _DetectorStats(c.get("detector_id"), c.get("name", ""), category)
+            stats.occurrences += 1
+            stats.score_sum += score
+            stats.max_score = max(stats.max_score, score)
+            stats.levels[level] += 1
+            if rank == 0:
+                stats.ranked_first += 1
+
+            for m in c.get("mitre") or ():
+                tid = m.get("technique")
+                if tid:
+                    self.techniques[tid] += 1
+                    if m.get("name"):
+                        self.technique_names[tid] = m["name"]
+        if classified:
+            first = classified[0]
+            self._push_session((int(first.get("risk_score") or 0), session_id, first.get("name", "")))
+
+    def merge(self, other: "FleetAggregate") -> None:
+        self.sessions += other.sessions
+        self.detectors += other.detectors
+        self._seen(other.first_seen)
+        self._seen(other.last_seen)
+        self.levels.update(other.levels)
+        for category, (n, total, peak) in other.categories.items():
+            cat = self.categories.setdefault(category, [0, 0, 0])
+            cat[0] += n
+            cat[1] += total
+            cat[2] = max(cat[2], peak)
+        for key, stats in other.by_detector.items():
+            mine = self.by_detector.get(key)
+            if mine is None:
+                self.by_detector[key] = stats
+            else:
+                mine.merge(stats)
+        self.techniques.update(other.techniques)
+        self.technique_names.update(other.technique_names)
+        for item in other.top_sessions:
+            self._push_session(item)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Vista JSON del agregado (la misma que report.json), tablas ya ordenadas."""
+        detectors = self.detectors or 1
+        return {
+            "sessions": self.sessions,
+            "detectors": self.detectors,
+            "first_seen_utc": self.first_seen,
+            "last_seen_utc": self.last_seen,
+            "risk_levels": [
+                {"level": level, "detectors": n, "share": round(n / detectors, 4)}
+                for level, n in self.levels.most_common()
+            ],
+            "categories": [
+                {"category": category, "detectors": n, "mean_score": round(total / n, 2), "max_score": peak}
+                for category, (n, total, peak) in sorted(self.categories.items(), key=lambda kv: (-kv[1][0], kv[0]))
+            ],
+            "by_detector": [
+                {
+                    "detector_id": s.detector_id, "name": s.name, "category": s.category,
+                    "occurrences": s.occurrences, "mean_score": round(s.score_sum / s.occurrences, 2),
+                    "max_score": s.max_score, "high": s.levels.get("High", 0), "ranked_first": s.ranked_first,
+                }
+                for s in sorted(
+                    self.by_detector.values(), key=lambda s: (-s.occurrences, s.detector_id or "", s.name)
+                )
+            ],
+            "techniques": [
+                {"technique": tid, "name": self.technique_names.get(tid, ""), "detectors": n}
+                for tid, n in self.techniques.most_common(self.top)
+            ],
+            "top_sessions": [
+                {"session_id": session_id, "top_risk_score": score, "top_name": name}
+                for score, session_id, name in sorted(self.top_sessions, key=lambda t: (-t[0], t[1]))
+            ],
+        }
+
+
+def session_row(session_id: str, timestamp: Optional[str], classified: Sequence[Dict[str, Any]]) -> str:
+    """Fila de sessions.csv: una por sesión, con su detector de mayor riesgo."""
+    first = classified[0] if classified else {}
+    return _SESSION_ROW.render({
+        "session_id": session_id,
+        "timestamp_utc": timestamp,
+        "detectors": len(classified),
+        "high_detectors": sum(1 for c in classified if c.get("risk_level") == "High"),
+        "top_detector_id": first.get("detector_id"),
+        "top_name": first.get("name"),
+        "top_category": first.get("category"),
+        "top_risk_score": first.get("risk_score"),
+        "top_risk_level": first.get("risk_level"),
+    })
+
+
+def _consolidate_chunk(paths: List[str], top: int) -> Dict[str, Any]:
+    agg = FleetAggregate(top)
+    out: Dict[str, Any] = {"aggregate": agg, "rows": [], "no_classifier": 0, "errors": []}
+    for raw in paths:
+        session_path = Path(raw)
+        try:
+            members = read_session_members(session_path, ("classifier.json",))
+            if "classifier.json" not in members:
+                out["no_classifier"] += 1
+                continue
+            envelope = json.loads(members["classifier.json"])
+            classified = (envelope.get("payload") or {}).get("classified_detectors") or []
+            session_id = envelope.get("session_id") or session_path.stem
+            timestamp = envelope.get("timestamp_utc")
+            agg.add_session(session_id, timestamp, classified)
+            out["rows"].append(session_row(session_id, timestamp, classified))
+        except Exception as e:
+            out["errors"].append({"path": raw, "error": repr(e), "traceback": traceback.format_exc(limit=3)})
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Render: las mismas tablas del snapshot en cada formato, en una sola pasada.
+# ---------------------------------------------------------------------------
+
+# (clave del snapshot, título, columnas)
+_TABLES: Tuple[Tuple[str, str, Tuple[str, ...]], ...] = (
+    ("risk_levels", "Risk levels", ("level", "detectors", "share")),
+    ("categories", "Categories", ("category", "detectors", "mean_score", "max_score")),
+    ("by_detector", "Detectors", (
+        "detector_id", "name", "category", "occurrences", "mean_score", "max_score", "high", "ranked_first",
+    )),
+    ("techniques", "Top MITRE techniques", ("technique", "name", "detectors")),
+    ("top_sessions", "Top sessions", ("session_id", "top_risk_score", "top_name")),
+)
+
+
+def _escape_md(value: Any) -> str:
+    return "" if value is None else str(value).replace("|", "\\|")
+
+
+_MD_HEADER = ReportTemplate(
+    "# UEBA Fleet Report\n\n"
+    "**Run:** `{run_id}` · **Sessions:** {sessions} · **Detectors:** {detectors}\n\n"
+    "**Period (UTC):** {first_seen_utc} → {last_seen_utc}\n"
+)
+_HTML_HEADER = ReportTemplate(
+    "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>UEBA Fleet Report</title>\n</head>\n<body>\n"
+    "<h1>UEBA Fleet Report</h1>\n"
+    "<p><strong>Run:</strong> <code>{run_id}</code> · <strong>Sessions:</strong> {sessions} · "
+    "<strong>Detectors:</strong> {detectors}</p>\n"
+    "<p><strong>Period (UTC):</strong> {first_seen_utc} → {last_seen_utc}</p>\n",
+    escape_html,
+)
+_MD_ROWS = {
+    key: ReportTemplate("| " + " | ".join("{%s}" % c for c in cols) + " |\n", _escape_md)
+    for key, _, cols in _TABLES
+}
+_HTML_ROWS = {
+    key: ReportTemplate("<tr>" + "".join("<td>{%s}</td>" % c for c in cols) + "</tr>\n", escape_html)
+    for key, _, cols in _TABLES
+}
+_DETECTOR_COLUMNS = dict((key, cols) for key, _, cols in _TABLES)["by_detector"]
+_CSV_ROW = ReportTemplate(",".join("{%s}" % c for c in _DETECTOR_COLUMNS) + "\r\n", escape_csv)
+
+
+def _render_markdown(run_id: str, snap: Dict[str, Any]) -> Iterator[str]:
+    yield _MD_HEADER.render({"run_id": run_id, **snap})
+    for key, title, cols in _TABLES:
+        yield f"\n## {title}\n\n| " + " | ".join(cols) + " |\n|" + "---|" * len(cols) + "\n"
+        row = _MD_ROWS[key]
+        for item in snap[key]:
+            yield row.render(item)
+
+
+def _render_html(run_id: str, snap: Dict[str, Any]) -> Iterator[str]:
+    yield _HTML_HEADER.render({"run_id": run_id, **snap})
+    for key, title, cols in _TABLES:
+        yield f"<h2>{title}</h2>\n<table>\n<tr>" + "".join(f"<th>{c}</th>" for c in cols) + "</tr>\n"
+        row = _HTML_ROWS[key]
+        for item in snap[key]:
+            yield row.render(item)
+        yield "</table>\n"
+    yield "</body>\n</html>\n"
+
+
+def _render_csv(run_id: str, snap: Dict[str, Any]) -> Iterator[str]:
+    # El CSV es la tabla por detector (la que se cruza en dashboards).
+    yield ",".join(_DETECTOR_COLUMNS) + "\r\n"
+    for item in snap["by_detector"]:
+        yield _CSV_ROW.render(item)
+
+
+def _render_json(run_id: str, snap: Dict[str, Any]) -> Iterator[str]:
+    yield json.dumps({"run_id": run_id, **snap}, ensure_ascii=False, indent=2)
+    yield "\n"
+
+
+_RENDERERS = {"md": _render_markdown, "html": _render_html, "csv": _render_csv, "json": _render_json}
+
+
+def write_consolidated(
+    run_id: str,
+    aggregate: FleetAggregate,
+    formats: Sequence[str],
+    sink: ArtifactSink,
+) -> Dict[str, Optional[str]]:
+    """Escribe report.<fmt> de cada formato en streaming; devuelve {formato: ruta}."""
+    snap = aggregate.snapshot()
+    paths: Dict[str, Optional[str]] = {}
+    for fmt in formats:
+        with sink.open_stream(run_id, f"report.{fmt}") as stream:
+            for chunk in _RENDERERS[fmt](run_id, snap):
+                stream.write_encoded(chunk.encode("utf-8"))
+        paths[fmt] = str(stream.path) if stream.path else None
+    return paths
+
+
+def run_consolidate(
+    runs_dir: Path = RUNS_DIR,
+    formats: Union[str, Sequence[str], None] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = CONSOLIDATE_CHUNK_SIZE,
+    top: int = CONSOLIDATE_TOP,
+    sink: Optional[ArtifactSink] = None,
+) -> Dict[str, Any]:
+    """
+    Reporte consolidado de todas las sesiones de `runs_dir` en
+    <runs_dir>/consolidated_<id>/: report.<fmt> por formato, sessions.csv (una
+    fila por sesión, escrita a medida que terminan los lotes) y consolidated.json.
+    """
+    runs_dir = Path(runs_dir)
+    formats = parse_formats(formats)
+    workers = max(1, workers or os.cpu_count() or 1)
+    sink = sink or FileSink(runs_dir)
+    run_id = f"consolidated_{uuid4().hex}"
+    start = time.perf_counter()
+
+    aggregate = FleetAggregate(top)
+    no_classifier = 0
+    scanned = 0
+    errors: List[Dict[str, Any]] = []
+    with sink.open_stream(run_id, "sessions.csv") as rows, ProcessPoolExecutor(max_workers=workers) as pool:
+        rows.write_encoded((",".join(SESSION_COLUMNS) + "\r\n").encode("utf-8"))
+        pending: Set[Future] = set()
+        chunks = iter_chunks(iter_sessions(runs_dir), max(1, chunk_size))
+        while True:
+            # Lotes en vuelo acotados: los parciales no se acumulan si el padre va más lento.
+            for chunk in chunks:
+                scanned += len(chunk)
+                pending.add(pool.submit(_consolidate_chunk, chunk, top))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                result = fut.result()
+                aggregate.merge(result["aggregate"])
+                no_classifier += result["no_classifier"]
+                errors.extend(result["errors"])
+                if result["rows"]:
+                    rows.write_encoded("".join(result["rows"]).encode("utf-8"))
+        sessions_csv = str(rows.path) if rows.path else None
+
+    report_paths = write_consolidated(run_id, aggregate, formats, sink)
+    wall = time.perf_counter() - start
+    summary: Dict[str, Any] = {
+        "run_id": run_id,
+        "timestamp_utc": utc_now_iso(),
+        "runs_dir": str(runs_dir),
+        "workers": workers,
+        "scanned": scanned,
+        "sessions": aggregate.sessions,
+        "detectors": aggregate.detectors,
+        "no_classifier": no_classifier,
+        "failed": len(errors),
+        "errors": errors[:20],
+        "formats": formats,
+        "report_paths": report_paths,
+        "sessions_csv": sessions_csv,
+        "wall_seconds": round(wall, 3),
+        "sessions_per_s": round(aggregate.sessions / wall, 1) if wall > 0 else None,
+    }
+    summary_path = sink.write_json(run_id, "consolidated", summary)
+    sink.close_session(run_id)
+    summary["summary_path"] = str(summary_path) if summary_path else None
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="MELI DataSec Challenge - reporte consolidado de la flota")
+    parser.add_argument("--runs-dir", default=str(RUNS_DIR))
+    parser.add_argument("--formats", default="md,html,csv,json", help="Formatos: md,html,csv,json")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (default: CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=CONSOLIDATE_CHUNK_SIZE, help="Sesiones por tarea del pool")
+    parser.add_argument("--top", type=int, default=CONSOLIDATE_TOP, help="Técnicas y sesiones en los rankings")
+    args = parser.parse_args()
+    try:
+        formats = parse_formats(args.formats)
+    except ValueError as e:
+        parser.error(str(e))
+
+    summary = run_consolidate(
+        Path(args.runs_dir),
+        formats=formats,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        top=args.top,
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    print(
+        f"consolidate: {summary['sessions']} sessions, {summary['detectors']} detectors, "
+        f"{summary['failed']} failed in {summary['wall_seconds']}s",
+        file=sys.stderr,
+    )
+    return 0 if not summary["failed"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
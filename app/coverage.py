@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from app.agents import analyzer, classifier
+from app.agents.catalog import TELEMETRY_FLAGS, DetectorCatalog, mask_flags, telemetry_mask
+from app.agents.scoring import ScoreBatch, ScoringModel, load_scoring_model, top_k
+from app.batch import iter_batch_inputs
+from app.logger import ArtifactSink, utc_now_iso
+
+# Set bits for every telemetry mask value (len(TELEMETRY_FLAGS) bits).
+_POPCOUNT = np.array([bin(m).count("1") for m in range(1 << len(TELEMETRY_FLAGS))], dtype=np.int64)
+
+
+@dataclass
+class CoverageMatrix:
+    """
+    Tenant x detector view of one catalog. All per-cell arrays have shape
+    (tenants, detectors), detectors in catalog order:
+    - missing: telemetry sources the tenant lacks for that detector (0 = ready)
+    - scores: risk model applied to every cell (ScoringModel.score_matrix)
+    - selected: per tenant, the top_k detectors the Analyzer would propose, ranked
+      by risk_score like the Classifier does (same result as one pipeline run per tenant)
+    """
+
+    tenant_ids: List[str]
+    masks: np.ndarray
+    catalog: DetectorCatalog
+    missing: np.ndarray
+    scores: ScoreBatch
+    selected: np.ndarray
+
+    @property
+    def ready(self) -> np.ndarray:
+        return self.missing == 0
+
+    @classmethod
+    def build(
+        cls,
+        tenant_ids: List[str],
+        masks: Sequence[int],
+        catalog: DetectorCatalog,
+        model: ScoringModel,
+        top_k: int = 5,
+    ) -> "CoverageMatrix":
+        templates = catalog.templates
+        masks_arr = np.asarray(masks, dtype=np.int64).reshape(-1)
+        required = np.array([t.required_mask for t in templates], dtype=np.int64)
+
+        missing = _POPCOUNT[required[None, :] & ~masks_arr[:, None] & (len(_POPCOUNT) - 1)]
+        scores = model.score_matrix([t.category_hint for t in templates], masks_arr)
+
+        # Analyzer selection (DetectorCatalog.iter_ranked): fewest missing sources first,
+        # then priority / catalog order; the Classifier then sorts that pick by risk_score.
+        n = len(templates)
+        static_rank = np.empty(n, dtype=np.int64)
+        static_rank[sorted(range(n), key=lambda i: (-templates[i].priority, templates[i].order))] = np.arange(n)
+        picked = np.argsort(missing * n + static_rank[None, :], axis=1, kind="stable")[:, :top_k]
+        picked_scores = np.take_along_axis(scores.risk_score, picked, axis=1)
+        selected = np.take_along_axis(picked, np.argsort(-picked_scores, axis=1, kind="stable"), axis=1)
+
+        return cls(
+            tenant_ids=tenant_ids,
+            masks=masks_arr,
+            catalog=catalog,
+            missing=missing,
+            scores=scores,
+            selected=selected,
+        )
+
+    def technique_ids(self) -> List[str]:
+        categories = {self.catalog.templates[d].category_hint for d in np.unique(self.selected)}
+        return [tid for c in sorted(categories) for tid in classifier.MITRE_ID_MAP.get(c, [])]
+
+    def tenant_record(self, t: int, enriched: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
+        templates = self.catalog.templates
+        mask = int(self.masks[t])
+        ranked = []
+        for d in self.selected[t]:
+            d = int(d)
+            template = templates[d]
+            ranked.append({
+                "id": template.id,
+                "name": template.name,
+                "category": template.category_hint,
+                **self.scores.record((t, d)),
+                "telemetry_missing": mask_flags(template.required_mask & ~mask),
+                "mitre": [enriched[tid] for tid in classifier.MITRE_ID_MAP.get(template.category_hint, [])],
+            })
+
+        return {
+            "tenant": self.tenant_ids[t],
+            "telemetry": mask_flags(mask),
+            "detectors_ready": int(self.ready[t].sum()),
+            "detectors_total": len(templates),
+            "ranked": ranked,
+        }
+
+    def gap_summary(self, top_tenants: int = 10) -> Dict[str, Any]:
+        templates = self.catalog.templates
+        tenants = len(self.tenant_ids)
+        ready = self.ready
+        blocked = ~ready
+
+        flag_gaps = {
+            flag: int(((self.masks & (1 << i)) == 0).sum()) for i, flag in enumerate(TELEMETRY_FLAGS)
+        }
+
+        blocked_per_detector = blocked.sum(axis=0)
+        detector_gaps = [
+            {
+                "id": templates[d].id,
+                "name": templates[d].name,
+                "category": templates[d].category_hint,
+                "requires": mask_flags(templates[d].required_mask),
+                "tenants_blocked": int(blocked_per_detector[d]),
+                "blocked_pct": round(100.0 * blocked_per_detector[d] / tenants, 2) if tenants else 0.0,
+            }
+            for d in np.argsort(-blocked_per_detector, kind="stable")
+        ]
+
+        # Riesgo que un tenant no puede detectar: suma de risk_score de los detectores bloqueados.
+        uncovered = np.where(blocked, self.scores.risk_score, 0).sum(axis=1)
+        worst = [
+            {
+                "tenant": self.tenant_ids[t],
+                "uncovered_risk": int(uncovered[t]),
+                "missing_telemetry": mask_flags(~int(self.masks[t]) & (len(_POPCOUNT) - 1)),
+            }
+            for t in top_k(uncovered, top_tenants)
+            if uncovered[t] > 0
+        ]
+
+        ready_per_tenant = ready.sum(axis=1)
+        return {
+            "tenants": tenants,
+            "detectors": len(templates),
+            "fully_covered_tenants": int((ready_per_tenant == len(templates)).sum()),
+            "mean_detectors_ready": round(float(ready_per_tenant.mean()), 3) if tenants else 0.0,
+            "flag_gaps": flag_gaps,
+            "detector_gaps": detector_gaps,
+            "highest_uncovered_risk": worst,
+        }
+
+
+def _tenant_inputs(
+    jobs: Iterable[Dict[str, Any]], agent: analyzer.AnalyzerAgent
+) -> Tuple[List[str], List[int], List[Dict[str, Any]]]:
+    ids: List[str] = []
+    masks: List[int] = []
+    failures: List[Dict[str, Any]] = []
+    for job in jobs:
+        try:
+            if "error" in job:
+                raise ValueError(job["error"])
+            text = job["text"] if "text" in job else Path(job["path"]).read_text(encoding="utf-8")
+            telemetry = agent._infer_telemetry_flags(analyzer._user_input(agent, text))
+        except Exception as e:
+            failures.append({"id": job["id"], "error": repr(e)})
+            continue
+        ids.append(job["id"])
+        masks.append(telemetry_mask(telemetry))
+    return ids, masks, failures
+
+
+def run_coverage(
+    source: str,
+    backend: Optional[str] = None,
+    top_k: int = 5,
+    sink: Optional[ArtifactSink] = None,
+    agent: Optional[analyzer.AnalyzerAgent] = None,
+) -> Dict[str, Any]:
+    """
+    Modo matriz: el catálogo de detectores contra todos los tenants de `source`
+    (mismo formato que --batch) en un solo proceso. Telemetría inferida una vez por
+    tenant, scoring vectorizado de todas las celdas y enriquecimiento MITRE una sola
+    vez por técnica. Escribe un ranking por tenant (tenants.ndjson) y el resumen de
+    gaps de cobertura (coverage.json) en runs/coverage_<id>/.
+    """
+    sink = sink or ArtifactSink()
+    agent = agent or analyzer.AnalyzerAgent()
+    run_id = f"coverage_{uuid4().hex}"
+    started_at = utc_now_iso()
+    timings: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    tenant_ids, masks, failures = _tenant_inputs(iter_batch_inputs(source), agent)
+    timings["telemetry_s"] = time.perf_counter() - start
+
+    t0 = time.perf_counter()
+    matrix = CoverageMatrix.build(tenant_ids, masks, agent.catalog, load_scoring_model(), top_k=top_k)
+    timings["scoring_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    technique_ids = matrix.technique_ids()
+    enriched, cache_counters = classifier.enrich_techniques(technique_ids, backend=backend)
+    timings["mitre_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with sink.open_records(run_id, "tenants") as records:
+        for t in range(len(tenant_ids)):
+            records.write(matrix.tenant_record(t, enriched))
+        records_path = records.path
+    timings["records_s"] = time.perf_counter() - t0
+
+    summary = {
+        "run_id": run_id,
+        "source": str(source),
+        "started_at_utc": started_at,
+        "backend": backend,
+        "top_k": top_k,
+        "failed": len(failures),
+        "failures": failures,
+        **matrix.gap_summary(),
+        "mitre_lookup": {"unique": len(enriched), **cache_counters},
+        "timings": {k: round(v, 4) for k, v in timings.items()},
+        "wall_seconds": round(time.perf_counter() - start, 4),
+        "records_path": str(records_path) if records_path else None,
+    }
+    summary_path = sink.write_json(run_id, "coverage", summary)
+    sink.close_session(run_id)
+    summary["summary_path"] = str(summary_path) if summary_path else None
+    return summary
@@ -0,0 +1,503 @@
+"""
+Cola de jobs del pipeline en SQLite, sin servicios externos ni coordinador.
+
+Varios procesos (y varios hosts) toman jobs de la misma base:
+- enqueue: agrega inputs (texto o path) como jobs "queued"
+- lease: toma hasta n jobs disponibles por `visibility_timeout` segundos; si el
+  worker muere sin ack, el lease vence y el job vuelve a estar disponible
+- ack: marca el job como "done" (solo con el token del lease vigente)
+- retry: lo reprograma con backoff exponencial, o "failed" al agotar los intentos
+
+Cada worker corre Analyzer → Classifier → Reporter por job. Para escalar se
+agregan procesos (--processes) o hosts apuntando a la misma JOB_QUEUE_PATH.
+
+Journal: "wal" (default) es lo más rápido pero necesita memoria compartida, o
+sea todos los workers en el mismo host. Para varios hosts sobre un filesystem
+compartido usar JOB_QUEUE_JOURNAL=delete (locks de archivo; el FS tiene que
+soportar POSIX locks, ej. NFSv4).
+
+    python -m app.jobs enqueue inputs/ | tenants.jsonl
+    python -m app.jobs work [--processes 4] [--exit-when-idle]
+    python -m app.jobs stats
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from pathlib import Path
+from queue import Empty
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", str(PROJECT_ROOT / ".cache" / "jobs.sqlite"))
+JOB_QUEUE_JOURNAL = os.getenv("JOB_QUEUE_JOURNAL", "wal")
+JOB_QUEUE_JOURNALS = ("wal", "delete")
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "5"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           INTEGER PRIMARY KEY,
+    input_id     TEXT,
+    payload      TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    enqueued_at  REAL NOT NULL,
+    available_at REAL NOT NULL,
+    leased_until REAL,
+    lease_owner  TEXT,
+    lease_token  TEXT,
+    finished_at  REAL,
+    last_error   TEXT,
+    result       TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at) WHERE finished_at IS NOT NULL;
+"""
+
+
+def backoff_seconds(attempt: int, base: float = JOB_BACKOFF_BASE, cap: float = JOB_BACKOFF_MAX) -> float:
+    """Backoff exponencial con jitter ("full jitter"): uniforme en [0, min(cap, base * 2^(attempt-1))]."""
+    return random.uniform(0, min(cap, base * (2 ** max(0, attempt - 1))))
+
+
+class JobQueue:
+    """
+    Cola de jobs en una base SQLite compartida. Cada operación es una transacción
+    corta (BEGIN IMMEDIATE): los procesos se coordinan solo con los locks de SQLite.
+    """
+
+    def __init__(
+        self,
+        path: str = JOB_QUEUE_PATH,
+        journal: str = JOB_QUEUE_JOURNAL,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ):
+        if journal not in JOB_QUEUE_JOURNALS:
+            raise ValueError(f"Unknown journal mode {journal!r} (use one of {JOB_QUEUE_JOURNALS})")
+        self.path = Path(path)
+        self.journal = journal
+        self.max_attempts = max(1, max_attempts)
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute(f"PRAGMA journal_mode={self.journal.upper()}")
+            conn.execute("PRAGMA synchronous=NORMAL" if self.journal == "wal" else "PRAGMA synchronous=FULL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _write(self, fn: Any) -> Any:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return out
+
+    # --- productor ---
+
+    def enqueue(self, payload: Dict[str, Any], input_id: Optional[str] = None, delay: float = 0.0) -> int:
+        return self.enqueue_many([payload], input_ids=[input_id], delay=delay)[0]
+
+    def enqueue_many(
+        self,
+        payloads: Iterable[Dict[str, Any]],
+        input_ids: Optional[Iterable[Optional[str]]] = None,
+        delay: float = 0.0,
+    ) -> List[int]:
+        now = time.time()
+        payloads = list(payloads)
+        ids = list(input_ids) if input_ids is not None else [p.get("id") for p in payloads]
+
+        def _insert(conn: sqlite3.Connection) -> List[int]:
+            out = []
+            for payload, input_id in zip(payloads, ids):
+                cur = conn.execute(
+                    "INSERT INTO jobs (input_id, payload, status, max_attempts, enqueued_at, available_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (input_id, json.dumps(payload, ensure_ascii=False), QUEUED, self.max_attempts, now, now + delay),
+                )
+                out.append(cur.lastrowid)
+            return out
+
+        return self._write(_insert)
+
+    # --- consumidor ---
+
+    def lease(self, owner: str, n: int = 1, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT) -> List[Dict[str, Any]]:
+        """
+        Toma hasta `n` jobs listos (en cola y sin backoff pendiente, o con lease
+        vencido). Cada lease cuenta como intento; un lease vencido sin intentos
+        restantes pasa a "failed".
+        """
+        now = time.time()
+
+        def _lease(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, last_error = 'lease expired', lease_token = NULL "
+                "WHERE status = ? AND leased_until < ? AND attempts >= max_attempts",
+                (FAILED, now, LEASED, now),
+            )
+            rows = conn.execute(
+                "SELECT id, input_id, payload, attempts, enqueued_at FROM jobs "
+                "WHERE (status = ? AND available_at <= ?) OR (status = ? AND leased_until < ?) "
+                "ORDER BY available_at, id LIMIT ?",
+                (QUEUED, now, LEASED, now, max(1, n)),
+            ).fetchall()
+            jobs = []
+            for job_id, input_id, payload, attempts, enqueued_at in rows:
+                token = uuid4().hex
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, leased_until = ?, "
+                    "lease_owner = ?, lease_token = ? WHERE id = ?",
+                    (LEASED, now + visibility_timeout, owner, token, job_id),
+                )
+                jobs.append({
+                    "id": job_id,
+                    "input_id": input_id,
+                    "payload": json.loads(payload),
+                    "attempt": attempts + 1,
+                    "token": token,
+                    "age_s": round(now - enqueued_at, 3),
+                })
+            return jobs
+
+        return self._write(_lease)
+
+    def heartbeat(self, job_id: int, token: str, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT) -> bool:
+        """Extiende un lease vigente (jobs más largos que el visibility timeout)."""
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET leased_until = ? WHERE id = ? AND lease_token = ? AND status = ?",
+            (time.time() + visibility_timeout, job_id, token, LEASED),
+        ).rowcount == 1)
+
+    def ack(self, job_id: int, token: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Cierra el job. Devuelve False si el lease ya no es de este worker (venció y
+        lo tomó otro): el resultado se descarta y cuenta el del otro worker.
+        """
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ?, lease_token = NULL "
+            "WHERE id = ? AND lease_token = ? AND status = ?",
+            (DONE, time.time(), json.dumps(result or {}, ensure_ascii=False), job_id, token, LEASED),
+        ).rowcount == 1)
+
+    def retry(self, job_id: int, token: str, error: str, delay: Optional[float] = None) -> Optional[str]:
+        """
+        Devuelve el job a la cola con backoff (o a "failed" sin intentos restantes).
+        Devuelve el estado nuevo, o None si el lease ya no era de este worker.
+        """
+        now = time.time()
+
+        def _retry(conn: sqlite3.Connection) -> Optional[str]:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_token = ? AND status = ?",
+                (job_id, token, LEASED),
+            ).fetchone()
+            if row is None:
+                return None
+            attempts, max_attempts = row
+            if attempts >= max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, last_error = ?, lease_token = NULL WHERE id = ?",
+                    (FAILED, now, error, job_id),
+                )
+                return FAILED
+            wait = backoff_seconds(attempts) if delay is None else delay
+            conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, last_error = ?, lease_token = NULL, "
+                "leased_until = NULL WHERE id = ?",
+                (QUEUED, now + wait, error, job_id),
+            )
+            return QUEUED
+
+        return self._write(_retry)
+
+    def requeue_failed(self) -> int:
+        """Vuelve a encolar los jobs "failed" con los intentos en cero."""
+        now = time.time()
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, finished_at = NULL WHERE status = ?",
+            (QUEUED, now, FAILED),
+        ).rowcount)
+
+    # --- progreso ---
+
+    def stats(self, window: float = 60.0) -> Dict[str, Any]:
+        """
+        Profundidad de la cola, edad del job más viejo pendiente y throughput
+        (jobs terminados por segundo en los últimos `window` segundos).
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            ready, delayed, oldest = conn.execute(
+                "SELECT SUM(available_at <= ?), SUM(available_at > ?), MIN(enqueued_at) FROM jobs WHERE status = ?",
+                (now, now, QUEUED),
+            ).fetchone()
+            expired = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND leased_until < ?", (LEASED, now)
+            ).fetchone()[0]
+            recent = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE finished_at >= ? GROUP BY status", (now - window,)
+            ).fetchall())
+            owners = conn.execute(
+                "SELECT COUNT(DISTINCT lease_owner) FROM jobs WHERE status = ? AND leased_until >= ?", (LEASED, now)
+            ).fetchone()[0]
+        return {
+            "path": str(self.path),
+            "depth": int(ready or 0),
+            "delayed": int(delayed or 0),
+            "leased": counts.get(LEASED, 0) - expired,
+            "expired_leases": expired,
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "total": sum(counts.values()),
+            "oldest_pending_age_s": round(now - oldest, 3) if oldest is not None else None,
+            "active_workers": owners,
+            "throughput_per_s": round(recent.get(DONE, 0) / window, 3),
+            "failures_per_s": round(recent.get(FAILED, 0) / window, 3),
+            "window_s": window,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# --- worker ---
+
+def _job_text(payload: Dict[str, Any]) -> str:
+    if "text" in payload:
+        return payload["text"]
+    if "path" in payload:
+        return Path(payload["path"]).read_text(encoding="utf-8")
+    raise ValueError(payload.get("error") or "job has no text or path")
+
+
+def run_worker(
+    path: str = JOB_QUEUE_PATH,
+    owner: Optional[str] = None,
+    visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+    poll_interval: float = JOB_POLL_INTERVAL,
+    max_jobs: Optional[int] = None,
+    exit_when_idle: bool = False,
+    backend: Optional[str] = None,
+    artifacts: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Loop de un worker: lease → pipeline → ack / retry. Mientras corre un job un
+    thread renueva el lease cada visibility_timeout / 3. Termina al procesar
+    `max_jobs` o, con `exit_when_idle`, cuando no quedan jobs listos ni en curso.
+    """
+    from app.logger import make_sink
+    from app.mcp.backends import close_backends
+    from app.pipeline import run_pipeline
+
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(path)
+    sink = make_sink(**(artifacts or {}))
+    counters: Dict[str, Any] = {"owner": owner, "done": 0, "retried": 0, "failed": 0, "lost_leases": 0}
+    start = time.perf_counter()
+    busy = 0.0
+
+    try:
+        while max_jobs is None or counters["done"] + counters["retried"] + counters["failed"] < max_jobs:
+            jobs = queue.lease(owner, n=1, visibility_timeout=visibility_timeout)
+            if not jobs:
+                if exit_when_idle:
+                    s = queue.stats()
+                    if s["depth"] == 0 and s["leased"] == 0 and s["delayed"] == 0 and s["expired_leases"] == 0:
+                        break
+                time.sleep(poll_interval)
+                continue
+
+            job = jobs[0]
+            stop = threading.Event()
+
+            def _renew() -> None:
+                while not stop.wait(visibility_timeout / 3):
+                    if not queue.heartbeat(job["id"], job["token"], visibility_timeout):
+                        return
+
+            renewer = threading.Thread(target=_renew, name=f"lease-{job['id']}", daemon=True)
+            renewer.start()
+            t0 = time.perf_counter()
+            try:
+                result = run_pipeline(_job_text(job["payload"]), backend=backend, sink=sink)
+                outcome: Dict[str, Any] = {
+                    "session_id": result.session_id,
+                    "owner": owner,
+                    "attempt": job["attempt"],
+                    "seconds": round(time.perf_counter() - t0, 4),
+                }
+                error = None
+            except Exception as e:
+                logger.warning("job %s (%s) failed: %r", job["id"], job["input_id"], e)
+                error = f"{e!r}\n{traceback.format_exc(limit=5)}"
+            finally:
+                stop.set()
+                renewer.join()
+                busy += time.perf_counter() - t0
+
+            if error is None:
+                if queue.ack(job["id"], job["token"], outcome):
+                    counters["done"] += 1
+                else:
+                    counters["lost_leases"] += 1
+            else:
+                state = queue.retry(job["id"], job["token"], error)
+                if state is None:
+                    counters["lost_leases"] += 1
+                else:
+                    counters["retried" if state == QUEUED else "failed"] += 1
+    finally:
+        sink.close()
+        close_backends()
+        queue.close()
+
+    wall = time.perf_counter() - start
+    processed = counters["done"] + counters["retried"] + counters["failed"]
+    counters.update(
+        wall_seconds=round(wall, 3),
+        busy_seconds=round(busy, 3),
+        throughput_per_s=round(counters["done"] / wall, 3) if wall > 0 else None,
+        processed=processed,
+    )
+    return counters
+
+
+def _worker_process(kwargs: Dict[str, Any], results: Any) -> None:
+    # Siempre deja un resultado: el padre espera uno por proceso.
+    try:
+        out = run_worker(**kwargs)
+    except BaseException as e:
+        out = {"owner": kwargs.get("owner") or f"{socket.gethostname()}:{os.getpid()}", "error": repr(e)}
+        results.put(out)
+        raise
+    results.put(out)
+
+
+def run_workers(processes: int, **kwargs: Any) -> List[Dict[str, Any]]:
+    """
+    Varios workers independientes en este host (sin coordinador: solo comparten la base).
+    Un worker que muere sin dejar resultado (ej. SIGKILL) aparece con "error" y su exitcode.
+    """
+    if processes <= 1:
+        return [run_worker(**kwargs)]
+    results: Any = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_worker_process, args=(kwargs, results)) for _ in range(processes)]
+    for p in procs:
+        p.start()
+    out: List[Dict[str, Any]] = []
+    while len(out) < len(procs):
+        try:
+            out.append(results.get(timeout=1.0))
+        except Empty:
+            if not any(p.is_alive() for p in procs):
+                break
+    # Lo que quedó en el pipe de procesos que ya salieron.
+    while len(out) < len(procs):
+        try:
+            out.append(results.get(timeout=0.1))
+        except Empty:
+            break
+    for p in procs:
+        p.join()
+    lost = [p for p in procs if p.exitcode != 0][: len(procs) - len(out)]
+    out.extend(
+        {"owner": f"{socket.gethostname()}:{p.pid}", "error": f"worker exited with code {p.exitcode}"}
+        for p in lost
+    )
+    return out
+
+
+def main() -> int:
+    from app.batch import iter_batch_inputs
+    from app.logger import ARTIFACT_SINK, ARTIFACT_SINKS
+    from app.mcp.backends import MITRE_BACKEND, MITRE_BACKENDS
+
+    parser = argparse.ArgumentParser(description="MELI DataSec Challenge - cola de jobs del pipeline")
+    parser.add_argument("--queue", default=JOB_QUEUE_PATH, help="Base SQLite de la cola (JOB_QUEUE_PATH)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("enqueue", help="Encolar un directorio de .txt/.md o un .jsonl (como --batch)")
+    p.add_argument("source")
+
+    p = sub.add_parser("work", help="Tomar y procesar jobs")
+    p.add_argument("--processes", type=int, default=1, help="Workers en este host")
+    p.add_argument("--visibility-timeout", type=float, default=JOB_VISIBILITY_TIMEOUT)
+    p.add_argument("--poll-interval", type=float, default=JOB_POLL_INTERVAL)
+    p.add_argument("--max-jobs", type=int, default=None, help="Jobs por worker antes de salir")
+    p.add_argument("--exit-when-idle", action="store_true", help="Salir cuando no quedan jobs pendientes")
+    p.add_argument("--mitre-backend", choices=MITRE_BACKENDS, default=MITRE_BACKEND)
+    p.add_argument("--artifact-sink", choices=ARTIFACT_SINKS, default=ARTIFACT_SINK)
+
+    sub.add_parser("stats", help="Profundidad, edad y throughput de la cola")
+    sub.add_parser("requeue-failed", help="Volver a encolar los jobs fallidos")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.queue)
+    if args.command == "enqueue":
+        jobs = list(iter_batch_inputs(args.source))
+        ids = queue.enqueue_many(jobs, input_ids=[j["id"] for j in jobs])
+        result: Any = {"enqueued": len(ids), **queue.stats()}
+    elif args.command == "work":
+        queue.close()
+        workers = run_workers(
+            args.processes,
+            path=args.queue,
+            visibility_timeout=args.visibility_timeout,
+            poll_interval=args.poll_interval,
+            max_jobs=args.max_jobs,
+            exit_when_idle=args.exit_when_idle,
+            backend=args.mitre_backend,
+            artifacts={"kind": args.artifact_sink},
+        )
+        result = {"workers": workers, "queue": JobQueue(args.queue).stats()}
+        if any("error" in w for w in workers):
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+            return 1
+    elif args.command == "requeue-failed":
+        result = {"requeued": queue.requeue_failed(), **queue.stats()}
+    else:
+        result = queue.stats()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,48 +1,466 @@
 from __future__ import annotations
 
-import json
+import atexit
+import io
+import logging
 import os
-from dataclasses import asdict, is_dataclass
+import queue
+import threading
+import zipfile
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.schemas import dumps
+
+logger = logging.getLogger(__name__)
+
+RUNS_DIR = Path(os.getenv("RUNS_DIR", "runs"))
 
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def ensure_session_dir(session_id: str) -> Path:
-    base = Path("runs") / session_id
+def ensure_session_dir(session_id: str, base_dir: Path = RUNS_DIR) -> Path:
+    base = Path(base_dir) / session_id
     base.mkdir(parents=True, exist_ok=True)
     return base
 
 
-def _to_jsonable(obj: Any) -> Any:
-    if is_dataclass(obj):
-        return asdict(obj)
-    return obj
-
-
 def write_json(path: Path, payload: Dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     with path.open("w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+        f.write(dumps(payload, pretty=True))
+
+
+ARTIFACT_SINK = os.getenv("ARTIFACT_SINK", "files")
+ARTIFACT_ENCODING = os.getenv("ARTIFACT_ENCODING", "pretty")
+ARTIFACT_FSYNC = os.getenv("ARTIFACT_FSYNC", "none")
+ARTIFACT_BACKGROUND = os.getenv("ARTIFACT_BACKGROUND", "0").lower() in ("1", "true", "yes", "on")
+ARTIFACT_QUEUE_SIZE = int(os.getenv("ARTIFACT_QUEUE_SIZE", "10000"))
+
+ARTIFACT_SINKS = ("files", "bundle")
+ARTIFACT_ENCODINGS = ("pretty", "compact")
+# none: lo decide el SO; session: fsync al cerrar la sesión; always: fsync por archivo
+ARTIFACT_FSYNC_POLICIES = ("none", "session", "always")
+
+_WRITE_BUFFER = 1 << 16
+
+
+def encode_json(payload: Any, encoding: str = "pretty") -> bytes:
+    return dumps(payload, pretty=encoding != "compact").encode("utf-8")
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    return dumps(record).encode("utf-8") + b"\n"
+
 
+def _fsync_path(path: Path) -> None:
+    with path.open("rb") as f:
+        os.fsync(f.fileno())
 
-def log_agent_output(session_id: str, agent_name: str, payload: Dict[str, Any]) -> Path:
+
+class RecordWriter:
+    """Escritor de registros uno a uno (modo streaming). Este no escribe nada."""
+
+    path: Optional[Path] = None
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.write_encoded(encode_record(record))
+
+    def write_encoded(self, line: bytes) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class NdjsonWriter(RecordWriter):
     """
-    Guarda un JSON por agente en: runs/<session_id>/<agent_name>.json
+    Archivo escrito a medida que llegan los datos: un JSON compacto por línea
+    (write) o fragmentos ya codificados (write_encoded, ej: reports en streaming).
     """
-    session_dir = ensure_session_dir(session_id)
-    out_path = session_dir / f"{agent_name}.json"
 
+    def __init__(self, path: Path, fsync: bool = False):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.fsync = fsync
+        self._f = path.open("wb", buffering=_WRITE_BUFFER)
+
+    def write_encoded(self, line: bytes) -> None:
+        self._f.write(line)
+
+    def close(self) -> None:
+        if not self._f.closed:
+            if self.fsync:
+                self._f.flush()
+                os.fsync(self._f.fileno())
+            self._f.close()
+
+
+class ArtifactSink:
+    """
+    Destino de los artefactos de una sesión (JSON por agente, report.md).
+    La implementación por defecto no persiste nada: el pipeline queda en memoria.
+
+    Las implementaciones que escriben trabajan sobre bytes ya codificados
+    (write_bytes); así BackgroundSink puede codificar en el thread del pipeline
+    y dejar solo el I/O al thread escritor.
+    """
+
+    encoding = "pretty"
+    base_dir: Optional[Path] = None
+    _index: Optional["_RunIndexBuffer"] = None
+
+    def json_name(self, name: str) -> str:
+        return f"{name}.json"
+
+    def path_for(self, session_id: str, filename: str) -> Optional[Path]:
+        return None
+
+    def write_bytes(self, session_id: str, filename: str, data: bytes) -> Optional[Path]:
+        return None
+
+    def write_json(self, session_id: str, name: str, payload: Dict[str, Any]) -> Optional[Path]:
+        return self.write_bytes(session_id, self.json_name(name), encode_json(payload, self.encoding))
+
+    def write_text(self, session_id: str, name: str, text: str) -> Optional[Path]:
+        return self.write_bytes(session_id, name, text.encode("utf-8"))
+
+    def open_records(self, session_id: str, name: str) -> RecordWriter:
+        return self.open_stream(session_id, f"{name}.ndjson")
+
+    def open_stream(self, session_id: str, filename: str) -> RecordWriter:
+        """Artefacto escrito por partes (write_encoded) sin armarlo entero en memoria."""
+        return RecordWriter()
+
+    def index_envelope(self, envelope: Dict[str, Any]) -> None:
+        """JSON de agente para el índice de runs: se registra al cerrar la sesión, en una transacción."""
+        if self._index is not None:
+            self._index.add(envelope)
+
+    def close_session(self, session_id: str) -> None:
+        """Fin de una sesión: aplica la política de fsync / cierra el bundle."""
+
+    def flush(self) -> None:
+        if self._index is not None:
+            self._index.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+
+class _RunIndexBuffer:
+    """
+    Envelopes pendientes para runs/index.sqlite (app/run_index.py), por sesión. Al
+    cerrar una sesión pasan a la cola de escritura, que se vuelca con record_many en
+    una sola transacción cada RUN_INDEX_BATCH sesiones (y en flush()). Con
+    BackgroundSink esto corre en el thread escritor, no en el del pipeline.
+    """
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = base_dir
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._ready: List[Dict[str, Any]] = []
+        self._ready_sessions = 0
+        self._lock = threading.Lock()
+
+    def add(self, envelope: Dict[str, Any]) -> None:
+        with self._lock:
+            self._pending.setdefault(envelope.get("session_id") or "", []).append(envelope)
+
+    def session_done(self, session_id: str) -> None:
+        from app.run_index import RUN_INDEX_BATCH
+
+        with self._lock:
+            envelopes = self._pending.pop(session_id, None)
+            if not envelopes:
+                return
+            self._ready.extend(envelopes)
+            self._ready_sessions += 1
+            if self._ready_sessions < RUN_INDEX_BATCH:
+                return
+            envelopes, self._ready, self._ready_sessions = self._ready, [], 0
+        self._record(envelopes)
+
+    def flush(self) -> None:
+        with self._lock:
+            envelopes = self._ready + [e for pending in self._pending.values() for e in pending]
+            self._ready, self._ready_sessions, self._pending = [], 0, {}
+        if envelopes:
+            self._record(envelopes)
+
+    def _record(self, envelopes: List[Dict[str, Any]]) -> None:
+        from app.run_index import RUN_INDEX_ENABLED, get_index
+
+        if not RUN_INDEX_ENABLED:
+            return
+        try:
+            get_index(self.base_dir).record_many(envelopes)
+        except Exception:
+            # El índice se puede reconstruir (python -m app.run_index backfill): nunca corta el pipeline.
+            logger.warning(
+                "run index update failed for %s", sorted({e.get("session_id") for e in envelopes}), exc_info=True
+            )
+
+
+class FileSink(ArtifactSink):
+    """Un archivo por artefacto en <base_dir>/<session_id>/ (layout histórico de runs/)."""
+
+    def __init__(self, base_dir: Path = RUNS_DIR, encoding: str = ARTIFACT_ENCODING, fsync: str = ARTIFACT_FSYNC):
+        self.base_dir = Path(base_dir)
+        self.encoding = encoding
+        self.fsync = fsync
+        self._written: Dict[str, List[Path]] = {}
+        self._lock = threading.Lock()
+        self._index = _RunIndexBuffer(self.base_dir)
+
+    def path_for(self, session_id: str, filename: str) -> Optional[Path]:
+        return self.base_dir / session_id / filename
+
+    def write_bytes(self, session_id: str, filename: str, data: bytes) -> Optional[Path]:
+        out_path = ensure_session_dir(session_id, self.base_dir) / filename
+        with out_path.open("wb", buffering=_WRITE_BUFFER) as f:
+            f.write(data)
+            if self.fsync == "always":
+                f.flush()
+                os.fsync(f.fileno())
+        self._track(session_id, out_path)
+        return out_path
+
+    def open_stream(self, session_id: str, filename: str) -> RecordWriter:
+        out_path = ensure_session_dir(session_id, self.base_dir) / filename
+        self._track(session_id, out_path)
+        return NdjsonWriter(out_path, fsync=self.fsync == "always")
+
+    def _track(self, session_id: str, path: Path) -> None:
+        if self.fsync == "session":
+            with self._lock:
+                self._written.setdefault(session_id, []).append(path)
+
+    def close_session(self, session_id: str) -> None:
+        with self._lock:
+            paths = self._written.pop(session_id, [])
+        for path in paths:
+            _fsync_path(path)
+        self._index.session_done(session_id)
+
+
+class BundleSink(ArtifactSink):
+    """
+    Todos los artefactos de una sesión en un solo archivo: <base_dir>/<session_id>.zip
+    (un miembro por artefacto, comprimido). Se arma en memoria y se escribe de una
+    vez en close_session().
+    """
+
+    def __init__(self, base_dir: Path = RUNS_DIR, encoding: str = "compact", fsync: str = ARTIFACT_FSYNC):
+        self.base_dir = Path(base_dir)
+        self.encoding = encoding
+        self.fsync = fsync
+        self._members: Dict[str, Dict[str, bytes]] = {}
+        self._lock = threading.Lock()
+        self._index = _RunIndexBuffer(self.base_dir)
+
+    def path_for(self, session_id: str, filename: str) -> Optional[Path]:
+        return self.base_dir / f"{session_id}.zip"
+
+    def write_bytes(self, session_id: str, filename: str, data: bytes) -> Optional[Path]:
+        with self._lock:
+            self._members.setdefault(session_id, {})[filename] = data
+        return self.path_for(session_id, filename)
+
+    def open_stream(self, session_id: str, filename: str) -> RecordWriter:
+        return _BufferedRecords(self, session_id, filename)
+
+    def close_session(self, session_id: str) -> None:
+        with self._lock:
+            members = self._members.pop(session_id, None)
+        if not members:
+            return
+
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        out_path = self.base_dir / f"{session_id}.zip"
+        tmp_path = out_path.with_suffix(".zip.tmp")
+        with tmp_path.open("wb", buffering=_WRITE_BUFFER) as f:
+            with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for filename, data in members.items():
+                    zf.writestr(filename, data)
+            if self.fsync != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, out_path)
+        self._index.session_done(session_id)
+
+
+class _BufferedRecords(RecordWriter):
+    def __init__(self, sink: BundleSink, session_id: str, filename: str):
+        self.sink = sink
+        self.session_id = session_id
+        self.filename = filename
+        self.path = sink.path_for(session_id, filename)
+        self._buf = io.BytesIO()
+
+    def write_encoded(self, line: bytes) -> None:
+        self._buf.write(line)
+
+    def close(self) -> None:
+        if self._buf is not None:
+            self.sink.write_bytes(self.session_id, self.filename, self._buf.getvalue())
+            self._buf = None
+
+
+class BackgroundSink(ArtifactSink):
+    """
+    Envuelve otro sink y le pasa las escrituras a un thread escritor: el pipeline
+    codifica (JSON compacto/pretty, NDJSON) y encola bytes, sin esperar al disco.
+    Las rutas devueltas son las que tendrá el artefacto. flush() espera a que la
+    cola se vacíe y vuelca el sink interno (índice de runs incluido); los errores
+    de escritura se loguean y se cuentan en `errors`.
+    """
+
+    def __init__(self, inner: ArtifactSink, queue_size: int = ARTIFACT_QUEUE_SIZE):
+        self.inner = inner
+        self.encoding = inner.encoding
+        self.base_dir = inner.base_dir
+        self.errors = 0
+        self._queue: "queue.Queue[Optional[Tuple[Callable[..., Any], tuple]]]" = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._drain, name="artifact-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def json_name(self, name: str) -> str:
+        return self.inner.json_name(name)
+
+    def path_for(self, session_id: str, filename: str) -> Optional[Path]:
+        return self.inner.path_for(session_id, filename)
+
+    def _submit(self, fn: Callable[..., Any], *args: Any) -> None:
+        self._queue.put((fn, args))
+
+    def _drain(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                fn, args = item
+                fn(*args)
+            except Exception:
+                self.errors += 1
+                logger.exception("artifact write failed")
+            finally:
+                self._queue.task_done()
+
+    def write_bytes(self, session_id: str, filename: str, data: bytes) -> Optional[Path]:
+        self._submit(self.inner.write_bytes, session_id, filename, data)
+        return self.path_for(session_id, filename)
+
+    def open_stream(self, session_id: str, filename: str) -> RecordWriter:
+        return _QueuedRecords(self, session_id, filename)
+
+    def index_envelope(self, envelope: Dict[str, Any]) -> None:
+        self._submit(self.inner.index_envelope, envelope)
+
+    def close_session(self, session_id: str) -> None:
+        self._submit(self.inner.close_session, session_id)
+
+    def flush(self) -> None:
+        # El flush del sink interno también corre en el escritor, detrás de lo ya encolado.
+        self._submit(self.inner.flush)
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        atexit.unregister(self.close)
+        self.inner.close()
+
+
+class _QueuedRecords(RecordWriter):
+    """Registros codificados en el thread del pipeline; abrir/escribir/cerrar corre en el escritor."""
+
+    def __init__(self, sink: BackgroundSink, session_id: str, filename: str):
+        self.sink = sink
+        self.path = sink.path_for(session_id, filename)
+        self._inner: List[RecordWriter] = []
+        sink._submit(self._open, session_id, filename)
+
+    def _open(self, session_id: str, filename: str) -> None:
+        self._inner.append(self.sink.inner.open_stream(session_id, filename))
+
+    def write_encoded(self, line: bytes) -> None:
+        self.sink._submit(self._write, line)
+
+    def _write(self, line: bytes) -> None:
+        if self._inner:
+            self._inner[0].write_encoded(line)
+
+    def close(self) -> None:
+        self.sink._submit(self._close)
+
+    def _close(self) -> None:
+        if self._inner:
+            self._inner.pop().close()
+
+
+def make_sink(
+    kind: str = ARTIFACT_SINK,
+    encoding: Optional[str] = None,
+    fsync: str = ARTIFACT_FSYNC,
+    background: bool = ARTIFACT_BACKGROUND,
+    base_dir: Path = RUNS_DIR,
+) -> ArtifactSink:
+    """
+    Sink configurado para persistir runs/:
+    - files: runs/<session_id>/<artefacto> (pretty por defecto, layout histórico)
+    - bundle: runs/<session_id>.zip (compact por defecto)
+    Con `background` las escrituras pasan por un thread escritor.
+    """
+    if kind not in ARTIFACT_SINKS:
+        raise ValueError(f"Unknown artifact sink {kind!r} (use one of {ARTIFACT_SINKS})")
+    if fsync not in ARTIFACT_FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy {fsync!r} (use one of {ARTIFACT_FSYNC_POLICIES})")
+    if encoding is not None and encoding not in ARTIFACT_ENCODINGS:
+        raise ValueError(f"Unknown artifact encoding {encoding!r} (use one of {ARTIFACT_ENCODINGS})")
+
+    sink: ArtifactSink
+    if kind == "bundle":
+        sink = BundleSink(base_dir, encoding=encoding or "compact", fsync=fsync)
+    else:
+        sink = FileSink(base_dir, encoding=encoding or ARTIFACT_ENCODING, fsync=fsync)
+    return BackgroundSink(sink) if background else sink
+
+
+def log_agent_output(
+    session_id: str,
+    agent_name: str,
+    payload: Dict[str, Any],
+    sink: Optional[ArtifactSink] = None,
+) -> Optional[Path]:
+    """
+    Guarda un JSON por agente en: runs/<session_id>/<agent_name>.json
+    (o en el sink indicado) y actualiza el índice de runs (app/run_index.py).
+    """
     envelope = {
         "timestamp_utc": utc_now_iso(),
         "session_id": session_id,
         "agent": agent_name,
-        "payload": _to_jsonable(payload),
+        "payload": payload,
     }
 
-    write_json(out_path, envelope)
-    return out_path
+    owned = sink is None
+    sink = sink or FileSink()
+    path = sink.write_json(session_id, agent_name, envelope)
+    if path is not None:
+        sink.index_envelope(envelope)
+        if owned:
+            sink.flush()
+    return path
@@ -1,11 +1,21 @@
 from __future__ import annotations
 
 import argparse
-from uuid import uuid4
 from pathlib import Path
 
-from app.logger import log_agent_output
-from app.agents import analyzer, classifier, reporter
+from app.agents import classifier, reporter
+from app.logger import (
+    ARTIFACT_BACKGROUND,
+    ARTIFACT_ENCODINGS,
+    ARTIFACT_FSYNC,
+    ARTIFACT_FSYNC_POLICIES,
+    ARTIFACT_SINK,
+    ARTIFACT_SINKS,
+    make_sink,
+)
+from app.pipeline import run_pipeline, stream_pipeline
+from app.mcp.backends import MITRE_BACKEND, MITRE_BACKENDS, close_backends
+from app.stage_cache import STAGE_CACHE_ENABLED
 
 
 def read_input_text(path: str | None) -> str:
@@ -17,27 +27,169 @@ def read_input_text(path: str | None) -> str:
     return p.read_text(encoding="utf-8")
 
 
+def prefetch_mitre(backend: str) -> int:
+    try:
+        summary = classifier.prefetch_mitre(backend=backend)
+    finally:
+        close_backends()
+
+    print(f"MITRE cache: {summary['cached']}/{summary['requested']} techniques ({summary['cache']['path']})")
+    if summary["failed"]:
+        print(f"Failed: {', '.join(summary['failed'])}")
+        return 1
+    return 0
+
+
+def batch(source: str, workers: int | None, backend: str, artifacts: dict) -> int:
+    from app.batch import run_batch
+
+    summary = run_batch(source, workers=workers, backend=backend, artifacts=artifacts)
+
+    print(f"Batch: {summary['batch_id']} ({summary['workers']} workers)")
+    print(f"Inputs: {summary['total']} ok={summary['ok']} failed={summary['failed']}")
+    print(f"Wall: {summary['wall_seconds']}s ({summary['throughput_per_s']} inputs/s)")
+    for f in summary["failures"]:
+        print(f" ! {f['id']}: {f['error']}")
+    print(f"Summary: {summary['summary_path']}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+def coverage(source: str, top_k: int, backend: str, artifacts: dict) -> int:
+    from app.coverage import run_coverage
+
+    sink = make_sink(**artifacts)
+    try:
+        summary = run_coverage(source, backend=backend, top_k=top_k, sink=sink)
+    finally:
+        sink.close()
+        close_backends()
+
+    print(f"Coverage: {summary['run_id']}")
+    print(f"Tenants: {summary['tenants']} (failed={summary['failed']}) x detectors: {summary['detectors']}")
+    print(f"Fully covered tenants: {summary['fully_covered_tenants']}")
+    print(f"Wall: {summary['wall_seconds']}s")
+    for f in summary["failures"]:
+        print(f" ! {f['id']}: {f['error']}")
+    print(f"Rankings: {summary['records_path']}")
+    print(f"Summary: {summary['summary_path']}")
+    return 0 if summary["failed"] == 0 else 1
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="MELI DataSec Challenge")
     parser.add_argument("--input", help="Path a un archivo de texto para usar como input", default=None)
+    parser.add_argument(
+        "--prefetch-mitre",
+        action="store_true",
+        help="Precarga en la cache local todas las técnicas de MITRE_ID_MAP y termina",
+    )
+    parser.add_argument(
+        "--mitre-backend",
+        choices=MITRE_BACKENDS,
+        default=MITRE_BACKEND,
+        help="mcp: servidor MCP por HTTP (MCP_URL); local: bundle STIX en memoria (MITRE_STIX_PATH)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Modo streaming: detectores a runs/<session_id>/detectors.ndjson y report.md con el top-k",
+    )
+    parser.add_argument("--top-k", type=int, default=5, help="Detectores en el report.md (--stream) o por tenant (--coverage)")
+    parser.add_argument("--batch", help="Directorio de inputs (*.txt/*.md) o archivo .jsonl", default=None)
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para --batch (default: CPUs)")
+    parser.add_argument(
+        "--no-stage-cache",
+        action="store_true",
+        help="Recalcular todas las etapas (no leer ni escribir la cache de etapas)",
+    )
+    parser.add_argument(
+        "--coverage",
+        help="Modo matriz: catálogo contra todos los tenants (directorio o .jsonl, mismo formato que --batch)",
+        default=None,
+    )
+    parser.add_argument(
+        "--artifacts",
+        choices=ARTIFACT_SINKS,
+        default=ARTIFACT_SINK,
+        help="files: runs/<session_id>/ un archivo por artefacto; bundle: un solo runs/<session_id>.zip",
+    )
+    parser.add_argument(
+        "--artifact-encoding",
+        choices=ARTIFACT_ENCODINGS,
+        default=None,
+        help="JSON pretty (indent=2) o compact (minificado); default: pretty en files, compact en bundle",
+    )
+    parser.add_argument("--fsync", choices=ARTIFACT_FSYNC_POLICIES, default=ARTIFACT_FSYNC, help="Política de fsync")
+    parser.add_argument(
+        "--async-writes",
+        action="store_true",
+        default=ARTIFACT_BACKGROUND,
+        help="Escribir artefactos desde un thread en background (el pipeline no espera al disco)",
+    )
+    parser.add_argument(
+        "--report-formats",
+        default=reporter.REPORT_FORMATS_DEFAULT,
+        help=f"Reports a generar, separados por coma ({','.join(reporter.REPORT_FORMATS)}); --batch usa REPORT_FORMATS",
+    )
+    parser.add_argument(
+        "--no-metrics",
+        action="store_true",
+        help="Sin spans por etapa / lookup MITRE ni runs/<session_id>/metrics.json",
+    )
     args = parser.parse_args()
+    try:
+        report_formats = reporter.parse_formats(args.report_formats)
+    except ValueError as e:
+        parser.error(str(e))
 
-    session_id = uuid4().hex
-    text = read_input_text(args.input)
+    artifacts = {
+        "kind": args.artifacts,
+        "encoding": args.artifact_encoding,
+        "fsync": args.fsync,
+        "background": args.async_writes,
+    }
 
-    analyzer_out = analyzer.run(session_id=session_id, text=text)
-    classifier_out = classifier.run(session_id=session_id, analyzer_out=analyzer_out)
-    reporter_out = reporter.run(session_id=session_id, analyzer_out=analyzer_out, classifier_out=classifier_out)
+    if args.coverage:
+        return coverage(args.coverage, args.top_k, args.mitre_backend, artifacts)
+
+    if args.batch:
+        return batch(args.batch, args.workers, args.mitre_backend, artifacts)
+
+    if args.prefetch_mitre:
+        if args.mitre_backend != "mcp":
+            parser.error("--prefetch-mitre solo aplica al backend mcp (el local no usa cache)")
+        return prefetch_mitre(args.mitre_backend)
+
+    text = read_input_text(args.input)
 
-    p1 = log_agent_output(session_id, "analyzer", analyzer_out)
-    p2 = log_agent_output(session_id, "classifier", classifier_out)
-    p3 = log_agent_output(session_id, "reporter", reporter_out)
+    sink = make_sink(**artifacts)
+    try:
+        if args.stream:
+            result = stream_pipeline(
+                text, backend=args.mitre_backend, sink=sink, top_k=args.top_k, metrics=not args.no_metrics,
+                report_formats=report_formats,
+            )
+        else:
+            result = run_pipeline(
+                text,
+                backend=args.mitre_backend,
+                sink=sink,
+                memoize=STAGE_CACHE_ENABLED and not args.no_stage_cache,
+                metrics=not args.no_metrics,
+                report_formats=report_formats,
+            )
+    finally:
+        sink.close()
+        close_backends()
 
-    print(f"Session: {session_id}")
+    print(f"Session: {result.session_id}")
+    if result.stages:
+        print("Stages: " + ", ".join(f"{name}={'hit' if s['hit'] else 'miss'}" for name, s in result.stages.items()))
+    if result.metrics:
+        print("Timings: " + ", ".join(f"{name}={s['duration_ms']}ms" for name, s in result.metrics["stages"].items()))
     print(f"Logs:")
-    print(f" - {p1}")
-    print(f" - {p2}")
-    print(f" - {p3}")
+    for path in dict.fromkeys(result.artifacts.values()):
+        print(f" - {path}")
 
     return 0
 
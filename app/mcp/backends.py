@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+import sys
+from typing import Any, Callable, Dict, Iterable, Optional, Protocol
+
+MITRE_BACKEND = os.getenv("MITRE_BACKEND", "mcp")
+MITRE_BACKENDS = ("mcp", "local")
+
+# Configuración del cliente MCP. Vive acá (y no en mitre_client.py) para que
+# leerla no cargue el SDK `mcp` ni su stack HTTP: eso pasa recién con el primer lookup remoto.
+MCP_URL = os.getenv("MCP_URL", "http://localhost:8000/mcp")
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "4"))
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "10"))
+MCP_CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "5"))
+MCP_CONCURRENCY = int(os.getenv("MCP_CONCURRENCY", "4"))
+MCP_BATCH_DEADLINE = float(os.getenv("MCP_BATCH_DEADLINE", "30"))
+
+# (technique_id, perf_counter de inicio, segundos, motivo de falla o None)
+LookupCallback = Callable[[str, float, float, Optional[str]], None]
+
+
+class MitreBackend(Protocol):
+    """
+    Interfaz común de los backends MITRE (MitreClient y LocalAttackBackend).
+    `remote` indica si las respuestas pasan por la cache local de técnicas.
+    """
+
+    remote: bool
+
+    def get_technique_by_id(self, technique_id: str) -> Optional[Dict[str, Any]]: ...
+
+    def get_techniques(
+        self,
+        technique_ids: Iterable[str],
+        concurrency: int = MCP_CONCURRENCY,
+        deadline: Optional[float] = MCP_BATCH_DEADLINE,
+        on_lookup: Optional[LookupCallback] = None,
+    ) -> Dict[str, Optional[Dict[str, Any]]]: ...
+
+    def get_neighborhood(
+        self,
+        technique_ids: Iterable[str],
+        deadline: Optional[float] = MCP_BATCH_DEADLINE,
+    ) -> Dict[str, Optional[Dict[str, Any]]]: ...
+
+    def stats_snapshot(self) -> Dict[str, Any]: ...
+
+
+def get_backend(name: Optional[str] = None) -> MitreBackend:
+    """
+    Devuelve el backend MITRE compartido del proceso:
+    - "mcp": MitreClient (servidor MCP por HTTP, con pool de sesiones)
+    - "local": índice ATT&CK en memoria (app/mcp/mitre_server.py), sin red
+    """
+    name = name or MITRE_BACKEND
+    if name == "mcp":
+        from app.mcp.mitre_client import get_client
+        return get_client()
+    if name == "local":
+        from app.mcp.mitre_server import get_local_backend
+        return get_local_backend()
+    raise ValueError(f"Unknown MITRE backend: {name!r} (expected one of {', '.join(MITRE_BACKENDS)})")
+
+
+def close_backends() -> None:
+    """Cierra el pool MCP si se llegó a crear; no importa el cliente si nunca se usó."""
+    client = sys.modules.get("app.mcp.mitre_client")
+    if client is not None:
+        client.close_client()
@@ -1,37 +1,405 @@
 from __future__ import annotations
 
 import asyncio
+import atexit
 import json
-import os
 import logging
-from typing import Any, Dict, Optional
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
 
-from mcp import ClientSession
-from mcp.client.streamable_http import streamable_http_client
+from app.mcp.backends import (
+    MCP_BATCH_DEADLINE,
+    MCP_CALL_TIMEOUT,
+    MCP_CONCURRENCY,
+    MCP_CONNECT_TIMEOUT,
+    MCP_POOL_SIZE,
+    MCP_URL,
+    LookupCallback,
+)
+from app.mcp.resilience import CircuitBreaker, CircuitOpenError
+
+if TYPE_CHECKING:
+    from mcp import ClientSession
 
 logger = logging.getLogger(__name__)
 
-MCP_URL = os.getenv("MCP_URL", "http://localhost:8000/mcp")
 
+class _PooledSession:
+    """
+    Una conexión streamable HTTP + ClientSession ya inicializada.
 
-async def _call_tool_async(tool_name: str, arguments: Dict[str, Any]) -> Any:
-    async with streamable_http_client(MCP_URL) as (read_stream, write_stream, _):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-            return await session.call_tool(tool_name, arguments)
+    Los context managers del transporte usan task groups de anyio, que deben
+    abrirse y cerrarse en la misma task: por eso cada conexión vive en su propia
+    task y solo expone `session` mientras está abierta.
+    """
 
+    def __init__(self, url: str):
+        self.url = url
+        self.session: Optional[ClientSession] = None
+        self.error: Optional[BaseException] = None
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
 
-def get_technique_by_id(technique_id: str) -> Optional[Dict[str, Any]]:
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def open(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if self.session is None:
+            raise self.error or ConnectionError(f"MCP session closed: {self.url}")
+
+    async def _run(self) -> None:
+        # El SDK mcp (httpx, pydantic, jsonschema) tarda ~1s en importarse: se
+        # carga con la primera conexión y no al importar este módulo.
+        from mcp import ClientSession
+        from mcp.client.streamable_http import streamable_http_client
+
+        try:
+            async with streamable_http_client(self.url) as (read_stream, write_stream, _):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    def abort(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=5)
+            except Exception as e:
+                logger.debug("MCP session close failed (%s): %r", self.url, e)
+
+
+class MitreClient:
     """
-    Devuelve un dict con la técnica (ej: {"name": "...", "mitre_id": "T1078", ...})
-    o None si el MCP no está disponible o la respuesta no se puede parsear.
+    Cliente MCP de larga vida: un event loop propio (en un thread daemon) y un
+    pool chico de ClientSession inicializadas que se reutilizan entre llamadas y
+    entre sesiones del pipeline dentro del mismo proceso.
     """
-    try:
-        result = asyncio.run(_call_tool_async("get_technique_by_id", {"technique_id": technique_id}))
-    except Exception as e:
-        logger.debug("MCP call_tool failed for %s (%s): %r", technique_id, MCP_URL, e)
-        return None
 
+    remote = True
+
+    def __init__(
+        self,
+        url: str = MCP_URL,
+        pool_size: int = MCP_POOL_SIZE,
+        call_timeout: float = MCP_CALL_TIMEOUT,
+        connect_timeout: float = MCP_CONNECT_TIMEOUT,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.url = url
+        self.pool_size = max(1, pool_size)
+        self.call_timeout = call_timeout
+        self.connect_timeout = connect_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.stats: Dict[str, int] = {
+            "calls": 0,
+            "handshakes": 0,
+            "reused": 0,
+            "reconnects": 0,
+            "failures": 0,
+            "cancelled": 0,
+            "neighborhoods": 0,
+        }
+        # None hasta la primera llamada; False si el servidor no expone la tool en lote.
+        self.neighborhood_supported: Optional[bool] = None
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._idle: List[_PooledSession] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    # --- event loop ---
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="mitre-mcp-client", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def _submit(self, coro: Any, timeout: Optional[float]) -> Any:
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    # --- pool ---
+
+    async def _acquire(self) -> _PooledSession:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        await self._slots.acquire()
+
+        while self._idle:
+            conn = self._idle.pop()
+            if conn.alive:
+                self.stats["reused"] += 1
+                return conn
+            await conn.close()
+
+        conn = _PooledSession(self.url)
+        try:
+            await asyncio.wait_for(conn.open(), timeout=self.connect_timeout)
+        except BaseException:
+            conn.abort()
+            self._slots.release()
+            raise
+        self.stats["handshakes"] += 1
+        return conn
+
+    def _release(self, conn: _PooledSession, healthy: bool) -> None:
+        if healthy and conn.alive:
+            self._idle.append(conn)
+        else:
+            asyncio.ensure_future(conn.close())
+        if self._slots is not None:
+            self._slots.release()
+
+    async def call_tool_async(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        """
+        Ejecuta una tool MCP sobre una sesión del pool. Si la sesión reutilizada
+        está caída, se descarta y se reintenta una vez con una conexión nueva.
+        Con el breaker abierto falla al instante con CircuitOpenError.
+        """
+        self.stats["calls"] += 1
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"MCP circuit open: {self.url}")
+
+        start = time.perf_counter()
+        try:
+            result = await self._call_with_reconnect(tool_name, arguments)
+        except asyncio.CancelledError:
+            # Cancelada por el deadline del lote o el presupuesto de la sesión: un servidor
+            # sano pero lento no debe abrir el breaker para todo el proceso.
+            self.stats["cancelled"] += 1
+            self.breaker.record_cancelled()
+            raise
+        except BaseException:
+            self.stats["failures"] += 1
+            self.breaker.record_failure(time.perf_counter() - start)
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _call_with_reconnect(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        for attempt in range(2):
+            conn = await self._acquire()
+            healthy = False
+            try:
+                result = await asyncio.wait_for(
+                    conn.session.call_tool(tool_name, arguments),
+                    timeout=self.call_timeout,
+                )
+                healthy = True
+                return result
+            except Exception as e:
+                # Una sesión reutilizada caída se reintenta; un timeout no (el servidor está lento, no la conexión).
+                if attempt == 0 and not isinstance(e, asyncio.TimeoutError):
+                    self.stats["reconnects"] += 1
+                    continue
+                raise
+            finally:
+                self._release(conn, healthy)
+
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        # Margen para handshake + reintento por sobre el timeout de la tool.
+        timeout = (self.connect_timeout + self.call_timeout) * 2 + 1
+        return self._submit(self.call_tool_async(tool_name, arguments), timeout=timeout)
+
+    def get_technique_by_id(self, technique_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve un dict con la técnica (ej: {"name": "...", "mitre_id": "T1078", ...})
+        o None si el MCP no está disponible o la respuesta no se puede parsear.
+        """
+        try:
+            result = self.call_tool("get_technique_by_id", {"technique_id": technique_id})
+        except Exception as e:
+            logger.debug("MCP call_tool failed for %s (%s): %r", technique_id, self.url, e)
+            return None
+        return parse_technique_result(result, technique_id)
+
+    async def get_techniques_async(
+        self,
+        technique_ids: Iterable[str],
+        concurrency: int = MCP_CONCURRENCY,
+        deadline: Optional[float] = MCP_BATCH_DEADLINE,
+        on_lookup: Optional[LookupCallback] = None,
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Resuelve un lote de técnicas en paralelo (IDs deduplicados), con a lo sumo
+        `concurrency` llamadas en vuelo. Lo que no termina antes de `deadline`
+        segundos se cancela y queda en None, igual que una falla de lookup.
+        `on_lookup(tid, start, seconds, reason)` se llama al terminar cada técnica
+        (reason None si resolvió), desde el thread del loop.
+        """
+        ids = list(dict.fromkeys(technique_ids))
+        slots = asyncio.Semaphore(max(1, concurrency))
+
+        async def _one(tid: str) -> Optional[Dict[str, Any]]:
+            start = time.perf_counter()
+            reason: Optional[str] = None
+            try:
+                async with slots:
+                    try:
+                        result = await self.call_tool_async("get_technique_by_id", {"technique_id": tid})
+                    except Exception as e:
+                        logger.debug("MCP call_tool failed for %s (%s): %r", tid, self.url, e)
+                        reason = _failure_reason(e)
+                        return None
+                info = parse_technique_result(result, tid)
+                if info is None:
+                    reason = "unparseable"
+                return info
+            except asyncio.CancelledError:
+                reason = "deadline"
+                raise
+            finally:
+                if on_lookup is not None:
+                    on_lookup(tid, start, time.perf_counter() - start, reason)
+
+        tasks = {tid: asyncio.create_task(_one(tid)) for tid in ids}
+        if not tasks:
+            return {}
+
+        _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.debug("MCP batch deadline (%ss) hit, %d lookups cancelled", deadline, len(pending))
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        return {
+            tid: task.result() if task.done() and not task.cancelled() else None
+            for tid, task in tasks.items()
+        }
+
+    def get_techniques(
+        self,
+        technique_ids: Iterable[str],
+        concurrency: int = MCP_CONCURRENCY,
+        deadline: Optional[float] = MCP_BATCH_DEADLINE,
+        on_lookup: Optional[LookupCallback] = None,
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        ids = list(dict.fromkeys(technique_ids))
+        coro = self.get_techniques_async(ids, concurrency=concurrency, deadline=deadline, on_lookup=on_lookup)
+        try:
+            return self._submit(coro, timeout=None if deadline is None else deadline + 5)
+        except Exception as e:
+            logger.debug("MCP batch lookup failed (%s): %r", self.url, e)
+            return {tid: None for tid in ids}
+
+    def get_neighborhood(
+        self,
+        technique_ids: Iterable[str],
+        deadline: Optional[float] = MCP_BATCH_DEADLINE,
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Relaciones de un lote de técnicas (tácticas, sub-técnicas, mitigaciones) en
+        una sola llamada a la tool `get_attack_neighborhood`. Devuelve {} si el MCP
+        no responde o no tiene la tool (mitre-mcp upstream); en ese caso no se
+        vuelve a intentar en este proceso.
+        """
+        ids = list(dict.fromkeys(technique_ids))
+        if not ids or self.neighborhood_supported is False:
+            return {}
+
+        async def _call() -> Any:
+            return await asyncio.wait_for(
+                self.call_tool_async("get_attack_neighborhood", {"technique_ids": ids}), timeout=deadline
+            )
+
+        self.stats["neighborhoods"] += 1
+        try:
+            result = self._submit(_call(), timeout=None if deadline is None else deadline + 5)
+        except Exception as e:
+            logger.debug("MCP neighborhood lookup failed (%s): %r", self.url, e)
+            return {}
+        if getattr(result, "isError", False):
+            content = getattr(result, "content", None) or []
+            text = getattr(content[0], "text", "") if content else ""
+            if "unknown tool" in str(text).lower():
+                logger.info("MCP server %s has no get_attack_neighborhood tool, ATT&CK graph disabled", self.url)
+                self.neighborhood_supported = False
+            else:
+                logger.debug("MCP neighborhood lookup error (%s): %s", self.url, str(text)[:200])
+            return {}
+
+        self.neighborhood_supported = True
+        obj = _json_payload(result, "get_attack_neighborhood")
+        hoods = obj.get("neighborhoods") if isinstance(obj, dict) else None
+        if not isinstance(hoods, dict):
+            return {}
+        return {tid: hoods.get(tid) if isinstance(hoods.get(tid), dict) else None for tid in ids}
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, pool_size=self.pool_size, idle=len(self._idle), breaker=self.breaker.snapshot())
+
+    # --- lifecycle ---
+
+    async def _close_all(self) -> None:
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+
+    def close(self) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            self._submit(self._close_all(), timeout=10)
+        except Exception as e:
+            logger.debug("MCP pool shutdown failed: %r", e)
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        loop.close()
+        self._loop, self._thread, self._slots = None, None, None
+
+
+def _failure_reason(e: BaseException) -> str:
+    # Los errores del transporte llegan envueltos en ExceptionGroup (task groups de anyio).
+    while isinstance(e, BaseExceptionGroup) and e.exceptions:
+        e = e.exceptions[0]
+    if isinstance(e, CircuitOpenError):
+        return "circuit_open"
+    return type(e).__name__
+
+
+def _json_payload(result: Any, what: str) -> Any:
+    """Primer bloque de texto de un CallToolResult decodificado como JSON (None si no se puede)."""
+    content = getattr(result, "content", None)
+    if isinstance(content, list) and content:
+        text = getattr(content[0], "text", None)
+        if isinstance(text, str) and text.strip():
+            try:
+                return json.loads(text)
+            except json.JSONDecodeError:
+                logger.debug("MCP returned non-JSON text for %s: %r", what, text[:200])
+    return None
+
+
+def parse_technique_result(result: Any, technique_id: str) -> Optional[Dict[str, Any]]:
     content = getattr(result, "content", None)
 
     if isinstance(content, list) and content:
@@ -39,23 +407,50 @@ def get_technique_by_id(technique_id: str) -> Optional[Dict[str, Any]]:
         text = getattr(first, "text", None)
 
         if isinstance(text, str) and text.strip():
-            try:
-                obj = json.loads(text)
+            obj = _json_payload(result, technique_id)
+            if isinstance(obj, dict):
+                technique = obj.get("technique")
+                if isinstance(technique, dict):
+                    return technique
+                # {"error": "... not found"}: es una falla, no una técnica (no debe ir a la cache).
+                if "error" in obj:
+                    logger.debug("MCP error for %s: %r", technique_id, obj["error"])
+                    return None
+                return obj
+            return None
 
-                if isinstance(obj, dict):
-                    technique = obj.get("technique")
-                    if isinstance(technique, dict):
-                        return technique
-                    return obj
-
-            except json.JSONDecodeError:
-                logger.debug("MCP returned non-JSON text for %s: %r", technique_id, text[:200])
-                return None
-
-        if isinstance(first, dict):
+        if isinstance(first, dict) and "error" not in first:
             return first
 
-    if isinstance(content, dict):
+    if isinstance(content, dict) and "error" not in content:
         return content
 
     return None
+
+
+_client: Optional[MitreClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> MitreClient:
+    """Cliente compartido por proceso (se cierra al salir del intérprete)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MitreClient()
+            atexit.register(_client.close)
+        return _client
+
+
+def close_client() -> None:
+    """Cierra el pool compartido (antes de que el intérprete apague sus executors)."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        atexit.unregister(client.close)
+        client.close()
+
+
+def get_technique_by_id(technique_id: str) -> Optional[Dict[str, Any]]:
+    return get_client().get_technique_by_id(technique_id)
@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+MITRE_STIX_PATH = os.getenv("MITRE_STIX_PATH", str(PROJECT_ROOT / "data" / "enterprise-attack.json"))
+MITRE_STIX_URL = os.getenv(
+    "MITRE_STIX_URL",
+    "https://raw.githubusercontent.com/mitre/cti/master/enterprise-attack/enterprise-attack.json",
+)
+
+
+class Technique(NamedTuple):
+    id: str
+    name: str
+    description: str
+    tactics: Tuple[str, ...]
+    platforms: Tuple[str, ...]
+    parent: Optional[str]
+    url: str
+
+
+class Tactic(NamedTuple):
+    id: str
+    name: str
+    shortname: str
+
+
+class Mitigation(NamedTuple):
+    id: str
+    name: str
+
+
+def _external_id(obj: Dict[str, Any]) -> Tuple[Optional[str], str]:
+    for ref in obj.get("external_references") or []:
+        if ref.get("source_name") == "mitre-attack" and ref.get("external_id"):
+            return ref["external_id"], ref.get("url", "")
+    return None, ""
+
+
+class AttackIndex:
+    """
+    Índice en memoria de un bundle STIX de ATT&CK Enterprise.
+
+    Se arma una sola vez y guarda solo lo que consultan las tools: técnicas
+    (incluye sub-técnicas), tácticas, mitigaciones y las relaciones
+    subtechnique-of / mitigates como listas de adyacencia por ID externo.
+    El bundle crudo se descarta después de indexar.
+    """
+
+    def __init__(self) -> None:
+        self.attack_version: str = ""
+        self.techniques: Dict[str, Technique] = {}
+        self.tactics: Dict[str, Tactic] = {}
+        self.mitigations: Dict[str, Mitigation] = {}
+        self.subtechniques: Dict[str, List[str]] = {}
+        self.mitigated_by: Dict[str, List[str]] = {}
+        self.by_tactic: Dict[str, List[str]] = {}
+        self.build_seconds: float = 0.0
+
+    @classmethod
+    def from_file(cls, path: str = MITRE_STIX_PATH) -> "AttackIndex":
+        p = Path(path)
+        if not p.exists():
+            raise FileNotFoundError(
+                f"Missing ATT&CK STIX bundle: {p} (python -m app.mcp.mitre_server --download)"
+            )
+        with p.open("r", encoding="utf-8") as f:
+            bundle = json.load(f)
+        return cls.from_bundle(bundle)
+
+    @classmethod
+    def from_bundle(cls, bundle: Dict[str, Any]) -> "AttackIndex":
+        start = time.perf_counter()
+        idx = cls()
+        stix_to_ext: Dict[str, str] = {}
+        relationships: List[Tuple[str, str, str]] = []
+
+        for obj in bundle.get("objects", []):
+            otype = obj.get("type")
+
+            if otype == "relationship":
+                rtype = obj.get("relationship_type")
+                if rtype in ("subtechnique-of", "mitigates") and not obj.get("revoked"):
+                    relationships.append((rtype, obj.get("source_ref", ""), obj.get("target_ref", "")))
+                continue
+
+            if otype == "x-mitre-collection":
+                idx.attack_version = obj.get("x_mitre_version", idx.attack_version)
+                continue
+
+            if otype not in ("attack-pattern", "x-mitre-tactic", "course-of-action"):
+                continue
+            if obj.get("revoked") or obj.get("x_mitre_deprecated"):
+                continue
+
+            ext_id, url = _external_id(obj)
+            if not ext_id:
+                continue
+            ext_id = sys.intern(ext_id)
+            stix_to_ext[obj["id"]] = ext_id
+
+            if otype == "attack-pattern":
+                tactics = tuple(
+                    sys.intern(p["phase_name"])
+                    for p in obj.get("kill_chain_phases") or []
+                    if p.get("kill_chain_name") == "mitre-attack"
+                )
+                idx.techniques[ext_id] = Technique(
+                    id=ext_id,
+                    name=obj.get("name", ""),
+                    description=obj.get("description", ""),
+                    tactics=tactics,
+                    platforms=tuple(sys.intern(p) for p in obj.get("x_mitre_platforms") or []),
+                    parent=ext_id.split(".")[0] if obj.get("x_mitre_is_subtechnique") else None,
+                    url=url,
+                )
+                for shortname in tactics:
+                    idx.by_tactic.setdefault(shortname, []).append(ext_id)
+            elif otype == "x-mitre-tactic":
+                shortname = sys.intern(obj.get("x_mitre_shortname", ""))
+                idx.tactics[shortname] = Tactic(id=ext_id, name=obj.get("name", ""), shortname=shortname)
+            else:
+                idx.mitigations[ext_id] = Mitigation(id=ext_id, name=obj.get("name", ""))
+
+        for rtype, source, target in relationships:
+            src, dst = stix_to_ext.get(source), stix_to_ext.get(target)
+            if not src or not dst:
+                continue
+            if rtype == "subtechnique-of":
+                idx.subtechniques.setdefault(dst, []).append(src)
+            else:
+                idx.mitigated_by.setdefault(dst, []).append(src)
+
+        for ids in (*idx.subtechniques.values(), *idx.mitigated_by.values(), *idx.by_tactic.values()):
+            ids.sort()
+
+        idx.build_seconds = time.perf_counter() - start
+        return idx
+
+    # --- queries (misma superficie que las tools MCP) ---
+
+    def get_technique_by_id(self, technique_id: str) -> Optional[Dict[str, Any]]:
+        t = self.techniques.get(technique_id.strip().upper())
+        if t is None:
+            return None
+        return {
+            "id": t.id,
+            "name": t.name,
+            "description": t.description,
+            "tactics": list(t.tactics),
+            "platforms": list(t.platforms),
+            "is_subtechnique": t.parent is not None,
+            "parent": t.parent,
+            "url": t.url,
+        }
+
+    def get_subtechniques(self, technique_id: str) -> List[Dict[str, str]]:
+        return [
+            {"id": sid, "name": self.techniques[sid].name}
+            for sid in self.subtechniques.get(technique_id.strip().upper(), [])
+        ]
+
+    def get_mitigations(self, technique_id: str) -> List[Dict[str, str]]:
+        return [
+            {"id": mid, "name": self.mitigations[mid].name}
+            for mid in self.mitigated_by.get(technique_id.strip().upper(), [])
+        ]
+
+    def get_tactics(self) -> List[Dict[str, str]]:
+        return [t._asdict() for t in self.tactics.values()]
+
+    def get_neighborhood(self, technique_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Técnica + sus relaciones directas en un solo objeto: tácticas, sub-técnicas
+        (o técnica padre) y mitigaciones, cada una con su nombre.
+        """
+        tid = technique_id.strip().upper()
+        t = self.techniques.get(tid)
+        if t is None:
+            return None
+        parent = self.techniques.get(t.parent) if t.parent else None
+        return {
+            "technique": {"id": t.id, "name": t.name},
+            "parent": {"id": parent.id, "name": parent.name} if parent else None,
+            "tactics": [self.tactics[s]._asdict() for s in t.tactics if s in self.tactics],
+            "subtechniques": self.get_subtechniques(tid),
+            "mitigations": self.get_mitigations(tid),
+        }
+
+    def get_techniques_by_tactic(self, tactic: str) -> List[Dict[str, str]]:
+        return [
+            {"id": tid, "name": self.techniques[tid].name}
+            for tid in self.by_tactic.get(tactic.strip().lower(), [])
+        ]
+
+
+class LocalAttackBackend:
+    """Backend MITRE en proceso: misma interfaz de lote que MitreClient, sin red."""
+
+    remote = False
+
+    def __init__(self, path: str = MITRE_STIX_PATH):
+        self.path = path
+        self._index: Optional[AttackIndex] = None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"lookups": 0, "misses": 0, "neighborhoods": 0}
+
+    @property
+    def index(self) -> AttackIndex:
+        with self._lock:
+            if self._index is None:
+                self._index = AttackIndex.from_file(self.path)
+                logger.debug("ATT&CK index built in %.3fs (%d techniques)",
+                             self._index.build_seconds, len(self._index.techniques))
+            return self._index
+
+    def get_technique_by_id(self, technique_id: str) -> Optional[Dict[str, Any]]:
+        self.stats["lookups"] += 1
+        info = self.index.get_technique_by_id(technique_id)
+        if info is None:
+            self.stats["misses"] += 1
+        return info
+
+    def get_techniques(
+        self,
+        technique_ids: Iterable[str],
+        on_lookup: Optional[Callable[[str, float, float, Optional[str]], None]] = None,
+        **_: Any,
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        ids = list(dict.fromkeys(technique_ids))
+        try:
+            self.index
+        except (OSError, ValueError) as e:
+            logger.warning("Local ATT&CK backend unavailable: %s", e)
+            return {tid: None for tid in ids}
+        if on_lookup is None:
+            return {tid: self.get_technique_by_id(tid) for tid in ids}
+
+        out: Dict[str, Optional[Dict[str, Any]]] = {}
+        for tid in ids:
+            start = time.perf_counter()
+            out[tid] = self.get_technique_by_id(tid)
+            on_lookup(tid, start, time.perf_counter() - start, None if out[tid] else "not_found")
+        return out
+
+    def get_neighborhood(self, technique_ids: Iterable[str], **_: Any) -> Dict[str, Optional[Dict[str, Any]]]:
+        ids = list(dict.fromkeys(technique_ids))
+        try:
+            index = self.index
+        except (OSError, ValueError) as e:
+            logger.warning("Local ATT&CK backend unavailable: %s", e)
+            return {}
+        self.stats["neighborhoods"] += 1
+        return {tid: index.get_neighborhood(tid) for tid in ids}
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        snapshot: Dict[str, Any] = dict(self.stats, backend="local")
+        if self._index is not None:
+            snapshot["attack_version"] = self._index.attack_version
+            snapshot["index_build_s"] = round(self._index.build_seconds, 4)
+        return snapshot
+
+
+_backend: Optional[LocalAttackBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_local_backend() -> LocalAttackBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = LocalAttackBackend()
+        return _backend
+
+
+def download_bundle(path: str = MITRE_STIX_PATH, url: str = MITRE_STIX_URL) -> Path:
+    from urllib.request import urlopen
+
+    out = Path(path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(out.suffix + ".tmp")
+    with urlopen(url, timeout=120) as resp, tmp.open("wb") as f:
+        while chunk := resp.read(1 << 20):
+            f.write(chunk)
+    tmp.replace(out)
+    return out
+
+
+def build_mcp_server(index: AttackIndex, host: str = "localhost", port: int = 8000) -> Any:
+    """
+    Expone el índice por MCP con las mismas tools que consume el pipeline
+    (get_technique_by_id devuelve {"technique": {...}} como mitre-mcp).
+    """
+    from mcp.server.fastmcp import FastMCP
+
+    server = FastMCP("mitre-attack-local", host=host, port=port)
+
+    @server.tool()
+    def get_technique_by_id(technique_id: str) -> str:
+        """Get a MITRE ATT&CK technique (or sub-technique) by its ID, e.g. T1078."""
+        technique = index.get_technique_by_id(technique_id)
+        if technique is None:
+            return json.dumps({"error": f"Technique {technique_id} not found"})
+        return json.dumps({"technique": technique}, ensure_ascii=False)
+
+    @server.tool()
+    def get_subtechniques(technique_id: str) -> str:
+        """List the sub-techniques of a MITRE ATT&CK technique."""
+        return json.dumps({"subtechniques": index.get_subtechniques(technique_id)}, ensure_ascii=False)
+
+    @server.tool()
+    def get_mitigations(technique_id: str) -> str:
+        """List the mitigations that address a MITRE ATT&CK technique."""
+        return json.dumps({"mitigations": index.get_mitigations(technique_id)}, ensure_ascii=False)
+
+    @server.tool()
+    def get_attack_neighborhood(technique_ids: List[str]) -> str:
+        """Bulk lookup: for each technique ID, its tactics, sub-techniques (or parent) and mitigations."""
+        return json.dumps(
+            {"neighborhoods": {tid: index.get_neighborhood(tid) for tid in dict.fromkeys(technique_ids)}},
+            ensure_ascii=False,
+        )
+
+    @server.tool()
+    def get_tactics() -> str:
+        """List all MITRE ATT&CK Enterprise tactics."""
+        return json.dumps({"tactics": index.get_tactics()}, ensure_ascii=False)
+
+    @server.tool()
+    def get_techniques_by_tactic(tactic: str) -> str:
+        """List techniques for a tactic shortname, e.g. initial-access."""
+        return json.dumps({"techniques": index.get_techniques_by_tactic(tactic)}, ensure_ascii=False)
+
+    return server
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="MITRE ATT&CK local MCP server")
+    parser.add_argument("--stix", default=MITRE_STIX_PATH, help="Path al bundle STIX enterprise-attack.json")
+    parser.add_argument("--download", action="store_true", help="Descarga el bundle STIX desde MITRE CTI")
+    parser.add_argument("--serve", action="store_true", help="Con --download: después de descargar, servir por stdio")
+    parser.add_argument("--http", action="store_true", help="Transporte streamable HTTP (default: stdio)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.download:
+        # stderr: en modo stdio, stdout es el canal JSON-RPC del MCP.
+        print(f"Downloaded: {download_bundle(args.stix)}", file=sys.stderr)
+        if not (args.serve or args.http):
+            return 0
+
+    index = AttackIndex.from_file(args.stix)
+    print(
+        f"ATT&CK {index.attack_version or '?'}: {len(index.techniques)} techniques, "
+        f"{len(index.tactics)} tactics, {len(index.mitigations)} mitigations "
+        f"(indexed in {index.build_seconds:.3f}s)",
+        file=sys.stderr,
+    )
+
+    server = build_mcp_server(index, host=args.host, port=args.port)
+    server.run("streamable-http" if args.http else "stdio")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+MCP_BREAKER_THRESHOLD = int(os.getenv("MCP_BREAKER_THRESHOLD", "3"))
+MCP_BREAKER_COOLDOWN = float(os.getenv("MCP_BREAKER_COOLDOWN", "30"))
+MCP_SESSION_BUDGET = float(os.getenv("MCP_SESSION_BUDGET", "10"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """La llamada no se intentó: el breaker está abierto (MCP caído hace poco)."""
+
+
+class CircuitBreaker:
+    """
+    Breaker de fallas consecutivas para el backend MCP.
+
+    - closed: todas las llamadas pasan; `threshold` fallas seguidas lo abren.
+    - open: las llamadas fallan al instante (CircuitOpenError) durante `cooldown` segundos.
+    - half_open: pasado el cooldown se deja pasar una sola llamada de prueba; si
+      resuelve se cierra, si falla vuelve a abrirse otro cooldown.
+
+    Cada llamada cortada suma al ahorro estimado el promedio de lo que tardaron
+    las fallas reales (lo que habría costado intentarla).
+    """
+
+    def __init__(self, threshold: int = MCP_BREAKER_THRESHOLD, cooldown: float = MCP_BREAKER_COOLDOWN):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.stats: Dict[str, Any] = {"trips": 0, "short_circuited": 0, "probes": 0}
+        self._failure_seconds = 0.0
+        self._failures_timed = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - (self.opened_at or 0.0) >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self.stats["probes"] += 1
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self, seconds: float = 0.0) -> None:
+        with self._lock:
+            self._failure_seconds += seconds
+            self._failures_timed += 1
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.stats["trips"] += 1
+            self._probe_in_flight = False
+
+    def record_cancelled(self) -> None:
+        """
+        Llamada cancelada por nosotros (deadline del lote, presupuesto de la sesión):
+        no dice nada del servidor. No cuenta como falla; si era la prueba de
+        half_open, la libera para que la próxima llamada vuelva a probar.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    @property
+    def estimated_saved_s(self) -> float:
+        if not self._failures_timed:
+            return 0.0
+        return self.stats["short_circuited"] * self._failure_seconds / self._failures_timed
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot: Dict[str, Any] = dict(
+                self.stats,
+                state=self.state,
+                consecutive_failures=self.consecutive_failures,
+                threshold=self.threshold,
+                cooldown_s=self.cooldown,
+            )
+            if self.state != CLOSED and self.opened_at is not None:
+                snapshot["retry_in_s"] = round(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)), 3)
+        snapshot["est_time_saved_s"] = round(self.estimated_saved_s, 3)
+        return snapshot
+
+
+class EnrichmentBudget:
+    """
+    Tiempo total que una sesión puede gastar en lookups MITRE remotos. Cada lote
+    usa como deadline lo que queda; agotado, el Classifier no llama más al backend
+    y resuelve con la cache (aunque esté vencida) o "Unknown".
+    """
+
+    def __init__(self, seconds: Optional[float] = MCP_SESSION_BUDGET):
+        # None o <= 0: sin presupuesto (solo aplica el deadline de cada lote).
+        self.seconds = seconds if seconds is not None and seconds > 0 else None
+        self.started = time.monotonic()
+        self.skipped = 0
+
+    def remaining(self) -> Optional[float]:
+        if self.seconds is None:
+            return None
+        return max(0.0, self.seconds - (time.monotonic() - self.started))
+
+    @property
+    def exhausted(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def deadline(self, deadline: Optional[float]) -> Optional[float]:
+        """El menor entre el deadline del lote y lo que queda del presupuesto."""
+        remaining = self.remaining()
+        if remaining is None:
+            return deadline
+        return remaining if deadline is None else min(deadline, remaining)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "budget_s": self.seconds,
+            "spent_s": round(time.monotonic() - self.started, 3),
+            "exhausted": self.exhausted,
+            "skipped_lookups": self.skipped,
+        }
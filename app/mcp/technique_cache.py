@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+MITRE_CACHE_PATH = os.getenv("MITRE_CACHE_PATH", str(PROJECT_ROOT / ".cache" / "mitre_techniques.sqlite"))
+MITRE_ATTACK_VERSION = os.getenv("MITRE_ATTACK_VERSION", "17")
+MITRE_CACHE_TTL = float(os.getenv("MITRE_CACHE_TTL", str(30 * 24 * 3600)))
+MITRE_CACHE_MAX_ENTRIES = int(os.getenv("MITRE_CACHE_MAX_ENTRIES", "5000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS techniques (
+    technique_id   TEXT NOT NULL,
+    attack_version TEXT NOT NULL,
+    payload        TEXT NOT NULL,
+    fetched_at     REAL NOT NULL,
+    last_access    REAL NOT NULL,
+    PRIMARY KEY (technique_id, attack_version)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS techniques_lru ON techniques (last_access);
+"""
+
+
+class TechniqueCache:
+    """
+    Cache local de técnicas MITRE en SQLite (modo WAL), por (technique_id, ATT&CK version).
+
+    - TTL: las entradas más viejas que `ttl` segundos cuentan como miss, pero no se
+      borran: siguen disponibles para get_stale() cuando el backend falla.
+    - LRU: al escribir se recorta a `max_entries` por último acceso (lo que acota la tabla).
+    - WAL + busy_timeout permiten lectores concurrentes desde varios procesos.
+    """
+
+    def __init__(
+        self,
+        path: str = MITRE_CACHE_PATH,
+        attack_version: str = MITRE_ATTACK_VERSION,
+        ttl: float = MITRE_CACHE_TTL,
+        max_entries: int = MITRE_CACHE_MAX_ENTRIES,
+    ):
+        self.path = Path(path)
+        self.attack_version = attack_version
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, technique_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Devuelve solo los hits vigentes; lo que falta es miss."""
+        ids = list(dict.fromkeys(technique_ids))
+        if not ids:
+            return {}
+
+        now = time.time()
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                f"SELECT technique_id, payload FROM techniques "
+                f"WHERE attack_version = ? AND fetched_at >= ? AND technique_id IN ({placeholders})",
+                [self.attack_version, now - self.ttl, *ids],
+            ).fetchall()
+
+            found: Dict[str, Dict[str, Any]] = {}
+            for tid, payload in rows:
+                try:
+                    found[tid] = json.loads(payload)
+                except json.JSONDecodeError:
+                    logger.debug("Corrupt cache entry for %s, ignoring", tid)
+
+            if found:
+                conn.executemany(
+                    "UPDATE techniques SET last_access = ? WHERE technique_id = ? AND attack_version = ?",
+                    [(now, tid, self.attack_version) for tid in found],
+                )
+
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(ids) - len(found)
+        return found
+
+    def get_stale(self, technique_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Entradas de la versión actual aunque hayan vencido: fallback cuando el
+        backend no responde (mejor un nombre viejo que "Unknown").
+        """
+        ids = list(dict.fromkeys(technique_ids))
+        if not ids:
+            return {}
+
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT technique_id, payload FROM techniques "
+                f"WHERE attack_version = ? AND technique_id IN ({placeholders})",
+                [self.attack_version, *ids],
+            ).fetchall()
+
+        found: Dict[str, Dict[str, Any]] = {}
+        for tid, payload in rows:
+            try:
+                found[tid] = json.loads(payload)
+            except json.JSONDecodeError:
+                logger.debug("Corrupt cache entry for %s, ignoring", tid)
+        return found
+
+    def put_many(self, techniques: Dict[str, Dict[str, Any]]) -> None:
+        if not techniques:
+            return
+
+        now = time.time()
+        rows = [
+            (tid, self.attack_version, json.dumps(info, ensure_ascii=False, separators=(",", ":")), now, now)
+            for tid, info in techniques.items()
+        ]
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("INSERT OR REPLACE INTO techniques VALUES (?, ?, ?, ?, ?)", rows)
+                evicted = self._evict_lru(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.stats["writes"] += len(rows)
+            self.stats["evictions"] += evicted
+
+    def _evict_lru(self, conn: sqlite3.Connection) -> int:
+        (count,) = conn.execute("SELECT COUNT(*) FROM techniques").fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return 0
+        victims = conn.execute(
+            "SELECT technique_id, attack_version FROM techniques ORDER BY last_access ASC LIMIT ?",
+            (excess,),
+        ).fetchall()
+        conn.executemany("DELETE FROM techniques WHERE technique_id = ? AND attack_version = ?", victims)
+        return len(victims)
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, attack_version=self.attack_version, path=str(self.path))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_cache: Optional[TechniqueCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TechniqueCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TechniqueCache()
+        return _cache
@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.logger import utc_now_iso
+
+METRICS_ENABLED = os.getenv("METRICS", "1").lower() not in ("0", "false", "no", "off")
+
+# Límites (segundos) de los histogramas, estilo Prometheus (le = "less or equal").
+LATENCY_BUCKETS: Tuple[float, ...] = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_HELP = {
+    "pipeline_runs_total": ("counter", "Pipeline runs traced"),
+    "pipeline_stage_seconds": ("histogram", "Wall time per pipeline stage"),
+    "mitre_lookups_total": ("counter", "MITRE technique lookups by cache outcome and result"),
+    "mitre_lookup_seconds": ("histogram", "Latency of MITRE technique lookups that reached the backend"),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Span:
+    __slots__ = ("name", "start", "duration", "attrs")
+
+    def __init__(self, name: str, start: float, attrs: Dict[str, Any]):
+        self.name = name
+        self.start = start
+        self.duration = 0.0
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            **{k: v for k, v in self.attrs.items() if v is not None},
+        }
+
+
+class Trace:
+    """
+    Spans de una sesión del pipeline: una por etapa ("stage") y una por técnica
+    MITRE resuelta ("mitre.lookup": latencia, hit/miss de cache, motivo de falla).
+    Se puede alimentar desde otros threads (lookups en el loop del cliente MCP).
+    """
+
+    enabled = True
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.started_at = utc_now_iso()
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Span]:
+        s = Span(name, time.perf_counter(), attrs)
+        try:
+            yield s
+        except BaseException as e:
+            s.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            s.duration = time.perf_counter() - s.start
+            with self._lock:
+                self.spans.append(s)
+
+    def add(self, name: str, start: float, duration: float, **attrs: Any) -> None:
+        """Span medido por fuera (ej: callback de un lookup ya terminado)."""
+        s = Span(name, start, attrs)
+        s.duration = duration
+        with self._lock:
+            self.spans.append(s)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        records = [s.to_dict(self.origin) for s in spans]
+
+        stages = {
+            r["stage"]: {k: r[k] for k in ("duration_ms", "cache") if k in r}
+            for r in records if r["name"] == "stage"
+        }
+        lookups = [r for r in records if r["name"] == "mitre.lookup"]
+        return {
+            "session_id": self.session_id,
+            "started_at_utc": self.started_at,
+            "wall_ms": round((time.perf_counter() - self.origin) * 1000, 3),
+            "stages": stages,
+            "mitre": {
+                "lookups": len(lookups),
+                "cache_hits": sum(1 for r in lookups if r.get("cache") == "hit"),
+                "failures": sum(1 for r in lookups if r.get("result") == "fail"),
+                "by_technique": {
+                    r["technique"]: {k: v for k, v in r.items() if k not in ("name", "technique", "start_ms")}
+                    for r in lookups
+                },
+            },
+            "spans": records,
+        }
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _NullTrace(Trace):
+    """Instrumentación desactivada: mismas llamadas, sin medir ni guardar nada."""
+
+    enabled = False
+
+    def __init__(self) -> None:
+        self.session_id = ""
+        self.spans = []
+
+    def span(self, name: str, **attrs: Any) -> Any:  # type: ignore[override]
+        return _NULL_SPAN
+
+    def add(self, name: str, start: float, duration: float, **attrs: Any) -> None:
+        pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {}
+
+
+NULL_TRACE: Trace = _NullTrace()
+
+_current: contextvars.ContextVar[Trace] = contextvars.ContextVar("trace", default=NULL_TRACE)
+
+
+def current_trace() -> Trace:
+    return _current.get()
+
+
+@contextmanager
+def use_trace(trace: Trace) -> Iterator[Trace]:
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def new_trace(session_id: str, enabled: bool = METRICS_ENABLED) -> Trace:
+    return Trace(session_id) if enabled else NULL_TRACE
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, le in enumerate(self.buckets):
+            if value <= le:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        out, acc = [], 0
+        for c in self.counts:
+            acc += c
+            out.append(acc)
+        return out
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class MetricsRegistry:
+    """
+    Contadores e histogramas con labels, agregados a partir de traces. Se exporta
+    como dict (metrics.json) o en el formato de texto de Prometheus.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(self.buckets)
+            hist.observe(value)
+
+    def record_trace(self, trace: Dict[str, Any]) -> None:
+        """Agrega un trace ya serializado (Trace.to_dict(), también el que devuelve un worker de batch)."""
+        if not trace:
+            return
+        self.inc("pipeline_runs_total")
+        for span in trace.get("spans", []):
+            seconds = span["duration_ms"] / 1000
+            if span["name"] == "stage":
+                self.observe("pipeline_stage_seconds", seconds, stage=span["stage"], cache=span.get("cache"))
+            elif span["name"] == "mitre.lookup":
+                self.inc(
+                    "mitre_lookups_total",
+                    technique=span["technique"],
+                    backend=span.get("backend"),
+                    cache=span.get("cache"),
+                    result=span.get("result"),
+                )
+                if span.get("cache") != "hit":
+                    self.observe(
+                        "mitre_lookup_seconds", seconds, technique=span["technique"], backend=span.get("backend")
+                    )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(k), "value": v} for k, v in series.items()]
+                for name, series in self.counters.items()
+            }
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(k),
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "buckets": {_fmt_value(le): c for le, c in zip(h.buckets, h.cumulative())},
+                    }
+                    for k, h in series.items()
+                ]
+                for name, series in self.histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                kind, help_text = _HELP.get(name, ("counter", name))
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_fmt_labels(key)} {_fmt_value(value)}")
+            for name, series in sorted(self.histograms.items()):
+                kind, help_text = _HELP.get(name, ("histogram", name))
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for key, h in sorted(series.items()):
+                    for le, c in zip(h.buckets + (math.inf,), h.cumulative() + [h.count]):
+                        lines.append(f"{name}_bucket{_fmt_labels(key, ('le', _fmt_value(le)))} {c}")
+                    lines.append(f"{name}_sum{_fmt_labels(key)} {_fmt_value(round(h.sum, 6))}")
+                    lines.append(f"{name}_count{_fmt_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> MetricsRegistry:
+    """Registro del proceso (lo que expone /metrics en el modo servicio)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
+
+
+def session_metrics(trace: Trace) -> Dict[str, Any]:
+    """Contenido de runs/<session_id>/metrics.json; también suma el trace al registro del proceso."""
+    data = trace.to_dict()
+    if data:
+        get_registry().record_trace(data)
+    return data
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Sequence
+from uuid import uuid4
+
+from app.logger import ArtifactSink, log_agent_output
+from app.agents import analyzer, classifier, reporter
+from app.agents.attack_graph import ATTACK_GRAPH_DEPTH, ATTACK_GRAPH_ENABLED
+from app.agents.scoring import SCORING_MODEL_PATH
+from app.agents.telemetry import TELEMETRY_KEYWORDS
+from app.metrics import METRICS_ENABLED, new_trace, session_metrics, use_trace
+from app.mcp.backends import MITRE_BACKEND
+from app.mcp.technique_cache import MITRE_ATTACK_VERSION
+from app.schemas import as_detector_batch
+from app.stage_cache import StageCache, content_key, file_digest, get_stage_cache
+
+
+@dataclass
+class PipelineResult:
+    session_id: str
+    analyzer: Dict[str, Any]
+    classifier: Dict[str, Any]
+    reporter: Dict[str, Any]
+    report: str
+    artifacts: Dict[str, str] = field(default_factory=dict)
+    stages: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    metrics: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def classified_detectors(self) -> Sequence[Any]:
+        """ClassifiedBatch (app/schemas.py) o, con hit de cache / modo streaming, lista de dicts."""
+        return self.classifier.get("classified_detectors", [])
+
+    @property
+    def report_path(self) -> Optional[str]:
+        return self.reporter.get("report_path")
+
+
+def _analyzer_key(text: str, agent: analyzer.AnalyzerAgent) -> str:
+    dbir_index = agent.dbir_index
+    return content_key(
+        "analyzer",
+        text,
+        analyzer._user_input(agent, text),
+        # El digest cubre las fuentes del corpus DBIR (incluido dbir_2025_subset.txt).
+        dbir_index.digest if dbir_index is not None else None,
+        file_digest(agent.catalog_path),
+        {flag: list(kws) for flag, kws in TELEMETRY_KEYWORDS.items()},
+    )
+
+
+def _classifier_key(analyzer_out: Dict[str, Any], backend: Optional[str]) -> str:
+    return content_key(
+        "classifier",
+        analyzer_out.get("detectors", []),
+        file_digest(SCORING_MODEL_PATH),
+        classifier.MITRE_ID_MAP,
+        backend or MITRE_BACKEND,
+        MITRE_ATTACK_VERSION,
+        ATTACK_GRAPH_DEPTH if ATTACK_GRAPH_ENABLED else None,
+    )
+
+
+def _lookup_failed(classifier_out: Dict[str, Any]) -> bool:
+    graph_status = (classifier_out.get("attack_graph") or {}).get("status")
+    return graph_status in ("partial", "unavailable") or any(
+        m.get("name", "").startswith("Unknown")
+        for c in classifier_out.get("classified_detectors", [])
+        for m in c.get("mitre", [])
+    )
+
+
+def _report_artifacts(reporter_out: Dict[str, Any]) -> Dict[str, str]:
+    """report.md como "report"; el resto de los formatos como "report_<fmt>"."""
+    return {
+        "report" if fmt == "md" else f"report_{fmt}": path
+        for fmt, path in (reporter_out.get("report_paths") or {}).items()
+        if path
+    }
+
+
+def run_pipeline(
+    text: str,
+    session_id: Optional[str] = None,
+    backend: Optional[str] = None,
+    sink: Optional[ArtifactSink] = None,
+    agent: Optional[analyzer.AnalyzerAgent] = None,
+    memoize: bool = False,
+    stage_cache: Optional[StageCache] = None,
+    metrics: bool = METRICS_ENABLED,
+    report_formats: Optional[Sequence[str]] = None,
+) -> PipelineResult:
+    """
+    Ejecuta Analyzer → Classifier → Reporter en memoria (sin pasar por inputs/).
+
+    Sin `sink` no se persiste nada; con FileSink() se escribe runs/<session_id>/
+    (JSON por agente + report.md) como en el CLI.
+
+    Con `memoize` (lo activa el CLI; off para la API en memoria, batch, serve y
+    jobs, que no deben serializarse sobre .cache/stages.sqlite) cada etapa se busca
+    antes en la cache de etapas por el hash de lo que consume (app/stage_cache.py);
+    si está, se reutiliza su resultado. El hash y si hubo hit quedan en el JSON de
+    cada agente bajo "stage_cache". Las estadísticas de la corrida del Classifier
+    (lookups MITRE, cache de técnicas, MCP) no se guardan: en un hit no aparecen.
+
+    Con `metrics` cada etapa y cada lookup MITRE quedan como spans (app/metrics.py)
+    en runs/<session_id>/metrics.json y en el registro del proceso.
+
+    `report_formats` (md, html, csv, json; default REPORT_FORMATS) son los reports
+    que escribe el Reporter, todos en una sola pasada.
+    """
+    session_id = session_id or uuid4().hex
+    sink = sink or ArtifactSink()
+    agent = agent or analyzer.AnalyzerAgent()
+    cache = (stage_cache or get_stage_cache()) if memoize else None
+    stages: Dict[str, Dict[str, Any]] = {}
+    trace = new_trace(session_id, enabled=metrics)
+
+    def _memo(
+        stage: str, key: str, compute, cacheable=lambda out: True, volatile: Sequence[str] = ()
+    ) -> Dict[str, Any]:
+        stored = cache.get(stage, key) if cache else None
+        stages[stage] = {"key": key, "hit": stored is not None}
+        if stored is not None:
+            # Entradas viejas pueden traer los bloques por corrida: no son de esta sesión.
+            for name in volatile:
+                stored.pop(name, None)
+            return stored
+        out = compute()
+        if cache and cacheable(out):
+            cache.put(stage, key, {k: v for k, v in out.items() if k not in volatile})
+        return out
+
+    def _cache_state(stage: str) -> str:
+        return ("hit" if stages[stage]["hit"] else "miss") if cache else "off"
+
+    with use_trace(trace):
+        with trace.span("stage", stage="analyzer") as span:
+            analyzer_out = _memo(
+                "analyzer",
+                _analyzer_key(text, agent),
+                lambda: analyzer.run(session_id=session_id, text=text, agent=agent),
+            )
+            span.set(cache=_cache_state("analyzer"))
+        analyzer_out["session_id_seen"] = session_id
+        # Un hit de la cache trae dicts de JSON: Classifier y Reporter comparten el mismo batch.
+        analyzer_out["detectors"] = as_detector_batch(analyzer_out.get("detectors"))
+
+        with trace.span("stage", stage="classifier") as span:
+            classifier_out = _memo(
+                "classifier",
+                _classifier_key(analyzer_out, backend),
+                lambda: classifier.run(session_id=session_id, analyzer_out=analyzer_out, backend=backend),
+                cacheable=lambda out: not _lookup_failed(out),
+                volatile=classifier.RUN_STATS_KEYS,
+            )
+            span.set(cache=_cache_state("classifier"))
+        classifier_out["session_id_seen"] = session_id
+
+        with trace.span("stage", stage="reporter") as span:
+            body = _memo(
+                "reporter",
+                content_key(
+                    "reporter",
+                    analyzer_out.get("detectors", []),
+                    classifier_out.get("classified_detectors", []),
+                ),
+                lambda: {"body": reporter.render_body(analyzer_out, classifier_out)},
+            )["body"]
+            span.set(cache=_cache_state("reporter"))
+            reporter_out = reporter.run(
+                session_id=session_id, analyzer_out=analyzer_out, classifier_out=classifier_out, sink=sink, body=body,
+                formats=report_formats,
+            )
+        report = reporter_out.pop("report", "")
+
+        artifacts: Dict[str, str] = {}
+        with trace.span("stage", stage="artifacts"):
+            for name, payload in (("analyzer", analyzer_out), ("classifier", classifier_out), ("reporter", reporter_out)):
+                if name in stages:
+                    payload["stage_cache"] = stages[name]
+                path = log_agent_output(session_id, name, payload, sink=sink)
+                if path is not None:
+                    artifacts[name] = str(path)
+            artifacts.update(_report_artifacts(reporter_out))
+
+    metrics_out = session_metrics(trace)
+    if metrics_out:
+        path = sink.write_json(session_id, "metrics", metrics_out)
+        if path is not None:
+            artifacts["metrics"] = str(path)
+    sink.close_session(session_id)
+
+    return PipelineResult(
+        session_id=session_id,
+        analyzer=analyzer_out,
+        classifier=classifier_out,
+        reporter=reporter_out,
+        report=report,
+        artifacts=artifacts,
+        stages=stages,
+        metrics=metrics_out,
+    )
+
+
+def stream_pipeline(
+    text: str,
+    session_id: Optional[str] = None,
+    backend: Optional[str] = None,
+    sink: Optional[ArtifactSink] = None,
+    agent: Optional[analyzer.AnalyzerAgent] = None,
+    top_k: int = 5,
+    metrics: bool = METRICS_ENABLED,
+    report_formats: Optional[Sequence[str]] = None,
+) -> PipelineResult:
+    """
+    Variante streaming: el Analyzer emite detectores de a uno, el Classifier los
+    enriquece al vuelo (lookups MITRE solapados) y cada resultado va directo a
+    runs/<session_id>/detectors.ndjson. Solo los `top_k` mejores quedan en
+    memoria para el report.md final.
+    """
+    session_id = session_id or uuid4().hex
+    sink = sink or ArtifactSink()
+    top = reporter.TopK(top_k)
+    trace = new_trace(session_id, enabled=metrics)
+
+    with use_trace(trace):
+        with trace.span("stage", stage="stream"), sink.open_records(session_id, "detectors") as records:
+            for detector, classified in classifier.stream(analyzer.stream(text, agent=agent), backend=backend):
+                records.write({"detector": detector, "classification": classified})
+                top.push(detector, classified)
+            records_path = records.path
+
+        with trace.span("stage", stage="reporter"):
+            reporter_out = reporter.run_top_k(session_id, top, sink=sink, formats=report_formats)
+    report = reporter_out.pop("report", "")
+
+    summary = {
+        "message": "stream ok",
+        "detectors_seen": top.seen,
+        "top_k": top.k,
+        "records_path": str(records_path) if records_path else None,
+    }
+
+    artifacts: Dict[str, str] = {}
+    for name, payload in (("stream", summary), ("reporter", reporter_out)):
+        path = log_agent_output(session_id, name, payload, sink=sink)
+        if path is not None:
+            artifacts[name] = str(path)
+    if records_path:
+        artifacts["detectors"] = str(records_path)
+    artifacts.update(_report_artifacts(reporter_out))
+    metrics_out = session_metrics(trace)
+    if metrics_out:
+        path = sink.write_json(session_id, "metrics", metrics_out)
+        if path is not None:
+            artifacts["metrics"] = str(path)
+    sink.close_session(session_id)
+
+    ranked = top.ranked()
+    return PipelineResult(
+        session_id=session_id,
+        analyzer={"detectors": [d for d, _ in ranked]},
+        classifier={"classified_detectors": [c for _, c in ranked], **summary},
+        reporter=reporter_out,
+        report=report,
+        artifacts=artifacts,
+        metrics=metrics_out,
+    )
@@ -0,0 +1,383 @@
+"""
+Re-scoring incremental de sesiones guardadas en runs/.
+
+Cuando cambia data/scoring_model.json (pesos, bonus, umbrales de nivel) o
+classifier.MITRE_ID_MAP, recalcula solo los detectores cuyas categorías cambian
+y reescribe solo los classifier.json / report.* afectados, sin volver a correr
+el pipeline. Cada classifier.json guarda "scoring_fingerprints" (huella por
+categoría del modelo + mapeo vigentes); una sesión cuyas huellas coinciden con
+las actuales se saltea sin leer analyzer.json. Las sesiones anteriores a las
+huellas se recalculan y se reescriben solo si el resultado cambia.
+
+Las técnicas MITRE se resuelven en el padre solo si alguna sesión tiene una
+categoría con mapeo nuevo (y nunca con --dry-run). Si una no se resuelve, las
+sesiones que la necesitan se saltean (mitre_unavailable) en vez de guardar
+"Unknown" sobre los nombres que ya tenían.
+
+    python -m app.rescore [--runs-dir runs] [--workers N] [--dry-run]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.agents import classifier, reporter
+from app.agents.attack_graph import ATTACK_GRAPH_ENABLED, build_graph
+from app.agents.scoring import rank
+from app.logger import ARTIFACT_ENCODINGS, RUNS_DIR, BundleSink, encode_json, utc_now_iso
+from app.mcp.backends import MITRE_BACKEND, MITRE_BACKENDS, close_backends
+from app.run_index import NON_SESSION_PREFIXES, RUN_INDEX_ENABLED, get_index
+from app.schemas import join_key
+
+RESCORE_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", "256"))
+
+
+def iter_sessions(runs_dir: Path) -> Iterator[str]:
+    """Sesiones en disco: runs/<session_id>/ y runs/<session_id>.zip (sin batch_/coverage_)."""
+    with os.scandir(runs_dir) as it:
+        for entry in it:
+            if entry.name.startswith(NON_SESSION_PREFIXES):
+                continue
+            if entry.is_dir() or entry.name.endswith(".zip"):
+                yield entry.path
+
+
+def _changed_categories(stored: Dict[str, str], categories: List[str]) -> List[str]:
+    current = classifier.scoring_fingerprints(categories)
+    return [c for c, fp in current.items() if stored.get(c) != fp]
+
+
+class MissingTechniques(Exception):
+    """La sesión necesita técnicas MITRE que todavía no están en `mitre_entries`."""
+
+    def __init__(self, ids: Sequence[str]):
+        super().__init__(", ".join(ids))
+        self.ids = list(ids)
+
+
+def rescore_session(
+    analyzer_out: Dict[str, Any],
+    classifier_out: Dict[str, Any],
+    mitre_entries: Optional[Dict[str, Dict[str, Any]]],
+    changed: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Clasificación nueva de una sesión: recalcula los detectores de las categorías
+    `changed` (None: todos), conserva el resto tal cual y vuelve a ordenar por
+    risk_score. Devuelve (classified_detectors, detectores recalculados).
+
+    Las categorías con mapeo MITRE nuevo toman sus entradas de `mitre_entries`;
+    si falta alguna se lanza MissingTechniques con todas las faltantes. Con
+    `mitre_entries=None` (dry-run) quedan solo los ids, sin resolver.
+    """
+    detectors = analyzer_out.get("detectors") or []
+    # Por detector_id (o nombre, en JSON sin ids); con nombres repetidos se emparejan en orden.
+    stored: Dict[Tuple[str, Any], Deque[Dict[str, Any]]] = {}
+    for c in classifier_out.get("classified_detectors") or []:
+        stored.setdefault(join_key(c), deque()).append(c)
+    previous = [_pop(stored, join_key(d)) for d in detectors]
+    affected = [
+        i for i, d in enumerate(detectors)
+        if changed is None or d.get("category_hint", "UNKNOWN") in changed or previous[i] is None
+    ]
+
+    records: List[Dict[str, Any]] = [dict(p or {}) for p in previous]
+    if affected and mitre_entries is not None:
+        missing = [
+            tid for tid in dict.fromkeys(
+                tid for i in affected
+                for tid in _remapped(records[i], detectors[i].get("category_hint", "UNKNOWN")) or []
+            )
+            if tid not in mitre_entries
+        ]
+        if missing:
+            raise MissingTechniques(missing)
+    if affected:
+        scores = classifier.score_detectors([detectors[i] for i in affected])
+        for j, i in enumerate(affected):
+            d = detectors[i]
+            category = d.get("category_hint", "UNKNOWN")
+            tids = _remapped(records[i], category)
+            # Entradas guardadas (con sus relaciones del grafo) si el mapeo de la categoría no cambió.
+            mitre = (records[i].get("mitre") or []) if tids is None else [
+                {"technique": tid} if mitre_entries is None else mitre_entries[tid] for tid in tids
+            ]
+            records[i] = {
+                **({"detector_id": d["detector_id"]} if d.get("detector_id") else {}),
+                "name": d.get("name"), "category": category, "mitre": mitre, **scores.record(j),
+            }
+
+    order = rank([r.get("risk_score", 0) for r in records])
+    return [records[i] for i in order], len(affected)
+
+
+def _remapped(record: Dict[str, Any], category: str) -> Optional[List[str]]:
+    """Técnicas de `category` si difieren de las guardadas en `record`; None si el mapeo no cambió."""
+    tids = classifier.MITRE_ID_MAP.get(category, [])
+    return None if [m.get("technique") for m in record.get("mitre") or []] == tids else tids
+
+
+def _pop(stored: Dict[Tuple[str, Any], Deque[Dict[str, Any]]], key: Tuple[str, Any]) -> Optional[Dict[str, Any]]:
+    queue = stored.get(key)
+    return queue.popleft() if queue else None
+
+
+def read_session_members(session_path: Path, names: Optional[Sequence[str]] = None) -> Dict[str, bytes]:
+    """
+    Artefactos de una sesión guardada: {nombre: bytes}. Sin `names`, todos los
+    miembros del .zip o analyzer.json + classifier.json del directorio.
+    """
+    if session_path.suffix == ".zip":
+        with zipfile.ZipFile(session_path) as zf:
+            members = zf.namelist() if names is None else [n for n in zf.namelist() if n in names]
+            return {name: zf.read(name) for name in members}
+    return {
+        name: (session_path / name).read_bytes()
+        for name in names or ("analyzer.json", "classifier.json")
+        if (session_path / name).exists()
+    }
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _rescore_chunk(
+    paths: List[str],
+    mitre_entries: Dict[str, Dict[str, Any]],
+    dry_run: bool,
+    encoding: Optional[str] = None,
+) -> Dict[str, Any]:
+    # "pending": sesiones que necesitan técnicas todavía no resueltas ("missing");
+    # el padre las resuelve y vuelve a mandar solo esas sesiones.
+    out: Dict[str, Any] = {
+        "touched": 0, "unchanged": 0, "no_classifier": 0, "detectors_rescored": 0,
+        "errors": [], "envelopes": [], "pending": [], "missing": [],
+    }
+    for raw in paths:
+        session_path = Path(raw)
+        try:
+            members = read_session_members(session_path)
+            if "classifier.json" not in members or "analyzer.json" not in members:
+                out["no_classifier"] += 1
+                continue
+
+            envelope = json.loads(members["classifier.json"])
+            classifier_out = envelope.get("payload") or {}
+            classified = classifier_out.get("classified_detectors") or []
+            stored_fps = classifier_out.get("scoring_fingerprints")
+            changed: Optional[List[str]] = None
+            if stored_fps:
+                changed = _changed_categories(stored_fps, [c.get("category", "UNKNOWN") for c in classified])
+                if not changed:
+                    out["unchanged"] += 1
+                    continue
+
+            analyzer_out = json.loads(members["analyzer.json"]).get("payload") or {}
+            try:
+                new_classified, n = rescore_session(
+                    analyzer_out, classifier_out, None if dry_run else mitre_entries, changed
+                )
+            except MissingTechniques as e:
+                out["pending"].append(raw)
+                out["missing"].extend(e.ids)
+                continue
+            if new_classified == classified:
+                out["unchanged"] += 1
+                continue
+
+            out["touched"] += 1
+            out["detectors_rescored"] += n
+            if dry_run:
+                continue
+
+            session_id = envelope.get("session_id") or session_path.stem
+            classifier_out = dict(
+                classifier_out,
+                classified_detectors=new_classified,
+                scoring_fingerprints=classifier.scoring_fingerprints(c["category"] for c in new_classified),
+                rescored_at_utc=utc_now_iso(),
+            )
+            envelope = dict(envelope, payload=classifier_out)
+            # Por defecto, el formato del archivo original (pretty usa el encoder en Python: ~4x más lento).
+            fmt = encoding or ("pretty" if members["classifier.json"][:2] == b"{\n" else "compact")
+            data = encode_json(envelope, fmt)
+            # Se regeneran los formatos de report que ya tenía la sesión (al menos report.md).
+            formats = [
+                fmt for fmt, filename in reporter.REPORT_FILENAMES.items()
+                if filename in members or (session_path / filename).exists()
+            ] or ["md"]
+            reports = {
+                reporter.REPORT_FILENAMES[fmt]: text.encode("utf-8")
+                for fmt, text in reporter.render_documents(session_id, analyzer_out, classifier_out, formats).items()
+            }
+
+            if session_path.suffix == ".zip":
+                sink = BundleSink(session_path.parent, fsync="none")
+                members.update({"classifier.json": data, **reports})
+                for name, member in members.items():
+                    sink.write_bytes(session_id, name, member)
+                sink.close_session(session_id)
+            else:
+                _write_atomic(session_path / "classifier.json", data)
+                for filename, report in reports.items():
+                    _write_atomic(session_path / filename, report)
+
+            # El índice de runs lo actualiza el proceso padre (un solo escritor).
+            out["envelopes"].append({
+                "timestamp_utc": envelope.get("timestamp_utc"),
+                "session_id": session_id,
+                "agent": "classifier",
+                "payload": {"classified_detectors": new_classified},
+            })
+        except Exception as e:
+            out["errors"].append({"path": raw, "error": repr(e), "traceback": traceback.format_exc(limit=3)})
+    return out
+
+
+def iter_chunks(it: Iterator[str], size: int) -> Iterator[List[str]]:
+    chunk: List[str] = []
+    for item in it:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def current_mitre_entries(ids: Sequence[str], backend: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Entradas MITRE (nombre + relaciones del grafo) de `ids`, resueltas una vez en
+    el padre. Las técnicas que no se pudieron resolver no aparecen en el resultado.
+    """
+    ids = list(dict.fromkeys(ids))
+    try:
+        entries, _ = classifier.enrich_techniques(ids, backend=backend)
+        entries = {tid: e for tid, e in entries.items() if not e["name"].startswith("Unknown")}
+        if ATTACK_GRAPH_ENABLED and entries:
+            graph = build_graph(list(entries), backend=backend)
+            entries = {tid: {**e, **graph.relations(tid)} for tid, e in entries.items()}
+    finally:
+        close_backends()
+    return entries
+
+
+def run_rescore(
+    runs_dir: Path = RUNS_DIR,
+    workers: Optional[int] = None,
+    backend: Optional[str] = None,
+    dry_run: bool = False,
+    chunk_size: int = RESCORE_CHUNK_SIZE,
+    encoding: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Re-scoring de todas las sesiones de `runs_dir` en un pool de procesos (lotes de
+    `chunk_size` sesiones por tarea). Con `dry_run` solo cuenta qué se reescribiría.
+    `encoding` (pretty / compact) fuerza el formato de los classifier.json reescritos;
+    por defecto se conserva el de cada archivo.
+
+    Las sesiones con mapeo MITRE nuevo quedan pendientes en la primera pasada; el
+    padre resuelve solo esas técnicas y las recalcula en una segunda. Las que siguen
+    sin resolverse se saltean (mitre_unavailable) sin tocar la sesión.
+    """
+    runs_dir = Path(runs_dir)
+    workers = max(1, workers or os.cpu_count() or 1)
+    start = time.perf_counter()
+
+    totals: Dict[str, Any] = {"touched": 0, "unchanged": 0, "no_classifier": 0, "detectors_rescored": 0}
+    errors: List[Dict[str, Any]] = []
+    sessions = 0
+    pending: List[str] = []
+    missing: Dict[str, None] = {}
+    unresolved: List[str] = []
+    index = get_index(runs_dir) if RUN_INDEX_ENABLED and not dry_run else None
+
+    def collect(futures: List[Any]) -> None:
+        for fut in as_completed(futures):
+            result = fut.result()
+            for key in totals:
+                totals[key] += result[key]
+            errors.extend(result["errors"])
+            pending.extend(result["pending"])
+            missing.update(dict.fromkeys(result["missing"]))
+            if index is not None and result["envelopes"]:
+                index.record_many(result["envelopes"])
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for chunk in iter_chunks(iter_sessions(runs_dir), max(1, chunk_size)):
+            sessions += len(chunk)
+            futures.append(pool.submit(_rescore_chunk, chunk, {}, dry_run, encoding))
+        collect(futures)
+
+        if pending:
+            mitre_entries = current_mitre_entries(list(missing), backend)
+            unresolved = [tid for tid in missing if tid not in mitre_entries]
+            retry, pending, missing = pending, [], {}
+            collect([
+                pool.submit(_rescore_chunk, chunk, mitre_entries, dry_run, encoding)
+                for chunk in iter_chunks(iter(retry), max(1, chunk_size))
+            ])
+
+    wall = time.perf_counter() - start
+    return {
+        "runs_dir": str(runs_dir),
+        "dry_run": dry_run,
+        "workers": workers,
+        "sessions": sessions,
+        **totals,
+        "mitre_unavailable": len(pending),
+        "unresolved_techniques": unresolved,
+        "skipped": totals["unchanged"] + totals["no_classifier"] + len(pending),
+        "failed": len(errors),
+        "errors": errors[:20],
+        "wall_seconds": round(wall, 3),
+        "sessions_per_s": round(sessions / wall, 1) if wall > 0 else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="MELI DataSec Challenge - re-scoring de sesiones guardadas")
+    parser.add_argument("--runs-dir", default=str(RUNS_DIR))
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (default: CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=RESCORE_CHUNK_SIZE, help="Sesiones por tarea del pool")
+    parser.add_argument("--mitre-backend", choices=MITRE_BACKENDS, default=MITRE_BACKEND)
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar las sesiones afectadas")
+    parser.add_argument(
+        "--encoding", choices=ARTIFACT_ENCODINGS, default=None,
+        help="Formato de los JSON reescritos (default: el del archivo original)",
+    )
+    args = parser.parse_args()
+
+    summary = run_rescore(
+        Path(args.runs_dir),
+        workers=args.workers,
+        backend=args.mitre_backend,
+        dry_run=args.dry_run,
+        chunk_size=args.chunk_size,
+        encoding=args.encoding,
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    print(
+        f"rescore: {summary['touched']} touched, {summary['skipped']} skipped "
+        f"({summary['mitre_unavailable']} MITRE unavailable), {summary['failed']} failed "
+        f"of {summary['sessions']} sessions in {summary['wall_seconds']}s",
+        file=sys.stderr,
+    )
+    return 0 if not summary["failed"] and not summary["mitre_unavailable"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
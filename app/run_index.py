@@ -0,0 +1,436 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RUN_INDEX_ENABLED = os.getenv("RUN_INDEX", "1").lower() not in ("0", "false", "no", "off")
+RUN_INDEX_NAME = os.getenv("RUN_INDEX_NAME", "index.sqlite")
+# Sesiones por transacción cuando los sinks registran sus JSON (1 = al cerrar cada sesión).
+RUN_INDEX_BATCH = max(1, int(os.getenv("RUN_INDEX_BATCH", "1")))
+
+# Directorios de runs/ que no son sesiones del pipeline.
+NON_SESSION_PREFIXES = ("batch_", "coverage_", "consolidated_")
+
+# Filas compactas: sesión por entero (sid), tiempo en microsegundos UTC (ts), y nombres de
+# detectores / técnicas normalizados, así el índice escala a cientos de miles de sesiones.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid          INTEGER PRIMARY KEY,
+    session_id   TEXT NOT NULL UNIQUE,
+    created_at   TEXT NOT NULL,
+    ts           INTEGER NOT NULL,
+    input_chars  INTEGER,
+    backend      TEXT,
+    detectors    INTEGER NOT NULL DEFAULT 0,
+    top_name     TEXT,
+    top_category TEXT,
+    top_score    INTEGER,
+    report_path  TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_ts ON sessions (ts);
+
+CREATE TABLE IF NOT EXISTS detector_names (
+    did   INTEGER PRIMARY KEY,
+    name  TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS detectors (
+    sid         INTEGER NOT NULL,
+    rank        INTEGER NOT NULL,
+    ts          INTEGER NOT NULL,
+    did         INTEGER,
+    category    TEXT,
+    impact      INTEGER,
+    likelihood  INTEGER,
+    risk_score  INTEGER,
+    risk_level  TEXT,
+    PRIMARY KEY (sid, rank)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS detectors_rank_category ON detectors (rank, category, ts);
+
+CREATE TABLE IF NOT EXISTS techniques (
+    technique  TEXT PRIMARY KEY,
+    name       TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS mitre (
+    sid        INTEGER NOT NULL,
+    rank       INTEGER NOT NULL,
+    technique  TEXT NOT NULL,
+    ts         INTEGER NOT NULL,
+    PRIMARY KEY (sid, rank, technique)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS mitre_technique ON mitre (technique, ts);
+"""
+
+_MAX_TS = 1 << 62
+
+
+def to_ts(value: Optional[str], default: int = 0) -> int:
+    """Fecha/hora ISO (p. ej. 2026-09-01 o un timestamp_utc) a microsegundos UTC."""
+    if not value:
+        return default
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1_000_000)
+
+
+def _date_arg(value: str) -> str:
+    """type= de argparse para --since/--until: valida la fecha y la deja como string."""
+    try:
+        to_ts(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha ISO inválida: {value!r} (p. ej. 2026-09-01)") from None
+    return value
+
+
+def _range(since: Optional[str], until: Optional[str]) -> Tuple[int, int]:
+    return to_ts(since), to_ts(until, _MAX_TS)
+
+
+class RunIndex:
+    """
+    Índice SQLite (modo WAL) de las sesiones en runs/: metadata por sesión, un row por
+    detector clasificado (rank, categoría, score) y uno por técnica MITRE mapeada.
+    Los sinks lo actualizan al cerrar cada sesión (log_agent_output); backfill() indexa
+    lo que ya existe en disco (directorios y bundles .zip). Rangos de fechas: [since, until).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._detector_ids: Dict[str, int] = {}
+        self._techniques: Dict[str, Optional[str]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # --- escritura ---
+
+    def record(self, envelope: Dict[str, Any]) -> None:
+        """Indexa un JSON de agente (el envelope de log_agent_output)."""
+        self.record_many([envelope])
+
+    def record_many(self, envelopes: Iterable[Dict[str, Any]], batch: int = 5000) -> int:
+        count = 0
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for envelope in envelopes:
+                    self._record(conn, envelope)
+                    count += 1
+                    if count % batch == 0:
+                        conn.execute("COMMIT")
+                        conn.execute("BEGIN IMMEDIATE")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                # Los ids cacheados pueden no haber llegado a disco.
+                self._detector_ids.clear()
+                self._techniques.clear()
+                raise
+        return count
+
+    def _detector_id(self, conn: sqlite3.Connection, name: Optional[str]) -> Optional[int]:
+        if name is None:
+            return None
+        did = self._detector_ids.get(name)
+        if did is None:
+            conn.execute("INSERT OR IGNORE INTO detector_names (name) VALUES (?)", (name,))
+            (did,) = conn.execute("SELECT did FROM detector_names WHERE name = ?", (name,)).fetchone()
+            self._detector_ids[name] = did
+        return did
+
+    def _technique(self, conn: sqlite3.Connection, technique: str, name: Optional[str]) -> None:
+        if technique in self._techniques and (name is None or self._techniques[technique] == name):
+            return
+        conn.execute(
+            "INSERT INTO techniques VALUES (?, ?) ON CONFLICT (technique) DO UPDATE SET name = excluded.name",
+            (technique, name),
+        )
+        self._techniques[technique] = name
+
+    def _record(self, conn: sqlite3.Connection, envelope: Dict[str, Any]) -> None:
+        session_id = envelope.get("session_id")
+        agent = envelope.get("agent")
+        payload = envelope.get("payload") or {}
+        created_at = envelope.get("timestamp_utc") or ""
+        if not session_id:
+            return
+
+        conn.execute(
+            "INSERT OR IGNORE INTO sessions (session_id, created_at, ts) VALUES (?, ?, ?)",
+            (session_id, created_at, to_ts(created_at)),
+        )
+        if agent == "analyzer":
+            conn.execute(
+                "UPDATE sessions SET input_chars = ? WHERE session_id = ?", (payload.get("input_chars"), session_id)
+            )
+        elif agent == "classifier":
+            classified = payload.get("classified_detectors") or []
+            sid, ts, previous = conn.execute(
+                "SELECT sid, ts, detectors FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if previous:
+                conn.execute("DELETE FROM detectors WHERE sid = ?", (sid,))
+                conn.execute("DELETE FROM mitre WHERE sid = ?", (sid,))
+
+            detectors = []
+            mitre = []
+            for rank, c in enumerate(classified, 1):
+                detectors.append((
+                    sid, rank, ts, self._detector_id(conn, c.get("name")), c.get("category"),
+                    c.get("impact"), c.get("likelihood"), c.get("risk_score"), c.get("risk_level"),
+                ))
+                for m in c.get("mitre") or []:
+                    technique = m.get("technique")
+                    if technique:
+                        self._technique(conn, technique, m.get("name"))
+                        mitre.append((sid, rank, technique, ts))
+
+            top = classified[0] if classified else {}
+            conn.execute(
+                "UPDATE sessions SET backend = ?, detectors = ?, top_name = ?, top_category = ?, top_score = ? "
+                "WHERE sid = ?",
+                (payload.get("mitre_backend"), len(classified), top.get("name"), top.get("category"),
+                 top.get("risk_score"), sid),
+            )
+            conn.executemany("INSERT OR REPLACE INTO detectors VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", detectors)
+            conn.executemany("INSERT OR REPLACE INTO mitre VALUES (?, ?, ?, ?)", mitre)
+        elif agent == "reporter":
+            conn.execute(
+                "UPDATE sessions SET report_path = ? WHERE session_id = ?", (payload.get("report_path"), session_id)
+            )
+
+    def indexed_sessions(self) -> set:
+        with self._lock:
+            return {sid for (sid,) in self._connect().execute("SELECT session_id FROM sessions")}
+
+    # --- consultas ---
+
+    def _query(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        with self._lock:
+            cur = self._connect().execute(sql, params)
+            cols = [c[0] for c in cur.description]
+            return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    def sessions_ranked_first(
+        self, category: str, since: Optional[str] = None, until: Optional[str] = None, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Sesiones cuyo detector #1 es de `category`, más recientes primero."""
+        return self._query(
+            "SELECT s.session_id, s.created_at, n.name, d.risk_score, d.risk_level "
+            "FROM detectors d JOIN sessions s ON s.sid = d.sid LEFT JOIN detector_names n ON n.did = d.did "
+            "WHERE d.rank = 1 AND d.category = ? AND d.ts >= ? AND d.ts < ? "
+            "ORDER BY d.ts DESC LIMIT ?",
+            (category, *_range(since, until), limit),
+        )
+
+    def technique_history(
+        self, technique: str, since: Optional[str] = None, until: Optional[str] = None, limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """Score del detector que mapea `technique`, sesión por sesión, en orden cronológico."""
+        return self._query(
+            "SELECT s.created_at, s.session_id, d.rank, n.name, d.category, d.risk_score, d.risk_level "
+            "FROM mitre m JOIN detectors d ON d.sid = m.sid AND d.rank = m.rank "
+            "JOIN sessions s ON s.sid = m.sid LEFT JOIN detector_names n ON n.did = d.did "
+            "WHERE m.technique = ? AND m.ts >= ? AND m.ts < ? "
+            "ORDER BY m.ts ASC LIMIT ?",
+            (technique, *_range(since, until), limit),
+        )
+
+    def technique_trend(
+        self, technique: str, since: Optional[str] = None, until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Agregado diario de technique_history: sesiones y score min/avg/max por día (UTC).
+        Una técnica puede venir de varios detectores de la misma sesión (T1078: ATO y
+        THIRD_PARTY); cada sesión cuenta una vez, con el score más alto que la mapea.
+        """
+        return self._query(
+            "SELECT date(ts / 1000000, 'unixepoch') AS day, COUNT(*) AS sessions, "
+            "MIN(score) AS min_score, ROUND(AVG(score), 2) AS avg_score, MAX(score) AS max_score "
+            "FROM (SELECT m.sid, m.ts, MAX(d.risk_score) AS score "
+            "FROM mitre m JOIN detectors d ON d.sid = m.sid AND d.rank = m.rank "
+            "WHERE m.technique = ? AND m.ts >= ? AND m.ts < ? GROUP BY m.sid) "
+            "GROUP BY day ORDER BY day",
+            (technique, *_range(since, until)),
+        )
+
+    def top_categories(self, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Cuántas sesiones rankearon primero cada categoría."""
+        lo, hi = _range(since, until)
+        return self._query(
+            "SELECT top_category AS category, COUNT(*) AS sessions FROM sessions "
+            "WHERE ts >= ? AND ts < ? AND top_category IS NOT NULL GROUP BY top_category ORDER BY sessions DESC",
+            (lo, hi),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._connect()
+            counts = {
+                table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("sessions", "detectors", "mitre")
+            }
+            first, last = conn.execute(
+                "SELECT (SELECT created_at FROM sessions ORDER BY ts ASC LIMIT 1), "
+                "(SELECT created_at FROM sessions ORDER BY ts DESC LIMIT 1)"
+            ).fetchone()
+        return {**counts, "first": first, "last": last, "path": str(self.path)}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# --- backfill ---
+
+def iter_session_envelopes(runs_dir: Path, skip: Optional[set] = None) -> Iterator[Dict[str, Any]]:
+    """JSON de agentes de cada sesión en disco: runs/<session_id>/*.json y runs/<session_id>.zip."""
+    skip = skip or set()
+    for entry in sorted(Path(runs_dir).iterdir()):
+        name = entry.name
+        if name.startswith(NON_SESSION_PREFIXES):
+            continue
+        if entry.is_dir():
+            session_id = name
+            if session_id in skip:
+                continue
+            for agent in ("analyzer", "classifier", "reporter"):
+                path = entry / f"{agent}.json"
+                if path.exists():
+                    envelope = _load_envelope(path.read_bytes(), path)
+                    if envelope is not None:
+                        yield envelope
+        elif entry.suffix == ".zip":
+            session_id = entry.stem
+            if session_id in skip:
+                continue
+            try:
+                with zipfile.ZipFile(entry) as zf:
+                    members = set(zf.namelist())
+                    for agent in ("analyzer", "classifier", "reporter"):
+                        if f"{agent}.json" in members:
+                            envelope = _load_envelope(zf.read(f"{agent}.json"), entry)
+                            if envelope is not None:
+                                yield envelope
+            except zipfile.BadZipFile:
+                logger.warning("Skipping corrupt bundle %s", entry)
+
+
+def _load_envelope(data: bytes, source: Path) -> Optional[Dict[str, Any]]:
+    try:
+        envelope = json.loads(data)
+    except json.JSONDecodeError:
+        logger.warning("Skipping unreadable %s", source)
+        return None
+    return envelope if isinstance(envelope, dict) else None
+
+
+def backfill(runs_dir: Path, index: Optional["RunIndex"] = None, rebuild: bool = False) -> Dict[str, Any]:
+    """Indexa sesiones ya escritas; sin `rebuild` saltea las que ya están en el índice."""
+    index = index or get_index(runs_dir)
+    start = time.perf_counter()
+    skip = set() if rebuild else index.indexed_sessions()
+    records = index.record_many(iter_session_envelopes(runs_dir, skip=skip))
+    return {
+        "records": records,
+        "skipped_sessions": len(skip),
+        "seconds": round(time.perf_counter() - start, 3),
+        **index.stats(),
+    }
+
+
+_indexes: Dict[Path, RunIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(runs_dir: Path) -> RunIndex:
+    """Un índice por directorio de runs: <runs_dir>/index.sqlite."""
+    path = Path(runs_dir) / RUN_INDEX_NAME
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = RunIndex(path)
+        return index
+
+
+def main() -> int:
+    from app.logger import RUNS_DIR
+
+    parser = argparse.ArgumentParser(description="MELI DataSec Challenge - índice de runs/")
+    parser.add_argument("--runs-dir", default=str(RUNS_DIR))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("backfill", help="Indexar sesiones existentes")
+    p.add_argument("--rebuild", action="store_true", help="Re-indexar también las sesiones ya indexadas")
+
+    p = sub.add_parser("first", help="Sesiones cuyo detector #1 es de una categoría")
+    p.add_argument("category")
+    p.add_argument("--since", type=_date_arg)
+    p.add_argument("--until", type=_date_arg)
+    p.add_argument("--limit", type=int, default=100)
+
+    p = sub.add_parser("technique", help="Evolución del score de una técnica MITRE")
+    p.add_argument("technique")
+    p.add_argument("--since", type=_date_arg)
+    p.add_argument("--until", type=_date_arg)
+    p.add_argument("--daily", action="store_true", help="Agregado por día en vez de sesión por sesión")
+    p.add_argument("--limit", type=int, default=1000)
+
+    p = sub.add_parser("categories", help="Cuántas sesiones rankearon primero cada categoría")
+    p.add_argument("--since", type=_date_arg)
+    p.add_argument("--until", type=_date_arg)
+
+    sub.add_parser("stats", help="Tamaño del índice")
+    args = parser.parse_args()
+
+    index = get_index(Path(args.runs_dir))
+    start = time.perf_counter()
+    if args.command == "backfill":
+        result: Any = backfill(Path(args.runs_dir), index, rebuild=args.rebuild)
+    elif args.command == "first":
+        result = index.sessions_ranked_first(args.category, args.since, args.until, args.limit)
+    elif args.command == "technique":
+        if args.daily:
+            result = index.technique_trend(args.technique, args.since, args.until)
+        else:
+            result = index.technique_history(args.technique, args.since, args.until, args.limit)
+    elif args.command == "categories":
+        result = index.top_categories(args.since, args.until)
+    else:
+        result = index.stats()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"{args.command}: {elapsed_ms:.2f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
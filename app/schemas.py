@@ -0,0 +1,495 @@
+"""
+Representación compartida de los detectores entre Analyzer, Classifier y Reporter.
+
+- DetectorRecord / ClassifiedRecord: un detector (o su clasificación) como objeto
+  con __slots__; se leen también como dict (`get`, `[]`, `keys`) para el código
+  que trabaja sobre el JSON guardado.
+- DetectorBatch: los detectores de una sesión por columnas. Los textos del
+  catálogo son los mismos objetos str de los DetectorTemplate (no se copian),
+  los nombres y categorías se internan y la telemetría es una máscara de bits
+  por detector (array de bytes) en lugar de un dict por detector.
+- ClassifiedBatch: la salida del Classifier sobre un DetectorBatch: el orden por
+  risk_score, los scores por columna y las entradas MITRE por categoría
+  (compartidas por todos los detectores de la categoría). Cada fila sabe qué
+  detector clasifica, así que el Reporter no arma índices por nombre.
+
+Los JSON de runs/ y de la cache de etapas no cambian. `dumps()` codifica cada
+batch directo de sus columnas, sin un dict por fila: los valores repetidos entre
+sesiones (textos del catálogo, nombres, data_needed, flags por máscara) se
+codifican una vez por proceso y cada fila es una plantilla con esos fragmentos.
+`to_jsonable()` (como `default` de json.dumps) sigue armando los dicts para los
+llamadores que necesitan objetos (ej. claves de la cache con sort_keys).
+"""
+from __future__ import annotations
+
+import json
+import re
+import sys
+from array import array
+from dataclasses import fields, is_dataclass
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from uuid import uuid4
+
+from app.agents.catalog import TELEMETRY_BITS, TELEMETRY_FLAGS, telemetry_mask
+
+if TYPE_CHECKING:
+    from app.agents.catalog import DetectorTemplate
+    from app.agents.scoring import ScoreBatch
+
+# Orden de claves en analyzer.json / classifier.json.
+DETECTOR_FIELDS: Tuple[str, ...] = (
+    "detector_id", "name", "goal", "data_needed", "detection_logic", "expected_false_positives",
+    "tuning_ideas", "rationale", "telemetry_flags", "category_hint", "dbir_evidence",
+)
+CLASSIFIED_FIELDS: Tuple[str, ...] = (
+    "detector_id", "name", "category", "mitre", "impact", "likelihood", "risk_score", "risk_level", "risk_rationale",
+)
+
+# Un dict de flags por máscara (a lo sumo 2^len(TELEMETRY_FLAGS)) para todo el proceso.
+_FLAGS: Dict[int, Dict[str, bool]] = {}
+
+
+def telemetry_flags(mask: int) -> Dict[str, bool]:
+    """Dict {flag: bool} de una máscara. Es compartido: no modificarlo."""
+    flags = _FLAGS.get(mask)
+    if flags is None:
+        flags = _FLAGS.setdefault(mask, {flag: bool(mask & TELEMETRY_BITS[flag]) for flag in TELEMETRY_FLAGS})
+    return flags
+
+
+# Fragmentos JSON ya codificados por modo (pretty o no): {valor: texto}. Los pretty
+# quedan con la sangría de un campo de fila (4 espacios). Claves str / tuplas / None
+# (no se confunden entre sí); se vacía al llenarse (textos de JSON leídos).
+_FRAGMENTS: Dict[bool, Dict[Any, str]] = {False: {}, True: {}}
+_FLAG_FRAGMENTS: Dict[bool, Dict[int, str]] = {False: {}, True: {}}
+_FRAGMENTS_MAX = 50_000
+_FRAGMENT_TYPES = (str, tuple, type(None))
+
+_ROW_INDENT = "\n    "
+_TOKEN = f"\ue000{uuid4().hex[:8]}:"
+_TOKEN_RE = re.compile(f'"{_TOKEN}(\\d+)"')
+
+
+def _dumps(value: Any, pretty: bool) -> str:
+    if pretty:
+        return json.dumps(value, ensure_ascii=False, indent=2)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _dumps_value(value: Any, pretty: bool) -> str:
+    """Valor de un campo de fila (con `pretty`, con la sangría del campo)."""
+    return _dumps(value, pretty).replace("\n", _ROW_INDENT) if pretty else _dumps(value, pretty)
+
+
+def _fragment(value: Any, pretty: bool) -> str:
+    if type(value) not in _FRAGMENT_TYPES:
+        return _dumps_value(value, pretty)
+    cache = _FRAGMENTS[pretty]
+    if len(cache) >= _FRAGMENTS_MAX:
+        cache.clear()
+    text = cache[value] = _dumps_value(value, pretty)
+    return text
+
+
+def _column(values: Iterable[Any], pretty: bool) -> List[str]:
+    """JSON de cada valor de una columna; los str / tuplas / None se codifican una vez por proceso."""
+    get = _FRAGMENTS[pretty].get
+    return [get(v) or _fragment(v, pretty) for v in values]
+
+
+def _flags_column(masks: Iterable[int], pretty: bool) -> List[str]:
+    cache = _FLAG_FRAGMENTS[pretty]
+    out = []
+    for mask in masks:
+        text = cache.get(mask)
+        if text is None:
+            text = cache[mask] = _dumps_value(telemetry_flags(mask), pretty)
+        out.append(text)
+    return out
+
+
+def _row_template(fields: Sequence[str], pretty: bool) -> str:
+    if pretty:
+        return "{\n    " + ",\n    ".join(f'"{f}": %s' for f in fields) + "\n  }"
+    return "{" + ",".join(f'"{f}":%s' for f in fields) + "}"
+
+
+def _join_rows(rows: List[str], pretty: bool) -> str:
+    if pretty:
+        return "[\n  " + ",\n  ".join(rows) + "\n]" if rows else "[]"
+    return "[" + ",".join(rows) + "]"
+
+
+_DETECTOR_ROW = {pretty: _row_template(DETECTOR_FIELDS, pretty) for pretty in (False, True)}
+_CLASSIFIED_ROW = {pretty: _row_template(CLASSIFIED_FIELDS, pretty) for pretty in (False, True)}
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+class _Row:
+    """Acceso de solo lectura tipo dict sobre los slots de `_fields`."""
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+    _keys: FrozenSet[str] = frozenset()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self._keys else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._keys
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {f: getattr(self, f) for f in self._fields}
+
+    def to_jsonable(self) -> Dict[str, Any]:
+        return self.to_dict()
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (_Row, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, _Row) else other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(name={self.get('name')!r})"
+
+
+class DetectorRecord(_Row):
+    """
+    Un detector propuesto por el Analyzer (modo streaming o fila de un DetectorBatch).
+    `detector_id` es el id del template del catálogo: estable entre sesiones y único
+    aunque dos detectores compartan nombre (None en JSON anteriores a los ids).
+    """
+
+    __slots__ = (
+        "detector_id", "name", "goal", "data_needed", "detection_logic", "expected_false_positives",
+        "tuning_ideas", "rationale", "telemetry_mask", "category_hint", "dbir_evidence",
+    )
+    _fields = DETECTOR_FIELDS
+    _keys = frozenset(DETECTOR_FIELDS)
+
+    def __init__(
+        self,
+        detector_id: Optional[str],
+        name: str,
+        goal: str,
+        data_needed: Sequence[str],
+        detection_logic: str,
+        expected_false_positives: str,
+        tuning_ideas: str,
+        rationale: str,
+        telemetry_mask: int,
+        category_hint: str,
+        dbir_evidence: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.detector_id = detector_id
+        self.name = name
+        self.goal = goal
+        self.data_needed = data_needed
+        self.detection_logic = detection_logic
+        self.expected_false_positives = expected_false_positives
+        self.tuning_ideas = tuning_ideas
+        self.rationale = rationale
+        self.telemetry_mask = telemetry_mask
+        self.category_hint = category_hint
+        self.dbir_evidence = dbir_evidence if dbir_evidence is not None else []
+
+    @property
+    def telemetry_flags(self) -> Dict[str, bool]:
+        return telemetry_flags(self.telemetry_mask)
+
+    @classmethod
+    def from_template(
+        cls,
+        template: "DetectorTemplate",
+        mask: int,
+        rationale: str,
+        dbir_evidence: Optional[List[Dict[str, Any]]] = None,
+    ) -> "DetectorRecord":
+        """Sin copias: los textos y data_needed son los objetos del template."""
+        return cls(
+            template.id, template.name, template.goal, template.data_needed, template.detection_logic,
+            template.expected_false_positives, template.tuning_ideas, rationale, mask,
+            template.category_hint, dbir_evidence,
+        )
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "DetectorRecord":
+        """Detector leído de JSON (analyzer.json, cache de etapas)."""
+        return cls(
+            _intern(d.get("detector_id")),
+            _intern(d.get("name")),
+            d.get("goal"),
+            tuple(_intern(x) for x in d.get("data_needed") or ()),
+            d.get("detection_logic"),
+            d.get("expected_false_positives"),
+            d.get("tuning_ideas"),
+            d.get("rationale"),
+            telemetry_mask(d.get("telemetry_flags") or {}),
+            _intern(d.get("category_hint", "UNKNOWN")),
+            d.get("dbir_evidence") or [],
+        )
+
+
+class DetectorBatch:
+    """
+    Detectores de una sesión por columnas (una tupla por campo, misma posición =
+    mismo detector; no se modifica). Se itera como una lista de DetectorRecord.
+    """
+
+    __slots__ = (
+        "detector_id", "name", "goal", "data_needed", "detection_logic", "expected_false_positives",
+        "tuning_ideas", "rationale", "telemetry_mask", "category_hint", "dbir_evidence",
+    )
+
+    def __init__(self, records: Iterable[DetectorRecord] = ()):
+        rows = tuple(records)
+        self.detector_id: Tuple[Optional[str], ...] = tuple(r.detector_id for r in rows)
+        self.name: Tuple[str, ...] = tuple(r.name for r in rows)
+        self.goal: Tuple[str, ...] = tuple(r.goal for r in rows)
+        self.data_needed: Tuple[Sequence[str], ...] = tuple(r.data_needed for r in rows)
+        self.detection_logic: Tuple[str, ...] = tuple(r.detection_logic for r in rows)
+        self.expected_false_positives: Tuple[str, ...] = tuple(r.expected_false_positives for r in rows)
+        self.tuning_ideas: Tuple[str, ...] = tuple(r.tuning_ideas for r in rows)
+        self.rationale: Tuple[str, ...] = tuple(r.rationale for r in rows)
+        self.telemetry_mask = array("B", [r.telemetry_mask for r in rows])
+        self.category_hint: Tuple[str, ...] = tuple(r.category_hint for r in rows)
+        self.dbir_evidence: Tuple[List[Dict[str, Any]], ...] = tuple(r.dbir_evidence for r in rows)
+
+    @classmethod
+    def from_dicts(cls, detectors: Iterable[Mapping[str, Any]]) -> "DetectorBatch":
+        return cls(DetectorRecord.from_dict(d) for d in detectors)
+
+    def __len__(self) -> int:
+        return len(self.name)
+
+    def __getitem__(self, i: int) -> DetectorRecord:
+        return DetectorRecord(
+            self.detector_id[i], self.name[i], self.goal[i], self.data_needed[i], self.detection_logic[i],
+            self.expected_false_positives[i], self.tuning_ideas[i], self.rationale[i],
+            self.telemetry_mask[i], self.category_hint[i], self.dbir_evidence[i],
+        )
+
+    def __iter__(self) -> Iterator[DetectorRecord]:
+        for i in range(len(self.name)):
+            yield self[i]
+
+    def __bool__(self) -> bool:
+        return bool(self.name)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        flags = [telemetry_flags(m) for m in self.telemetry_mask]
+        return [
+            dict(zip(DETECTOR_FIELDS, row))
+            for row in zip(
+                self.detector_id, self.name, self.goal, self.data_needed, self.detection_logic, self.expected_false_positives,
+                self.tuning_ideas, self.rationale, flags, self.category_hint, self.dbir_evidence,
+            )
+        ]
+
+    def to_jsonable(self) -> List[Dict[str, Any]]:
+        return self.to_dicts()
+
+    def encode_rows(self, pretty: bool = False) -> str:
+        """
+        JSON de `to_dicts()` armado directo de las columnas (con `pretty`, relativo a
+        sangría 0). Valores no hasheables en columnas de texto: vía to_dicts().
+        """
+        try:
+            columns = [
+                _column(self.detector_id, pretty), _column(self.name, pretty), _column(self.goal, pretty),
+                _column(self.data_needed, pretty), _column(self.detection_logic, pretty),
+                _column(self.expected_false_positives, pretty), _column(self.tuning_ideas, pretty),
+                _column(self.rationale, pretty), _flags_column(self.telemetry_mask, pretty),
+                _column(self.category_hint, pretty),
+                ["[]" if not v else _dumps_value(v, pretty) for v in self.dbir_evidence],
+            ]
+        except TypeError:
+            return _dumps(self.to_dicts(), pretty)
+        template = _DETECTOR_ROW[pretty]
+        return _join_rows([template % row for row in zip(*columns)], pretty)
+
+
+def join_key(item: Mapping[str, Any]) -> Tuple[str, Any]:
+    """Clave para unir un detector con su clasificación: el detector_id y, en JSON sin ids, el nombre."""
+    detector_id = item.get("detector_id")
+    return ("id", detector_id) if detector_id else ("name", item.get("name"))
+
+
+def as_detector_batch(detectors: Any) -> DetectorBatch:
+    """DetectorBatch tal cual; cualquier otra secuencia (dicts de JSON, records) se convierte."""
+    if isinstance(detectors, DetectorBatch):
+        return detectors
+    return DetectorBatch(d if isinstance(d, DetectorRecord) else DetectorRecord.from_dict(d) for d in detectors or ())
+
+
+class ClassifiedRecord(_Row):
+    """Clasificación de un detector; `detector` es su posición en el DetectorBatch (si hay)."""
+
+    __slots__ = (
+        "detector_id", "name", "category", "mitre", "impact", "likelihood", "risk_score", "risk_level",
+        "risk_rationale", "detector",
+    )
+    _fields = CLASSIFIED_FIELDS
+    _keys = frozenset(CLASSIFIED_FIELDS)
+
+    def __init__(
+        self,
+        detector_id: Optional[str],
+        name: str,
+        category: str,
+        mitre: List[Dict[str, Any]],
+        impact: int,
+        likelihood: int,
+        risk_score: int,
+        risk_level: str,
+        risk_rationale: str,
+        detector: Optional[int] = None,
+    ):
+        self.detector_id = detector_id
+        self.name = name
+        self.category = category
+        self.mitre = mitre
+        self.impact = impact
+        self.likelihood = likelihood
+        self.risk_score = risk_score
+        self.risk_level = risk_level
+        self.risk_rationale = risk_rationale
+        self.detector = detector
+
+
+class ClassifiedBatch:
+    """
+    Salida del Classifier por columnas, sin copiar el DetectorBatch de entrada:
+    fila r = detector `order[r]`. Los scores quedan en el orden de los detectores
+    (ints chicos y textos compartidos del modelo, no arrays de NumPy por sesión) y
+    el mapeo MITRE una vez por categoría en `mitre[categoría]`.
+    """
+
+    __slots__ = ("detectors", "order", "impact", "likelihood", "risk_score", "risk_level", "risk_rationale", "mitre")
+
+    def __init__(
+        self,
+        detectors: DetectorBatch,
+        scores: "ScoreBatch",
+        order: Sequence[int],
+        mitre: Mapping[str, List[Dict[str, Any]]],
+    ):
+        self.detectors = detectors
+        self.order: Tuple[int, ...] = tuple(int(i) for i in order)
+        self.impact: Tuple[int, ...] = tuple(scores.impact.tolist())
+        self.likelihood: Tuple[int, ...] = tuple(scores.likelihood.tolist())
+        self.risk_score: Tuple[int, ...] = tuple(scores.risk_score.tolist())
+        self.risk_level: Tuple[str, ...] = tuple(scores.risk_level.tolist())
+        rationales = scores.model.rationales
+        self.risk_rationale: Tuple[str, ...] = tuple(rationales[c] for c in scores.category_idx.tolist())
+        self.mitre = mitre
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, r: int) -> ClassifiedRecord:
+        i = self.order[r]
+        category = self.detectors.category_hint[i]
+        return ClassifiedRecord(
+            self.detectors.detector_id[i], self.detectors.name[i], category, self.mitre.get(category, []), self.impact[i], self.likelihood[i],
+            self.risk_score[i], self.risk_level[i], self.risk_rationale[i], i,
+        )
+
+    def __iter__(self) -> Iterator[ClassifiedRecord]:
+        for r in range(len(self.order)):
+            yield self[r]
+
+    def __bool__(self) -> bool:
+        return bool(self.order)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        ids, names, categories = self.detectors.detector_id, self.detectors.name, self.detectors.category_hint
+        return [
+            dict(zip(CLASSIFIED_FIELDS, (
+                ids[i], names[i], categories[i], self.mitre.get(categories[i], []), self.impact[i], self.likelihood[i],
+                self.risk_score[i], self.risk_level[i], self.risk_rationale[i],
+            )))
+            for i in self.order
+        ]
+
+    def to_jsonable(self) -> List[Dict[str, Any]]:
+        return self.to_dicts()
+
+    def encode_rows(self, pretty: bool = False) -> str:
+        """JSON de `to_dicts()` armado directo de las columnas (MITRE codificado una vez por categoría)."""
+        detectors = self.detectors
+        try:
+            ids, names = _column(detectors.detector_id, pretty), _column(detectors.name, pretty)
+        except TypeError:
+            return _dumps(self.to_dicts(), pretty)
+        categories = detectors.category_hint
+        mitre = {c: _dumps_value(self.mitre.get(c, []), pretty) for c in dict.fromkeys(categories)}
+        rows = [
+            _CLASSIFIED_ROW[pretty] % row
+            for row in zip(
+                ids, names, _column(categories, pretty), [mitre[c] for c in categories],
+                map(str, self.impact), map(str, self.likelihood), map(str, self.risk_score),
+                _column(self.risk_level, pretty), _column(self.risk_rationale, pretty),
+            )
+        ]
+        return _join_rows([rows[i] for i in self.order], pretty)
+
+
+def to_jsonable(obj: Any) -> Any:
+    """
+    `default` de json.dumps: los tipos de este módulo se serializan desde sus
+    columnas y los dataclasses campo a campo (sin la copia profunda de asdict).
+    """
+    method = getattr(obj, "to_jsonable", None)
+    if method is not None:
+        return method()
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: getattr(obj, f.name) for f in fields(obj)}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    """
+    Igual que json.dumps(obj, ensure_ascii=False, default=to_jsonable), compacto o
+    con indent=2, pero los batches se codifican con `encode_rows` (sin dicts por
+    fila) y se insertan en el texto con la sangría de su posición.
+    """
+    encoded: List[str] = []
+
+    def default(o: Any) -> Any:
+        encode = getattr(o, "encode_rows", None)
+        if encode is None:
+            return to_jsonable(o)
+        encoded.append(encode(pretty))
+        return f"{_TOKEN}{len(encoded) - 1}"
+
+    if pretty:
+        text = json.dumps(obj, ensure_ascii=False, indent=2, default=default)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+    if not encoded:
+        return text
+
+    def insert(m: "re.Match[str]") -> str:
+        fragment = encoded[int(m.group(1))]
+        if not pretty:
+            return fragment
+        start = text.rfind("\n", 0, m.start()) + 1
+        line = text[start:m.start()]
+        return fragment.replace("\n", "\n" + line[: len(line) - len(line.lstrip(" "))])
+
+    return _TOKEN_RE.sub(insert, text)
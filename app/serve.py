@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Tuple, Union
+
+from app.agents import analyzer, classifier
+from app.logger import ArtifactSink, make_sink
+from app.mcp.backends import MITRE_BACKEND, MITRE_BACKENDS, close_backends
+from app.metrics import get_registry
+from app.pipeline import run_pipeline
+from app.schemas import dumps
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 8 * 1024 * 1024
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Payload = Union[Dict[str, Any], str]
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class PipelineService:
+    """
+    Servicio de larga vida: mantiene caliente el estado del pipeline (textos de
+    DBIR/template, cache y backend MITRE con su pool de sesiones) y atiende
+    pedidos HTTP/JSON sobre asyncio. Cada pipeline corre en un thread del pool,
+    así muchos pedidos avanzan en paralelo mientras esperan al MCP.
+    """
+
+    def __init__(self, backend: str = MITRE_BACKEND, threads: int = 16, persist: bool = True):
+        self.backend = backend
+        self.sink: ArtifactSink = make_sink() if persist else ArtifactSink()
+        self.agent = analyzer.AnalyzerAgent()
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="pipeline")
+        self.started = time.monotonic()
+        self.stats: Dict[str, int] = {"requests": 0, "pipelines": 0, "errors": 0}
+
+    def warm_up(self) -> None:
+        self.agent.read_text_file(self.agent.inputs_dir / "template_input.txt")
+        self.agent.dbir_index  # abre (o construye) el índice DBIR
+        ids = [tid for tids in classifier.MITRE_ID_MAP.values() for tid in tids]
+        classifier.enrich_techniques(ids, backend=self.backend)
+
+    # --- handlers ---
+
+    async def handle_pipeline(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        text = body.get("text")
+        if not isinstance(text, str):
+            return 400, {"error": "'text' (string) is required"}
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        result = await loop.run_in_executor(
+            self.executor,
+            partial(run_pipeline, text, backend=self.backend, sink=self.sink, agent=self.agent),
+        )
+        self.stats["pipelines"] += 1
+
+        payload: Dict[str, Any] = {
+            "session_id": result.session_id,
+            "classified_detectors": result.classified_detectors,
+            "report_path": result.report_path,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+        }
+        if body.get("include_report"):
+            payload["report"] = result.report
+        return 200, payload
+
+    def handle_health(self) -> Tuple[int, Dict[str, Any]]:
+        return 200, {
+            "status": "ok",
+            "backend": self.backend,
+            "uptime_s": round(time.monotonic() - self.started, 3),
+            **self.stats,
+        }
+
+    async def dispatch(self, method: str, path: str, raw_body: bytes) -> Tuple[int, Payload]:
+        self.stats["requests"] += 1
+        route = path.split("?", 1)[0]
+
+        if route == "/health":
+            return self.handle_health() if method == "GET" else (405, {"error": "use GET"})
+        if route == "/metrics":
+            return (200, get_registry().render_prometheus()) if method == "GET" else (405, {"error": "use GET"})
+        if route != "/pipeline":
+            return 404, {"error": f"unknown route {route}"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+
+        try:
+            body = json.loads(raw_body or b"{}")
+        except ValueError as e:
+            # JSONDecodeError o UnicodeDecodeError (cuerpo que no es UTF-8).
+            return 400, {"error": f"invalid JSON: {e}"}
+        if not isinstance(body, dict):
+            return 400, {"error": "body must be a JSON object"}
+
+        try:
+            return await self.handle_pipeline(body)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.exception("pipeline failed")
+            return 500, {"error": repr(e)}
+
+    # --- HTTP/1.1 mínimo (keep-alive, Content-Length) ---
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "malformed request line"}, keep_alive=False)
+                    break
+
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {"error": "invalid Content-Length"}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    break
+                raw_body = await reader.readexactly(length) if length else b""
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    status, payload = await self.dispatch(method.upper(), target, raw_body)
+                except Exception as e:
+                    # Cualquier error inesperado se responde: nunca un cierre de socket sin respuesta.
+                    self.stats["errors"] += 1
+                    logger.exception("request failed: %s %s", method, target)
+                    status, payload, keep_alive = 500, {"error": repr(e)}, False
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, payload: Payload, keep_alive: bool) -> None:
+        # Texto plano solo para /metrics (exposition format de Prometheus).
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), PROMETHEUS_CONTENT_TYPE
+        else:
+            body = dumps(payload).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode("latin-1")
+        writer.write(head + body)
+        await writer.drain()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        addrs = ", ".join(str(s.getsockname()) for s in server.sockets)
+        print(f"Serving pipeline API on {addrs} (backend={self.backend})")
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.sink.close()
+        close_backends()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="MELI DataSec Challenge - pipeline service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--threads", type=int, default=16, help="Pipelines en paralelo")
+    parser.add_argument("--mitre-backend", choices=MITRE_BACKENDS, default=MITRE_BACKEND)
+    parser.add_argument("--no-persist", action="store_true", help="No escribir runs/<session_id>/ (solo memoria)")
+    args = parser.parse_args()
+
+    service = PipelineService(backend=args.mitre_backend, threads=args.threads, persist=not args.no_persist)
+    service.warm_up()
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from app.schemas import dumps, to_jsonable
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+STAGE_CACHE_ENABLED = os.getenv("STAGE_CACHE", "1").lower() not in ("0", "false", "no", "off")
+STAGE_CACHE_PATH = os.getenv("STAGE_CACHE_PATH", str(PROJECT_ROOT / ".cache" / "stages.sqlite"))
+STAGE_CACHE_TTL = float(os.getenv("STAGE_CACHE_TTL", str(7 * 24 * 3600)))
+STAGE_CACHE_MAX_ENTRIES = int(os.getenv("STAGE_CACHE_MAX_ENTRIES", "1000"))
+STAGE_CACHE_MAX_BYTES = int(os.getenv("STAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+STAGE_CACHE_EVICTION = os.getenv("STAGE_CACHE_EVICTION", "lru")
+STAGE_CACHE_POLICIES = ("lru", "fifo")
+
+# Bump when the stored stage payloads change shape or meaning: old keys stop matching.
+STAGE_KEY_VERSION = "4"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stages (
+    stage       TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (stage, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS stages_last_access ON stages (last_access);
+CREATE INDEX IF NOT EXISTS stages_created_at ON stages (created_at);
+"""
+
+KeyPart = Union[str, bytes, Dict[str, Any], list, None]
+
+
+def _part_bytes(part: KeyPart) -> bytes:
+    if part is None:
+        return b""
+    if isinstance(part, bytes):
+        return part
+    if isinstance(part, str):
+        return part.encode("utf-8")
+    return json.dumps(part, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=to_jsonable).encode(
+        "utf-8"
+    )
+
+
+def content_key(stage: str, *parts: KeyPart) -> str:
+    """SHA-256 over the stage name and its inputs (length-prefixed, so parts cannot run together)."""
+    h = hashlib.sha256()
+    for part in (STAGE_KEY_VERSION, stage, *parts):
+        data = _part_bytes(part)
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def file_digest(path: Union[str, Path]) -> str:
+    p = Path(path)
+    return hashlib.sha256(p.read_bytes()).hexdigest() if p.exists() else ""
+
+
+class StageCache:
+    """
+    Resultados de etapas del pipeline por (stage, content hash) en SQLite (modo WAL).
+
+    - TTL: entradas más viejas que `ttl` segundos cuentan como miss.
+    - Tamaño: al escribir se recorta a `max_entries` y `max_bytes` de payload.
+    - Política de desalojo: "lru" (último acceso) o "fifo" (fecha de alta).
+    """
+
+    def __init__(
+        self,
+        path: str = STAGE_CACHE_PATH,
+        ttl: float = STAGE_CACHE_TTL,
+        max_entries: int = STAGE_CACHE_MAX_ENTRIES,
+        max_bytes: int = STAGE_CACHE_MAX_BYTES,
+        eviction: str = STAGE_CACHE_EVICTION,
+    ):
+        if eviction not in STAGE_CACHE_POLICIES:
+            raise ValueError(f"Unknown eviction policy {eviction!r} (use one of {STAGE_CACHE_POLICIES})")
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.eviction = eviction
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def get(self, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT payload FROM stages WHERE stage = ? AND key = ? AND created_at >= ?",
+                (stage, key, now - self.ttl),
+            ).fetchone()
+
+            payload: Optional[Dict[str, Any]] = None
+            if row is not None:
+                try:
+                    payload = json.loads(row[0])
+                except json.JSONDecodeError:
+                    logger.debug("Corrupt stage cache entry %s/%s, ignoring", stage, key)
+
+            if payload is None:
+                self.stats["misses"] += 1
+                return None
+
+            conn.execute("UPDATE stages SET last_access = ? WHERE stage = ? AND key = ?", (now, stage, key))
+            self.stats["hits"] += 1
+        return payload
+
+    def put(self, stage: str, key: str, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        data = dumps(payload)
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?, ?, ?)",
+                    (stage, key, data, len(data), now, now),
+                )
+                expired = conn.execute("DELETE FROM stages WHERE created_at < ?", (now - self.ttl,)).rowcount
+                evicted = expired + self._evict(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.stats["writes"] += 1
+            self.stats["evictions"] += evicted
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM stages").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return 0
+
+        order = "last_access" if self.eviction == "lru" else "created_at"
+        victims = []
+        for stage, key, size in conn.execute(f"SELECT stage, key, size FROM stages ORDER BY {order} ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((stage, key))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM stages WHERE stage = ? AND key = ?", victims)
+        return len(victims)
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats, eviction=self.eviction, path=str(self.path))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_cache: Optional[StageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_stage_cache() -> StageCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = StageCache()
+        return _cache
+
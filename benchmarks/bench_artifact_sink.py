@@ -0,0 +1,84 @@
+"""
+Benchmark de escritura de artefactos: N sesiones sintéticas (3 JSON + report.md)
+con cada configuración de sink. Mide el tiempo que el pipeline queda bloqueado
+escribiendo ("blocked_s") y el total hasta que todo está en disco ("total_s").
+
+    python -m benchmarks.bench_artifact_sink [--sessions 500] [--fsync none]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from app.logger import ARTIFACT_FSYNC_POLICIES, log_agent_output, make_sink
+
+CONFIGS = (
+    ("files/pretty", {"kind": "files", "encoding": "pretty"}),
+    ("files/compact", {"kind": "files", "encoding": "compact"}),
+    ("bundle", {"kind": "bundle"}),
+    ("files/pretty+background", {"kind": "files", "encoding": "pretty", "background": True}),
+    ("bundle+background", {"kind": "bundle", "background": True}),
+)
+
+
+def synthetic_session() -> dict:
+    detectors = [
+        {
+            "name": f"Detector {i}",
+            "goal": "Detect suspicious activity " * 4,
+            "data_needed": ["IdP sign-in logs", "EDR process telemetry", "Proxy logs"],
+            "detection_logic": "Correlate events within a 30 minute window " * 3,
+            "telemetry_flags": {"idp": True, "edr": False, "proxy": True},
+        }
+        for i in range(5)
+    ]
+    return {"detectors": detectors, "classified": [{"name": d["name"], "risk_score": 200} for d in detectors]}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Artifact sink benchmark")
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--fsync", choices=ARTIFACT_FSYNC_POLICIES, default="none")
+    args = parser.parse_args()
+
+    payload = synthetic_session()
+    report = "# UEBA Detection Proposal\n\n" + "- line of the report\n" * 300
+
+    rows = []
+    for label, options in CONFIGS:
+        with tempfile.TemporaryDirectory() as tmp:
+            sink = make_sink(fsync=args.fsync, base_dir=Path(tmp), **options)
+            blocked = 0.0
+            start = time.perf_counter()
+            for _ in range(args.sessions):
+                session_id = uuid4().hex
+                t0 = time.perf_counter()
+                for name in ("analyzer", "classifier", "reporter"):
+                    log_agent_output(session_id, name, payload, sink=sink)
+                sink.write_text(session_id, "report.md", report)
+                sink.close_session(session_id)
+                blocked += time.perf_counter() - t0
+            sink.close()
+            total = time.perf_counter() - start
+
+            files = sum(1 for p in Path(tmp).rglob("*") if p.is_file())
+            size = sum(p.stat().st_size for p in Path(tmp).rglob("*") if p.is_file())
+            rows.append({
+                "sink": label,
+                "sessions": args.sessions,
+                "blocked_s": round(blocked, 4),
+                "total_s": round(total, 4),
+                "files": files,
+                "bytes": size,
+            })
+
+    print(json.dumps(rows, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+"""
+Benchmark del índice ATT&CK local (app/mcp/mitre_server.py).
+
+Mide tiempo de construcción del índice y latencia de get_technique_by_id.
+Usa el bundle real si existe (MITRE_STIX_PATH), si no uno sintético de tamaño similar.
+
+    python -m benchmarks.bench_attack_index [--stix PATH] [--techniques 800] [--lookups 200000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from app.mcp.mitre_server import MITRE_STIX_PATH, AttackIndex
+
+
+def synthetic_bundle(n_techniques: int = 800, subs_per_technique: int = 3, n_mitigations: int = 45) -> Dict[str, Any]:
+    tactics = ["initial-access", "execution", "persistence", "privilege-escalation", "defense-evasion",
+               "credential-access", "discovery", "lateral-movement", "collection", "exfiltration", "impact"]
+    objects: List[Dict[str, Any]] = [{"type": "x-mitre-collection", "x_mitre_version": "synthetic"}]
+
+    for i, shortname in enumerate(tactics):
+        objects.append({
+            "type": "x-mitre-tactic", "id": f"x-mitre-tactic--{i}", "name": shortname.title(),
+            "x_mitre_shortname": shortname,
+            "external_references": [{"source_name": "mitre-attack", "external_id": f"TA{i:04d}"}],
+        })
+    for m in range(n_mitigations):
+        objects.append({
+            "type": "course-of-action", "id": f"course-of-action--{m}", "name": f"Mitigation {m}",
+            "external_references": [{"source_name": "mitre-attack", "external_id": f"M{1000 + m}"}],
+        })
+
+    def technique(ext_id: str, stix_id: str, sub: bool, t: int) -> Dict[str, Any]:
+        return {
+            "type": "attack-pattern", "id": stix_id, "name": f"Technique {ext_id}",
+            "description": "Synthetic technique description. " * 20,
+            "x_mitre_is_subtechnique": sub, "x_mitre_platforms": ["Windows", "Linux", "macOS"],
+            "kill_chain_phases": [{"kill_chain_name": "mitre-attack", "phase_name": tactics[t % len(tactics)]}],
+            "external_references": [{"source_name": "mitre-attack", "external_id": ext_id,
+                                     "url": f"https://attack.mitre.org/techniques/{ext_id}"}],
+        }
+
+    for t in range(n_techniques):
+        tid = f"T{1000 + t}"
+        objects.append(technique(tid, f"attack-pattern--{t}", False, t))
+        objects.append({"type": "relationship", "relationship_type": "mitigates",
+                        "source_ref": f"course-of-action--{t % n_mitigations}", "target_ref": f"attack-pattern--{t}"})
+        for s in range(subs_per_technique):
+            sub_stix = f"attack-pattern--{t}-{s}"
+            objects.append(technique(f"{tid}.{s + 1:03d}", sub_stix, True, t))
+            objects.append({"type": "relationship", "relationship_type": "subtechnique-of",
+                            "source_ref": sub_stix, "target_ref": f"attack-pattern--{t}"})
+
+    return {"type": "bundle", "objects": objects}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ATT&CK local index benchmark")
+    parser.add_argument("--stix", default=MITRE_STIX_PATH)
+    parser.add_argument("--techniques", type=int, default=800, help="Tamaño del bundle sintético")
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    if Path(args.stix).exists():
+        source = args.stix
+        with open(args.stix, "r", encoding="utf-8") as f:
+            bundle = json.load(f)
+    else:
+        source = f"synthetic ({args.techniques} techniques)"
+        bundle = synthetic_bundle(args.techniques)
+
+    builds = []
+    index = None
+    for _ in range(args.rounds):
+        index = AttackIndex.from_bundle(bundle)
+        builds.append(index.build_seconds)
+
+    ids = list(index.techniques)
+    lookups = [ids[i % len(ids)] for i in range(args.lookups)]
+
+    start = time.perf_counter()
+    for tid in lookups:
+        index.get_technique_by_id(tid)
+    per_lookup_us = (time.perf_counter() - start) / len(lookups) * 1e6
+
+    start = time.perf_counter()
+    for tid in lookups[: args.lookups // 10]:
+        index.get_subtechniques(tid)
+        index.get_mitigations(tid)
+    per_relation_us = (time.perf_counter() - start) / (args.lookups // 10) / 2 * 1e6
+
+    print(json.dumps({
+        "source": source,
+        "objects": len(bundle.get("objects", [])),
+        "techniques": len(index.techniques),
+        "build_ms_median": round(statistics.median(builds) * 1000, 2),
+        "build_ms_min": round(min(builds) * 1000, 2),
+        "get_technique_by_id_us": round(per_lookup_us, 3),
+        "relationship_query_us": round(per_relation_us, 3),
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,77 @@
+"""
+Benchmark del reporte consolidado (app/consolidate.py) sobre sesiones sintéticas
+en un runs/ temporal (mismo generador que bench_rescore).
+
+Para N/10 y N sesiones mide el pico de memoria del proceso padre (tracemalloc) de:
+- naive: cargar todos los classifier.json en memoria y agregar al final
+- consolidate: run_consolidate (lotes en un pool, parciales fusionados en streaming)
+
+El pico de consolidate no debería crecer con N; el de naive crece lineal.
+
+    python -m benchmarks.bench_consolidate [--sessions 20000] [--workers N]
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+from app.consolidate import FleetAggregate, run_consolidate
+from app.rescore import iter_sessions, read_session_members
+from benchmarks.bench_rescore import write_sessions
+
+
+def naive(runs_dir: Path) -> FleetAggregate:
+    sessions = []
+    for raw in iter_sessions(runs_dir):
+        envelope = json.loads(read_session_members(Path(raw), ("classifier.json",))["classifier.json"])
+        sessions.append(envelope)
+    agg = FleetAggregate()
+    for envelope in sessions:
+        agg.add_session(
+            envelope.get("session_id"), envelope.get("timestamp_utc"), envelope["payload"]["classified_detectors"]
+        )
+    return agg
+
+
+def _peak(fn: Callable[[], Any]) -> Tuple[float, float, Any]:
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    wall = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(peak / 2**20, 2), round(wall, 3), result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Consolidated fleet report benchmark")
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {"workers": args.workers}
+    for n in (max(1, args.sessions // 10), args.sessions):
+        with tempfile.TemporaryDirectory() as tmp:
+            runs_dir = Path(tmp)
+            write_sessions(runs_dir, n)
+            naive_mb, naive_s, expected = _peak(lambda: naive(runs_dir))
+            cons_mb, cons_s, summary = _peak(lambda: run_consolidate(runs_dir, formats="json", workers=args.workers))
+            report = json.loads(Path(summary["report_paths"]["json"]).read_text(encoding="utf-8"))
+            assert report["by_detector"] == expected.snapshot()["by_detector"], "aggregate mismatch"
+            results[str(n)] = {
+                "naive": {"peak_mb": naive_mb, "wall_s": naive_s},
+                "consolidate": {"peak_mb": cons_mb, "wall_s": cons_s, "sessions_per_s": summary["sessions_per_s"]},
+            }
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
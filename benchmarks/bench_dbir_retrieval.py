@@ -0,0 +1,122 @@
+"""
+Benchmark del índice BM25 del DBIR sobre un corpus sintético (cientos de páginas).
+
+Mide:
+- build: chunking + índice invertido (python -m app.agents.dbir_index build)
+- load: apertura del índice por mmap (lo que paga el Analyzer en el primer uso)
+- query: latencia por consulta (p50 / p99) con las dbir_query del catálogo de detectores
+- scan: línea base sin índice (tokenizar y puntuar todos los pasajes en cada consulta)
+
+    python -m benchmarks.bench_dbir_retrieval [--pages 500] [--queries 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List
+
+from app.agents.catalog import DetectorCatalog
+from app.agents.dbir_index import DbirIndex, build_index, chunk_text, current_index_dir, tokenize
+
+_WORDS_PER_PAGE = 450
+_FILLER = (
+    "breach incident actor organization industry sector report analysis percent dataset year "
+    "pattern attack vector system user access third party supply chain median data records "
+    "financial espionage motive external internal partner error misuse privilege web application "
+    "email server desktop laptop mobile cloud storage network credential phishing ransomware "
+    "exploitation vulnerability edge device vpn mfa token session extortion payment"
+).split()
+
+
+def synthetic_corpus(out_dir: Path, pages: int, seed: int = 0) -> List[Path]:
+    """One file per 50 pages; paragraphs of filler plus the real subset spread across them."""
+    rnd = random.Random(seed)
+    subset = Path(__file__).resolve().parents[1] / "data" / "dbir_2025_subset.txt"
+    seeds = chunk_text(subset.read_text(encoding="utf-8")) if subset.exists() else []
+
+    files: List[Path] = []
+    for start in range(0, pages, 50):
+        paragraphs = []
+        for _ in range(start, min(start + 50, pages)):
+            words = 0
+            while words < _WORDS_PER_PAGE:
+                n = rnd.randint(40, 110)
+                para = " ".join(rnd.choice(_FILLER) for _ in range(n)).capitalize() + "."
+                if seeds and rnd.random() < 0.05:
+                    para = rnd.choice(seeds) + " " + para
+                paragraphs.append(para)
+                words += n
+        f = out_dir / f"dbir_part_{start // 50:03d}.txt"
+        f.write_text("\n\n".join(paragraphs), encoding="utf-8")
+        files.append(f)
+    return files
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="DBIR retrieval benchmark")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("-k", type=int, default=2)
+    args = parser.parse_args()
+
+    queries = [t.dbir_query for t in DetectorCatalog.from_file().templates]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        files = synthetic_corpus(tmp_path, args.pages)
+        corpus_mb = sum(f.stat().st_size for f in files) / (1 << 20)
+
+        start = time.perf_counter()
+        meta = build_index(files, tmp_path / "index")
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = DbirIndex(current_index_dir(tmp_path / "index"))
+        load_ms = (time.perf_counter() - start) * 1000
+
+        index.search(queries[0], args.k)
+        latencies: List[float] = []
+        for i in range(args.queries):
+            t0 = time.perf_counter()
+            index.search(queries[i % len(queries)], args.k)
+            latencies.append((time.perf_counter() - t0) * 1e6)
+
+        # Sin índice: tokenizar y contar cada pasaje en cada consulta.
+        passages = [index.passage(d) for d in range(index.n_docs)]
+        scan_rounds = max(1, min(20, args.queries // 100))
+        t0 = time.perf_counter()
+        for i in range(scan_rounds):
+            terms = set(tokenize(queries[i % len(queries)]))
+            scores = [sum(c for t, c in Counter(tokenize(p)).items() if t in terms) for p in passages]
+            sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[: args.k]
+        scan_us = (time.perf_counter() - t0) / scan_rounds * 1e6
+        index.close()
+
+    p50 = percentile(latencies, 0.50)
+    print(json.dumps({
+        "pages": args.pages,
+        "corpus_mb": round(corpus_mb, 2),
+        "passages": meta["documents"],
+        "terms": meta["terms"],
+        "build_s": round(build_s, 3),
+        "load_ms": round(load_ms, 3),
+        "query_p50_us": round(p50, 1),
+        "query_p99_us": round(percentile(latencies, 0.99), 1),
+        "scan_per_query_us": round(scan_us, 1),
+        "speedup_vs_scan": round(scan_us / p50, 1) if p50 else None,
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
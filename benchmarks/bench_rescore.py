@@ -0,0 +1,113 @@
+"""
+Benchmark de python -m app.rescore sobre N sesiones sintéticas en disco (5 detectores
+cada una, analyzer.json + classifier.json compactos, con huellas de scoring).
+
+Corre tres pasadas, cada una en un proceso nuevo como el CLI:
+- noop: modelo sin cambios (todas las sesiones se saltean por huella)
+- changed: una categoría con otro impact (solo se reescriben las sesiones que la usan)
+- legacy: sesiones sin huellas (se recalculan y se comparan con lo guardado)
+
+    python -m benchmarks.bench_rescore [--sessions 20000] [--workers N]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from app.agents import classifier
+from app.agents.catalog import TELEMETRY_BITS
+from app.agents.scoring import SCORING_MODEL_PATH, rank
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+
+def write_sessions(runs_dir: Path, n: int, seed: int = 0, fingerprints: bool = True) -> None:
+    rnd = random.Random(seed)
+    categories = list(classifier.MITRE_ID_MAP) + ["UNKNOWN"]
+    flags = list(TELEMETRY_BITS)
+    for i in range(n):
+        session_id = f"{i:032x}"
+        detectors = [
+            {
+                "name": f"{c} detector {j}",
+                "category_hint": c,
+                "telemetry_flags": {f: rnd.random() < 0.5 for f in flags},
+            }
+            for j, c in enumerate(rnd.sample(categories, 5))
+        ]
+        scores = classifier.score_detectors(detectors)
+        classified = [
+            {
+                "name": detectors[k]["name"],
+                "category": detectors[k]["category_hint"],
+                "mitre": [{"technique": t, "name": f"Technique {t}"} for t in classifier.MITRE_ID_MAP.get(
+                    detectors[k]["category_hint"], []
+                )],
+                **scores.record(k),
+            }
+            for k in rank(scores.risk_score)
+        ]
+        payload: Dict[str, Any] = {"classified_detectors": classified}
+        if fingerprints:
+            payload["scoring_fingerprints"] = classifier.scoring_fingerprints(c["category"] for c in classified)
+
+        out = runs_dir / session_id
+        out.mkdir(parents=True)
+        for agent, body in (("analyzer", {"detectors": detectors}), ("classifier", payload)):
+            envelope = {"timestamp_utc": "2026-01-01T00:00:00+00:00", "session_id": session_id,
+                        "agent": agent, "payload": body}
+            (out / f"{agent}.json").write_text(json.dumps(envelope, separators=(",", ":")), encoding="utf-8")
+
+
+def rescore(runs_dir: Path, workers: int, model_path: str) -> Dict[str, Any]:
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT), SCORING_MODEL_PATH=model_path, RUN_INDEX="0",
+               MITRE_BACKEND="local", ATTACK_GRAPH="0")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-m", "app.rescore", "--runs-dir", str(runs_dir), "--workers", str(workers)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    summary = json.loads(proc.stdout)
+    summary["process_seconds"] = round(time.perf_counter() - start, 3)
+    return {k: summary[k] for k in ("sessions", "touched", "skipped", "failed", "wall_seconds", "process_seconds")}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Incremental re-score benchmark")
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {"sessions": args.sessions, "workers": args.workers}
+    with tempfile.TemporaryDirectory() as tmp:
+        runs_dir = Path(tmp) / "runs"
+        t0 = time.perf_counter()
+        write_sessions(runs_dir, args.sessions)
+        results["generate_s"] = round(time.perf_counter() - t0, 3)
+
+        model = json.loads(Path(SCORING_MODEL_PATH).read_text(encoding="utf-8"))
+        changed_path = Path(tmp) / "scoring_model.json"
+        model["categories"]["THIRD_PARTY"]["impact"] = 5
+        changed_path.write_text(json.dumps(model), encoding="utf-8")
+
+        results["noop"] = rescore(runs_dir, args.workers, SCORING_MODEL_PATH)
+        results["changed"] = rescore(runs_dir, args.workers, str(changed_path))
+
+        legacy_dir = Path(tmp) / "legacy"
+        write_sessions(legacy_dir, args.sessions, fingerprints=False)
+        results["legacy"] = rescore(legacy_dir, args.workers, SCORING_MODEL_PATH)
+
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
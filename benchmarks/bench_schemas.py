@@ -0,0 +1,167 @@
+"""
+Benchmark de la representación de detectores entre agentes: dicts por detector
+(el dataclass Detector de antes + `__dict__`, clasificaciones como dicts e índices
+por nombre en el Reporter) vs. app/schemas.py (DetectorBatch / ClassifiedBatch).
+
+Sobre N sesiones sintéticas (telemetría al azar, top-k del catálogo, sin MITRE ni
+DBIR para medir solo la representación) reporta:
+- memoria retenida por las N sesiones en memoria (tracemalloc)
+- sesiones/s de cada etapa: analyzer+classifier, report.md y JSON de los agentes
+  (compacto y pretty, el default de ARTIFACT_ENCODING)
+
+Antes de medir verifica que ambas representaciones den los mismos JSON y report.md.
+
+    python -m benchmarks.bench_schemas [--sessions 20000] [--detectors 5]
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.agents import classifier, reporter
+from app.agents.catalog import TELEMETRY_BITS, TELEMETRY_FLAGS, load_catalog
+from app.agents.scoring import rank
+from app.logger import encode_json
+from app.schemas import ClassifiedBatch, DetectorBatch, DetectorRecord
+
+Session = Tuple[Dict[str, Any], Dict[str, Any]]
+
+
+@dataclass
+class _DictDetector:
+    """El analyzer.Detector anterior a app/schemas.py."""
+
+    detector_id: str
+    name: str
+    goal: str
+    data_needed: List[str]
+    detection_logic: str
+    expected_false_positives: str
+    tuning_ideas: str
+    rationale: str
+    telemetry_flags: Dict[str, bool]
+    category_hint: str
+    dbir_evidence: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def _mitre_entries() -> Dict[str, Dict[str, str]]:
+    ids = dict.fromkeys(tid for tids in classifier.MITRE_ID_MAP.values() for tid in tids)
+    return {tid: {"technique": tid, "name": f"Technique {tid}"} for tid in ids}
+
+
+def dict_session(templates, mask: int, enriched: Dict[str, Dict[str, str]]) -> Session:
+    telemetry = {flag: bool(mask & TELEMETRY_BITS[flag]) for flag in TELEMETRY_FLAGS}
+    detectors = [
+        _DictDetector(
+            detector_id=t.id, name=t.name, goal=t.goal, data_needed=list(t.data_needed), detection_logic=t.detection_logic,
+            expected_false_positives=t.expected_false_positives, tuning_ideas=t.tuning_ideas,
+            rationale=t.rationale_for(telemetry), telemetry_flags=telemetry, category_hint=t.category_hint,
+        ).__dict__
+        for t in templates
+    ]
+    scores = classifier.score_detectors(detectors)
+    classified = [
+        classifier._classify(detectors[i], enriched, scores.record(i)) for i in rank(scores.risk_score)
+    ]
+    return {"detectors": detectors}, {"classified_detectors": classified}
+
+
+def schema_session(templates, mask: int, enriched: Dict[str, Dict[str, str]]) -> Session:
+    detectors = DetectorBatch(DetectorRecord.from_template(t, mask, t.rationale_for_mask(mask)) for t in templates)
+    scores = classifier.score_detectors(detectors)
+    classified = ClassifiedBatch(
+        detectors,
+        scores,
+        rank(scores.risk_score),
+        {c: classifier._category_mitre(c, enriched) for c in dict.fromkeys(detectors.category_hint)},
+    )
+    return {"detectors": detectors}, {"classified_detectors": classified}
+
+
+def _retained_bytes(build: Callable[[], List[Session]]) -> Tuple[int, List[Session]]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return retained, sessions
+
+
+def _rate(n: int, seconds: float) -> float:
+    return round(n / seconds, 1) if seconds > 0 else float("inf")
+
+
+def measure(make: Callable, workload, enriched) -> Dict[str, Any]:
+    n = len(workload)
+    retained, _ = _retained_bytes(lambda: [make(templates, mask, enriched) for templates, mask in workload])
+
+    t0 = time.perf_counter()
+    sessions = [make(templates, mask, enriched) for templates, mask in workload]
+    t1 = time.perf_counter()
+    for analyzer_out, classifier_out in sessions:
+        reporter.render_body(analyzer_out, classifier_out)
+    t2 = time.perf_counter()
+    for analyzer_out, classifier_out in sessions:
+        encode_json(analyzer_out, "compact")
+        encode_json(classifier_out, "compact")
+    t3 = time.perf_counter()
+    for analyzer_out, classifier_out in sessions:
+        encode_json(analyzer_out, "pretty")
+        encode_json(classifier_out, "pretty")
+    t4 = time.perf_counter()
+
+    return {
+        "retained_mb": round(retained / 2**20, 2),
+        "bytes_per_session": retained // n,
+        "build_sessions_per_s": _rate(n, t1 - t0),
+        "report_sessions_per_s": _rate(n, t2 - t1),
+        "encode_sessions_per_s": _rate(n, t3 - t2),
+        "encode_pretty_sessions_per_s": _rate(n, t4 - t3),
+        "total_s": round(t4 - t0, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Detector representation benchmark (dicts vs app/schemas.py)")
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--detectors", type=int, default=5, help="Detectores por sesión")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    catalog = load_catalog()
+    enriched = _mitre_entries()
+    masks = [rnd.randrange(1 << len(TELEMETRY_FLAGS)) for _ in range(args.sessions)]
+    workload = [(catalog.select(m, args.detectors), m) for m in masks]
+
+    for templates, mask in workload[:50]:
+        old = dict_session(templates, mask, enriched)
+        new = schema_session(templates, mask, enriched)
+        for encoding in ("compact", "pretty"):
+            assert [encode_json(p, encoding) for p in old] == [encode_json(p, encoding) for p in new], "JSON mismatch"
+        assert reporter.render_body(*old) == reporter.render_body(*new), "report mismatch"
+
+    results: Dict[str, Any] = {
+        "sessions": args.sessions,
+        "detectors_per_session": args.detectors,
+        "catalog_size": catalog.size,
+        "dicts": measure(dict_session, workload, enriched),
+        "schemas": measure(schema_session, workload, enriched),
+    }
+    old, new = results["dicts"], results["schemas"]
+    results["memory_ratio"] = round(old["retained_mb"] / new["retained_mb"], 2) if new["retained_mb"] else None
+    results["throughput_ratio"] = round(old["total_s"] / new["total_s"], 2) if new["total_s"] else None
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,71 @@
+"""
+Benchmark del scoring de riesgo: loop por detector (_score_from_category) vs. motor
+vectorizado (ScoringModel.score_matrix) sobre combinaciones detector x tenant.
+
+    python -m benchmarks.bench_scoring [--detectors 200] [--tenants 50,500] [--top-k 5]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from app.agents.catalog import TELEMETRY_FLAGS, mask_flags
+from app.agents.classifier import _score_from_category
+from app.agents.scoring import load_scoring_model, top_k_rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Risk scoring benchmark")
+    parser.add_argument("--detectors", type=int, default=200)
+    parser.add_argument("--tenants", default="50,500")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    model = load_scoring_model()
+    categories = [rnd.choice(model.categories + ("UNKNOWN",)) for _ in range(args.detectors)]
+
+    rows = []
+    for n_tenants in (int(t) for t in args.tenants.split(",")):
+        masks = [rnd.randrange(1 << len(TELEMETRY_FLAGS)) for _ in range(n_tenants)]
+
+        start = time.perf_counter()
+        loop_scores = []
+        loop_top = []
+        for m in masks:
+            telemetry = {f: True for f in mask_flags(m)}
+            scored = [_score_from_category(c, telemetry)["risk_score"] for c in categories]
+            loop_scores.append(scored)
+            loop_top.append(sorted(range(len(scored)), key=lambda i: -scored[i])[: args.top_k])
+        loop_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = model.score_matrix(categories, masks)
+        vec_top = top_k_rows(batch.risk_score, args.top_k)
+        vec_s = time.perf_counter() - start
+
+        assert np.array_equal(batch.risk_score, np.array(loop_scores))
+        assert np.array_equal(vec_top, np.array(loop_top))
+
+        combos = n_tenants * args.detectors
+        rows.append({
+            "tenants": n_tenants,
+            "detectors": args.detectors,
+            "combinations": combos,
+            "loop_s": round(loop_s, 6),
+            "vectorized_s": round(vec_s, 6),
+            "speedup": round(loop_s / vec_s, 1) if vec_s else None,
+            "vectorized_combos_per_s": round(combos / vec_s) if vec_s else None,
+        })
+
+    print(json.dumps(rows, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,114 @@
+"""
+Benchmark de inferencia de telemetría sobre inventarios sintéticos (1 KB a 100 MB).
+
+Compara:
+- legacy_flags: lower() + `in` por keyword con corte temprano (implementación anterior, solo booleanos)
+- legacy_counts: lower() + str.count por keyword (lo mínimo para obtener conteos con el enfoque anterior)
+- matcher: KeywordMatcher.scan en memoria (una pasada, conteos + posiciones)
+- matcher_file: KeywordMatcher.scan_file, leyendo el archivo en chunks (memoria acotada)
+
+    python -m benchmarks.bench_telemetry_scan [--sizes 1KB,1MB,10MB,100MB] [--hit-rate 0.001]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from app.agents.telemetry import TELEMETRY_KEYWORDS, KeywordMatcher
+
+UNITS = {"KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30}
+
+_LINE = "host-{:06d}.corp.example,10.{}.{}.{},{},owner=team-{:02d},agent={}\n"
+_OS = ("windows", "linux", "macos")
+_AGENTS = ("none", "sensor-v2", "collector", "unmanaged")
+
+
+def parse_size(s: str) -> int:
+    s = s.strip().upper()
+    for unit, mult in UNITS.items():
+        if s.endswith(unit):
+            return int(float(s[: -len(unit)]) * mult)
+    return int(s)
+
+
+def synthetic_inventory(size: int, hit_rate: float, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    keywords = [k for kws in TELEMETRY_KEYWORDS.values() for k in kws]
+    parts: List[str] = []
+    n = 0
+    while n < size:
+        line = _LINE.format(
+            rnd.randrange(1_000_000), rnd.randrange(256), rnd.randrange(256), rnd.randrange(256),
+            rnd.choice(_OS), rnd.randrange(100), rnd.choice(_AGENTS),
+        )
+        if rnd.random() < hit_rate:
+            line = line[:-1] + f",notes={rnd.choice(keywords).upper()}\n"
+        parts.append(line)
+        n += len(line)
+    return "".join(parts)[:size]
+
+
+def legacy_flags(text: str) -> Dict[str, bool]:
+    low = text.lower()
+    return {flag: any(k in low for k in kws) for flag, kws in TELEMETRY_KEYWORDS.items()}
+
+
+def legacy_counts(text: str) -> Dict[str, int]:
+    low = text.lower()
+    return {flag: sum(low.count(k) for k in kws) for flag, kws in TELEMETRY_KEYWORDS.items()}
+
+
+def timed(fn: Callable[[], object], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Telemetry inference benchmark")
+    parser.add_argument("--sizes", default="1KB,1MB,10MB,100MB")
+    parser.add_argument("--hit-rate", type=float, default=0.001, help="Fracción de líneas con alguna keyword")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    matcher = KeywordMatcher()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in args.sizes.split(","):
+            size = parse_size(label)
+            text = synthetic_inventory(size, args.hit_rate)
+            path = Path(tmp) / f"inventory_{label.strip()}.csv"
+            path.write_text(text, encoding="utf-8")
+            rounds = args.rounds if size <= 10 * UNITS["MB"] else 1
+
+            scan = matcher.scan(text)
+            assert scan.flags == legacy_flags(text)
+
+            row = {"size": label.strip(), "bytes": size}
+            for name, fn in (
+                ("legacy_flags", lambda: legacy_flags(text)),
+                ("legacy_counts", lambda: legacy_counts(text)),
+                ("matcher", lambda: matcher.scan(text)),
+                ("matcher_file", lambda: matcher.scan_file(path)),
+            ):
+                secs = timed(fn, rounds)
+                row[f"{name}_s"] = round(secs, 6)
+                row[f"{name}_MBps"] = round(size / UNITS["MB"] / secs, 1) if secs else None
+            row["hits"] = {flag: h.count for flag, h in scan.hits.items()}
+            rows.append(row)
+            del text
+
+    print(json.dumps(rows, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
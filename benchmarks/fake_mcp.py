@@ -0,0 +1,179 @@
+"""
+Servidor MCP de prueba para benchmarks: expone get_technique_by_id (mismo formato
+que mitre-mcp, {"technique": {...}}) y get_attack_neighborhood (en lote, como
+app/mcp/mitre_server.py) con latencia, jitter y tasa de fallas configurables.
+No necesita el bundle STIX: cualquier ID devuelve una técnica sintética.
+
+    python -m benchmarks.fake_mcp --port 8765 --latency-ms 20 --jitter-ms 5 --failure-rate 0.02
+
+Desde código: `with FakeMcpServer(latency_ms=20) as url: ...` lo levanta en un
+subproceso y espera a que acepte conexiones.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, List, Optional
+
+
+def build_fake_server(
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+    failure_rate: float = 0.0,
+    seed: Optional[int] = None,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+) -> Any:
+    from mcp.server.fastmcp import FastMCP
+
+    server = FastMCP("mitre-attack-fake", host=host, port=port, log_level="WARNING")
+    rnd = random.Random(seed)
+    stats = {"calls": 0, "failures": 0}
+
+    @server.tool()
+    async def get_technique_by_id(technique_id: str) -> str:
+        """Get a MITRE ATT&CK technique by its ID (synthetic data, injected latency)."""
+        stats["calls"] += 1
+        delay = max(0.0, rnd.gauss(latency_ms, jitter_ms)) if jitter_ms else latency_ms
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if failure_rate and rnd.random() < failure_rate:
+            stats["failures"] += 1
+            raise RuntimeError(f"injected failure for {technique_id}")
+        return json.dumps({
+            "technique": {
+                "id": technique_id,
+                "mitre_id": technique_id,
+                "name": f"Technique {technique_id}",
+                "tactics": ["initial-access"],
+            }
+        })
+
+    @server.tool()
+    async def get_attack_neighborhood(technique_ids: List[str]) -> str:
+        """Bulk neighborhood lookup (synthetic tactics, sub-techniques and mitigations), one latency hit per call."""
+        stats["calls"] += 1
+        delay = max(0.0, rnd.gauss(latency_ms, jitter_ms)) if jitter_ms else latency_ms
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        hoods = {}
+        for tid in dict.fromkeys(technique_ids):
+            sub = "." in tid
+            hoods[tid] = {
+                "technique": {"id": tid, "name": f"Technique {tid}"},
+                "parent": {"id": tid.split(".")[0], "name": f"Technique {tid.split('.')[0]}"} if sub else None,
+                "tactics": [{"id": "TA0001", "name": "Initial Access", "shortname": "initial-access"}],
+                "subtechniques": [] if sub else [
+                    {"id": f"{tid}.00{i}", "name": f"Technique {tid}.00{i}"} for i in (1, 2)
+                ],
+                "mitigations": [{"id": f"M1{sum(map(ord, tid)) % 60:03d}", "name": "Synthetic Mitigation"}],
+            }
+        return json.dumps({"neighborhoods": hoods})
+
+    @server.tool()
+    def get_stats() -> str:
+        """Calls served and injected failures."""
+        return json.dumps(stats)
+
+    return server
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class FakeMcpServer:
+    """Fake MCP en un subproceso; el context manager devuelve la URL para MCP_URL."""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: Optional[int] = None,
+        startup_timeout: float = 20.0,
+    ):
+        self.host = host
+        self.port = port or _free_port(host)
+        self.args: List[str] = [
+            "--host", host, "--port", str(self.port),
+            "--latency-ms", str(latency_ms), "--jitter-ms", str(jitter_ms),
+            "--failure-rate", str(failure_rate), "--seed", str(seed),
+        ]
+        self.startup_timeout = startup_timeout
+        self._proc: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/mcp"
+
+    def start(self) -> str:
+        self._proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_mcp", *self.args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=os.environ.copy(),
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self._proc.poll() is not None:
+                raise RuntimeError(f"fake MCP server exited with code {self._proc.returncode}")
+            try:
+                with socket.create_connection((self.host, self.port), timeout=0.2):
+                    return self.url
+            except OSError:
+                time.sleep(0.05)
+        self.stop()
+        raise TimeoutError(f"fake MCP server not listening on {self.host}:{self.port}")
+
+    def stop(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+        self._proc = None
+
+    def __enter__(self) -> str:
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fake MITRE MCP server (latency / failure injection)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Desvío estándar de la latencia")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probabilidad de error por llamada")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = build_fake_server(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    )
+    server.run("streamable-http")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,112 @@
+"""
+Control del costo de arranque del CLI con `python -X importtime`.
+
+Importa el módulo (por defecto app.main) en un intérprete limpio, suma el tiempo
+acumulado de import y falla (exit 1) si:
+- pasa el presupuesto (--budget-ms, mediana de --runs corridas), o
+- se cargó algún módulo prohibido: el transporte MCP (mcp, httpx, ...) solo
+  debería importarse cuando hay un lookup remoto de verdad.
+
+    python -m benchmarks.import_budget [--module app.main] [--budget-ms 400] [--top 15]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "400"))
+FORBIDDEN = ("mcp", "httpx", "httpcore", "anyio", "jsonschema", "starlette", "uvicorn")
+
+
+def importtime(module: str) -> Dict[str, Tuple[int, int]]:
+    """
+    {módulo: (self_us, cumulative_us)} de lo que cargó `import <module>` en un
+    proceso nuevo (sin lo que el intérprete ya importa al arrancar, ej: site).
+    """
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT), PYTHONDONTWRITEBYTECODE="1")
+    env.pop("PYTHONPROFILEIMPORTTIME", None)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    # Los imports anidados se listan antes que su padre; cada import de primer
+    # nivel (sin sangría) cierra su grupo.
+    group: Dict[str, Tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, raw_name = line[len("import time:"):].split("|", 2)
+        name = raw_name.strip()
+        group[name] = (int(self_us), int(cumulative_us))
+        if raw_name[1:2] != " ":
+            if name == module:
+                return group
+            group = {}
+    return group
+
+
+def top_level_ms(times: Dict[str, Tuple[int, int]], module: str) -> float:
+    """Costo total del arranque: el acumulado del módulo pedido (sin el import de `site`)."""
+    return times[module][1] / 1000 if module in times else 0.0
+
+
+def forbidden_loaded(times: Dict[str, Tuple[int, int]]) -> List[str]:
+    return sorted(name for name in times if name.split(".")[0] in FORBIDDEN)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import-time budget check for the CLI entrypoint")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="Corridas (se compara la mediana)")
+    parser.add_argument("--top", type=int, default=15, help="Módulos más caros a listar")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    runs = [importtime(args.module) for _ in range(max(1, args.runs))]
+    totals = [top_level_ms(t, args.module) for t in runs]
+    median_ms = statistics.median(totals)
+    last = runs[-1]
+    forbidden = forbidden_loaded(last)
+    top = sorted(last.items(), key=lambda kv: kv[1][1], reverse=True)[: args.top]
+
+    report = {
+        "module": args.module,
+        "import_ms": round(median_ms, 1),
+        "runs_ms": [round(t, 1) for t in totals],
+        "budget_ms": args.budget_ms,
+        "modules_loaded": len(last),
+        "forbidden_loaded": forbidden,
+        "top_cumulative_ms": {name: round(cum / 1000, 1) for name, (_, cum) in top},
+    }
+    ok = median_ms <= args.budget_ms and not forbidden
+
+    if args.json:
+        print(json.dumps(dict(report, ok=ok), indent=2))
+    else:
+        print(f"import {args.module}: {report['import_ms']}ms (budget {args.budget_ms}ms, runs {report['runs_ms']})")
+        for name, ms in report["top_cumulative_ms"].items():
+            print(f"  {ms:>8.1f}ms  {name}")
+        if forbidden:
+            print(f"FAIL: transport modules loaded at startup: {', '.join(forbidden[:10])}")
+        if median_ms > args.budget_ms:
+            print(f"FAIL: over budget by {median_ms - args.budget_ms:.1f}ms")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+"""
+Prueba de carga contra el servicio (python -m app.serve).
+
+Abre `--concurrency` conexiones keep-alive y reparte `--requests` pedidos
+POST /pipeline entre ellas; reporta throughput y percentiles de latencia.
+
+    python -m benchmarks.load_serve --url http://127.0.0.1:8080 --requests 500 --concurrency 32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import List, Tuple
+from urllib.parse import urlparse
+
+DEFAULT_INPUT = Path(__file__).resolve().parents[1] / "inputs" / "template_input.txt"
+
+
+async def _request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, body: bytes) -> int:
+    writer.write(
+        (
+            f"POST /pipeline HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode("latin-1")
+        + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _client(host: str, port: int, body: bytes, queue: "asyncio.Queue[int]",
+                  latencies: List[float], errors: List[int]) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            status = await _request(reader, writer, host, body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(url: str, requests: int, concurrency: int, text: str) -> Tuple[float, List[float], List[int]]:
+    parsed = urlparse(url)
+    host, port = parsed.hostname or "127.0.0.1", parsed.port or 80
+    body = json.dumps({"text": text}).encode("utf-8")
+
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    latencies: List[float] = []
+    errors: List[int] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, body, queue, latencies, errors) for _ in range(concurrency)
+    ))
+    return time.perf_counter() - start, latencies, errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test for app.serve")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--input", default=str(DEFAULT_INPUT))
+    args = parser.parse_args()
+
+    text = Path(args.input).read_text(encoding="utf-8")
+    wall, latencies, errors = asyncio.run(run_load(args.url, args.requests, args.concurrency, text))
+
+    ms = sorted(x * 1000 for x in latencies)
+
+    def pct(p: float) -> float:
+        return round(ms[min(len(ms) - 1, int(p * len(ms)))], 3) if ms else 0.0
+
+    print(json.dumps({
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": {
+            "mean": round(statistics.fmean(ms), 3) if ms else 0.0,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "p99": pct(0.99),
+            "max": round(ms[-1], 3) if ms else 0.0,
+        },
+    }, indent=2))
+    return 0 if not errors else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,297 @@
+"""
+Suite de performance del pipeline contra un MCP falso (benchmarks/fake_mcp.py).
+
+Cada escenario corre en subprocesos con su propio entorno (caches, runs/ y
+catálogo en un directorio temporal), así el resultado no depende del estado local:
+- cold_start: `python -m app.main` completo (imports + handshake MCP + lookups), cache de técnicas vacía
+- cold_start_cached: lo mismo con la cache de técnicas ya poblada
+- warm_mcp / warm_cached: run_pipeline repetido en un proceso ya caliente, con y sin
+  lookups al MCP (MITRE_CACHE_TTL=0 fuerza el round trip); incluye tiempo por etapa (metrics.json)
+- batch_<n>: throughput de --batch con catálogos sintéticos de n detectores
+
+Resultados en JSON (--out); si existe el baseline (--baseline) se compara y el
+exit code es 1 ante una regresión mayor a --tolerance.
+
+    python -m benchmarks.suite [--latency-ms 20 --jitter-ms 5 --failure-rate 0]
+                               [--catalog-sizes 5,50,500] [--save-baseline]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.fake_mcp import FakeMcpServer
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_OUT = PROJECT_ROOT / ".cache" / "benchmarks" / "latest.json"
+DEFAULT_BASELINE = PROJECT_ROOT / "benchmarks" / "baseline.json"
+
+_CATEGORIES = ("ATO", "EXPLOIT_PRIVESC", "RANSOMWARE", "EXFIL", "THIRD_PARTY")
+_FLAGS = ("idp", "edr", "cloud", "dns", "proxy", "db")
+
+Metrics = Dict[str, Dict[str, Any]]
+
+
+def _metric(value: float, unit: str, better: str = "lower") -> Dict[str, Any]:
+    return {"value": round(value, 3), "unit": unit, "better": better}
+
+
+def _summary(prefix: str, samples_ms: List[float]) -> Metrics:
+    samples = sorted(samples_ms)
+    return {
+        f"{prefix}.p50_ms": _metric(statistics.median(samples), "ms"),
+        f"{prefix}.p95_ms": _metric(samples[min(len(samples) - 1, int(0.95 * len(samples)))], "ms"),
+    }
+
+
+def synthetic_catalog(n: int) -> Dict[str, Any]:
+    """n detectores ciclando categorías y combinaciones de telemetría (mismo esquema que data/detector_catalog.json)."""
+    base = json.loads((PROJECT_ROOT / "data" / "detector_catalog.json").read_text(encoding="utf-8"))
+    template = base["detectors"][0]
+    detectors = []
+    for i in range(n):
+        category = _CATEGORIES[i % len(_CATEGORIES)]
+        requires = [f for b, f in enumerate(_FLAGS) if (i * 7 + 3) >> b & 1][:3] or ["idp"]
+        detectors.append({
+            **template,
+            "id": f"synthetic-{i:05d}",
+            "name": f"Synthetic detector {i} ({category})",
+            "category_hint": category,
+            "priority": (i * 37) % 100,
+            "requires": requires,
+            "dbir_query": f"{category.lower().replace('_', ' ')} {' '.join(requires)}",
+            "telemetry_check": [[f.upper(), f] for f in requires],
+        })
+    return {**base, "detectors": detectors}
+
+
+class Workspace:
+    """Directorio temporal con caches/runs aislados y el entorno de los subprocesos."""
+
+    def __init__(self, mcp_url: str):
+        self.root = Path(tempfile.mkdtemp(prefix="bench_suite_"))
+        self.mcp_url = mcp_url
+
+    def env(self, **overrides: str) -> Dict[str, str]:
+        env = os.environ.copy()
+        env.update({
+            "PYTHONPATH": str(PROJECT_ROOT) + os.pathsep + env.get("PYTHONPATH", ""),
+            "MCP_URL": self.mcp_url,
+            "MITRE_BACKEND": "mcp",
+            "MITRE_CACHE_PATH": str(self.root / "mitre.sqlite"),
+            "STAGE_CACHE": "0",
+            "RUNS_DIR": str(self.root / "runs"),
+            "RUN_INDEX": "0",
+            "DBIR_INDEX_DIR": str(self.root / "dbir_index"),
+        })
+        env.update(overrides)
+        return env
+
+    def reset_mitre_cache(self) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{self.root / 'mitre.sqlite'}{suffix}").unlink(missing_ok=True)
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def _run(cmd: List[str], env: Dict[str, str], timeout: float = 600) -> subprocess.CompletedProcess:
+    proc = subprocess.run(cmd, env=env, cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=timeout)
+    if proc.returncode not in (0, 1):
+        raise RuntimeError(f"{' '.join(cmd)} failed ({proc.returncode}):\n{proc.stderr[-2000:]}")
+    return proc
+
+
+def bench_cold_start(ws: Workspace, reps: int) -> Metrics:
+    cmd = [sys.executable, "-m", "app.main", "--no-stage-cache"]
+    cold: List[float] = []
+    cached: List[float] = []
+    for _ in range(reps):
+        ws.reset_mitre_cache()
+        for samples in (cold, cached):
+            start = time.perf_counter()
+            _run(cmd, ws.env())
+            samples.append((time.perf_counter() - start) * 1000)
+    return {**_summary("cold_start", cold), **_summary("cold_start_cached", cached)}
+
+
+def bench_warm(ws: Workspace, runs: int) -> Metrics:
+    out: Metrics = {}
+    for name, overrides in (("warm_mcp", {"MITRE_CACHE_TTL": "0"}), ("warm_cached", {})):
+        proc = _run(
+            [sys.executable, "-m", "benchmarks.suite", "--warm-worker", str(runs)],
+            ws.env(**overrides),
+        )
+        data = json.loads(proc.stdout.strip().splitlines()[-1])
+        out.update(_summary(f"{name}.e2e", data["e2e_ms"]))
+        for stage, samples in data["stages_ms"].items():
+            out[f"{name}.{stage}.p50_ms"] = _metric(statistics.median(samples), "ms")
+        out[f"{name}.lookup_failures"] = _metric(data["lookup_failures"], "count")
+    return out
+
+
+def warm_worker(runs: int) -> int:
+    """Modo interno de --warm-worker: proceso caliente, una línea JSON por stdout."""
+    from app.agents.analyzer import AnalyzerAgent
+    from app.mcp.backends import close_backends
+    from app.pipeline import run_pipeline
+
+    agent = AnalyzerAgent()
+    text = (PROJECT_ROOT / "inputs" / "template_input.txt").read_text(encoding="utf-8")
+    run_pipeline(text, agent=agent, memoize=False)  # calienta imports, pool MCP y cache
+
+    e2e: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    failures = 0
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = run_pipeline(text, agent=agent, memoize=False)
+            e2e.append((time.perf_counter() - start) * 1000)
+            for stage, s in result.metrics.get("stages", {}).items():
+                stages.setdefault(stage, []).append(s["duration_ms"])
+            failures += result.metrics.get("mitre", {}).get("failures", 0)
+    finally:
+        close_backends()
+
+    print(json.dumps({"e2e_ms": e2e, "stages_ms": stages, "lookup_failures": failures}))
+    return 0
+
+
+def bench_batch(ws: Workspace, sizes: List[int], inputs: int, workers: int) -> Metrics:
+    inputs_dir = ws.root / "batch_inputs"
+    inputs_dir.mkdir(exist_ok=True)
+    text = (PROJECT_ROOT / "inputs" / "template_input.txt").read_text(encoding="utf-8")
+    for i in range(inputs):
+        (inputs_dir / f"input_{i:04d}.txt").write_text(text, encoding="utf-8")
+
+    out: Metrics = {}
+    for size in sizes:
+        catalog = ws.root / f"catalog_{size}.json"
+        catalog.write_text(json.dumps(synthetic_catalog(size)), encoding="utf-8")
+        proc = _run(
+            [sys.executable, "-m", "app.main", "--batch", str(inputs_dir), "--workers", str(workers)],
+            ws.env(DETECTOR_CATALOG_PATH=str(catalog)),
+        )
+        summary_line = next(l for l in proc.stdout.splitlines() if l.startswith("Summary: "))
+        summary = json.loads(Path(summary_line.split(": ", 1)[1]).read_text(encoding="utf-8"))
+        out[f"batch_{size}.throughput_per_s"] = _metric(summary["throughput_per_s"] or 0.0, "inputs/s", "higher")
+        out[f"batch_{size}.failed"] = _metric(summary["failed"], "count")
+    return out
+
+
+def compare(current: Metrics, baseline: Metrics, tolerance: float, min_delta_ms: float = 1.0) -> List[Dict[str, Any]]:
+    """
+    Una fila por métrica presente en ambos; `regression` si empeoró más que `tolerance`
+    (relativo). En latencias, diferencias menores a `min_delta_ms` se consideran ruido.
+    """
+    rows = []
+    for name in sorted(set(current) & set(baseline)):
+        cur, base = current[name]["value"], baseline[name]["value"]
+        better = current[name].get("better", "lower")
+        if base == 0:
+            change = 0.0 if cur == 0 else float("inf")
+        else:
+            change = (cur - base) / abs(base)
+        worse = change if better == "lower" else -change
+        rows.append({
+            "metric": name,
+            "baseline": base,
+            "current": cur,
+            "change_pct": round(change * 100, 1) if change != float("inf") else None,
+            "regression": worse > tolerance
+            and not (current[name]["unit"] == "ms" and abs(cur - base) < min_delta_ms),
+        })
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pipeline benchmark suite (fake MCP server)")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--cold-reps", type=int, default=3)
+    parser.add_argument("--warm-runs", type=int, default=30)
+    parser.add_argument("--catalog-sizes", default="5,50,500")
+    parser.add_argument("--batch-inputs", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--out", default=str(DEFAULT_OUT), help="JSON con los resultados de esta corrida")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Regresión relativa tolerada (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Diferencia de latencia que se ignora como ruido")
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar esta corrida como baseline")
+    parser.add_argument("--warm-worker", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.warm_worker is not None:
+        return warm_worker(args.warm_worker)
+
+    sizes = [int(s) for s in args.catalog_sizes.split(",") if s.strip()]
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "tolerance", "min_delta_ms", "save_baseline", "warm_worker")}
+    metrics: Metrics = {}
+    started = time.perf_counter()
+
+    with FakeMcpServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, failure_rate=args.failure_rate) as url:
+        ws = Workspace(url)
+        try:
+            for label, fn in (
+                ("cold start", lambda: bench_cold_start(ws, args.cold_reps)),
+                ("warm process", lambda: bench_warm(ws, args.warm_runs)),
+                ("batch", lambda: bench_batch(ws, sizes, args.batch_inputs, args.workers)),
+            ):
+                t0 = time.perf_counter()
+                metrics.update(fn())
+                print(f"{label}: {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        finally:
+            ws.cleanup()
+
+    result = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": config,
+        "wall_s": round(time.perf_counter() - started, 2),
+        "metrics": metrics,
+    }
+
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    for name, m in metrics.items():
+        print(f"{name:<40} {m['value']:>12} {m['unit']}")
+    print(f"Results: {out}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(result, indent=2), encoding="utf-8")
+        print(f"Baseline saved: {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path} (use --save-baseline)")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if baseline.get("config") != config:
+        print("Warning: baseline was recorded with a different configuration", file=sys.stderr)
+    if baseline.get("host", {}).get("cpus") != result["host"]["cpus"]:
+        print("Warning: baseline was recorded on a host with a different CPU count", file=sys.stderr)
+    rows = compare(metrics, baseline["metrics"], args.tolerance, args.min_delta_ms)
+    regressions = [r for r in rows if r["regression"]]
+    for r in rows:
+        flag = "REGRESSION" if r["regression"] else ""
+        print(f"{r['metric']:<40} {r['baseline']:>12} -> {r['current']:<12} {r['change_pct']}% {flag}")
+    print(f"Compared with {baseline_path}: {len(regressions)} regression(s) over {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+"""
+Configuración común de los tests: las caches, índices y colas van a un directorio
+temporal (las variables se leen al importar app.*, por eso se fijan acá arriba).
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+_TMP = Path(tempfile.mkdtemp(prefix="datasec-tests-"))
+
+os.environ.update({
+    "RUN_INDEX": "0",
+    "MITRE_CACHE_PATH": str(_TMP / "mitre_techniques.sqlite"),
+    "STAGE_CACHE_PATH": str(_TMP / "stages.sqlite"),
+    "DBIR_INDEX_DIR": str(_TMP / "dbir"),
+    "JOB_QUEUE_PATH": str(_TMP / "jobs.sqlite"),
+    # benchmarks.fake_mcp corre en un subproceso.
+    "PYTHONPATH": os.pathsep.join(p for p in (str(PROJECT_ROOT), os.environ.get("PYTHONPATH")) if p),
+})
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.mcp import mitre_client, technique_cache  # noqa: E402
+from app.mcp.resilience import CircuitBreaker  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def technique_cache_tmp(tmp_path, monkeypatch):
+    """Cache de técnicas propia de cada test."""
+    cache = technique_cache.TechniqueCache(path=str(tmp_path / "techniques.sqlite"))
+    monkeypatch.setattr(technique_cache, "_cache", cache)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture(scope="session")
+def fake_mcp_url():
+    from benchmarks.fake_mcp import FakeMcpServer
+
+    with FakeMcpServer(latency_ms=5) as url:
+        yield url
+
+
+@pytest.fixture
+def slow_mcp_url():
+    from benchmarks.fake_mcp import FakeMcpServer
+
+    with FakeMcpServer(latency_ms=400) as url:
+        yield url
+
+
+@pytest.fixture
+def mcp_client(fake_mcp_url, monkeypatch):
+    """MitreClient contra el MCP falso, instalado como cliente compartido del proceso."""
+    client = mitre_client.MitreClient(fake_mcp_url, breaker=CircuitBreaker(threshold=2, cooldown=60))
+    monkeypatch.setattr(mitre_client, "_client", client)
+    yield client
+    client.close()
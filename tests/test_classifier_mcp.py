@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.agents import classifier
+from app.mcp import mitre_client
+from app.mcp.resilience import CLOSED, CircuitBreaker
+
+DETECTORS = [
+    {"detector_id": "ato", "name": "Sign-in chain", "category_hint": "ATO", "telemetry_flags": {"idp": True}},
+    {"detector_id": "exfil", "name": "Large upload", "category_hint": "EXFIL", "telemetry_flags": {"proxy": True}},
+]
+
+
+def test_enrichment_resolves_through_the_mcp_and_caches(mcp_client):
+    entries, counters = classifier.enrich_techniques(["T1078", "T1190", "T1078"], backend="mcp")
+    assert entries == {
+        "T1078": {"technique": "T1078", "name": "Technique T1078"},
+        "T1190": {"technique": "T1190", "name": "Technique T1190"},
+    }
+    assert counters["misses"] == 2 and counters["hits"] == 0
+
+    calls = mcp_client.stats["calls"]
+    entries_again, counters = classifier.enrich_techniques(["T1078", "T1190"], backend="mcp")
+    assert entries_again == entries
+    assert counters["hits"] == 2 and counters["misses"] == 0
+    assert mcp_client.stats["calls"] == calls
+
+
+def test_classifier_run_over_the_fake_mcp(mcp_client):
+    out = classifier.run("s1", {"detectors": DETECTORS}, backend="mcp")
+    names = {m["name"] for c in out["classified_detectors"] for m in c["mitre"]}
+    assert names and not any(n.startswith("Unknown") for n in names)
+    scores = [c["risk_score"] for c in out["classified_detectors"]]
+    assert scores == sorted(scores, reverse=True)
+    assert {c["detector_id"] for c in out["classified_detectors"]} == {"ato", "exfil"}
+    assert out["mcp"]["breaker"]["state"] == CLOSED
+    assert out["mitre_lookup"]["budget"]["exhausted"] is False
+
+
+def test_tight_deadline_on_a_slow_server_does_not_trip_the_breaker(slow_mcp_url, monkeypatch):
+    client = mitre_client.MitreClient(slow_mcp_url, breaker=CircuitBreaker(threshold=1, cooldown=60))
+    monkeypatch.setattr(mitre_client, "_client", client)
+    try:
+        entries, _ = classifier.enrich_techniques(["T1078", "T1190"], backend="mcp", deadline=0.05)
+        assert all(e["name"].startswith("Unknown") for e in entries.values())
+        assert client.breaker.snapshot()["state"] == CLOSED
+        assert client.stats["cancelled"] >= 1 and client.stats["failures"] == 0
+    finally:
+        client.close()
+
+
+class _PartialBackend:
+    """Backend remoto que resuelve T1078 y falla T1190."""
+
+    remote = True
+
+    def get_techniques(self, technique_ids, concurrency=None, deadline=None, on_lookup=None):
+        return {tid: {"name": f"Fresh {tid}"} if tid == "T1078" else None for tid in technique_ids}
+
+    def stats_snapshot(self):
+        return {}
+
+
+@pytest.fixture
+def partial_backend(monkeypatch):
+    backend = _PartialBackend()
+    monkeypatch.setattr(classifier, "get_backend", lambda name=None: backend)
+    return backend
+
+
+def test_stale_entries_survive_a_partial_failure(partial_backend, technique_cache_tmp):
+    technique_cache_tmp.put_many({"T1078": {"name": "Old T1078"}, "T1190": {"name": "Old T1190"}})
+    technique_cache_tmp.ttl = -1  # todo vencido
+
+    entries, counters = classifier.enrich_techniques(["T1078", "T1190"], backend="mcp")
+    assert entries["T1078"]["name"] == "Fresh T1078"
+    assert entries["T1190"]["name"] == "Old T1190"
+    assert counters["stale"] == 1
+    assert technique_cache_tmp.get_stale(["T1190"]) == {"T1190": {"name": "Old T1190"}}
+
+
+def test_exhausted_budget_skips_the_backend(partial_backend):
+    from app.mcp.resilience import EnrichmentBudget
+
+    budget = EnrichmentBudget(0.001)
+    while not budget.exhausted:
+        pass
+    entries, counters = classifier.enrich_techniques(["T1078"], backend="mcp", budget=budget)
+    assert entries["T1078"]["name"].startswith("Unknown")
+    assert counters["skipped"] == 1 and budget.skipped == 1
+
+
+def _text_result(text):
+    return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+
+def test_error_payloads_are_not_techniques():
+    assert mitre_client.parse_technique_result(_text_result('{"technique": {"name": "X"}}'), "T1") == {"name": "X"}
+    assert mitre_client.parse_technique_result(_text_result('{"error": "Technique T9 not found"}'), "T9") is None
+
+
+class _NotFoundBackend(_PartialBackend):
+    """Backend remoto que contesta como el server MCP local ante un ID desconocido."""
+
+    def get_techniques(self, technique_ids, concurrency=None, deadline=None, on_lookup=None):
+        result = _text_result('{"error": "Technique T9999 not found"}')
+        return {tid: mitre_client.parse_technique_result(result, tid) for tid in technique_ids}
+
+
+def test_not_found_is_not_cached(monkeypatch, technique_cache_tmp):
+    monkeypatch.setattr(classifier, "get_backend", lambda name=None: _NotFoundBackend())
+    entries, _ = classifier.enrich_techniques(["T9999"], backend="mcp")
+    assert entries["T9999"]["name"].startswith("Unknown")
+    assert technique_cache_tmp.get_stale(["T9999"]) == {}
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from app.jobs import DONE, FAILED, QUEUED, JobQueue, backoff_seconds, run_workers
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=2)
+    yield q
+    q.close()
+
+
+def test_lease_is_exclusive_until_it_expires(queue):
+    job_id = queue.enqueue({"text": "x"}, input_id="a")
+    [first] = queue.lease("w1", visibility_timeout=0.05)
+    assert first["id"] == job_id and first["attempt"] == 1
+    assert queue.lease("w2") == []
+
+    time.sleep(0.1)
+    assert queue.stats()["expired_leases"] == 1
+    [second] = queue.lease("w2", visibility_timeout=60)
+    assert second["id"] == job_id and second["attempt"] == 2
+    assert second["token"] != first["token"]
+
+
+def test_ack_and_heartbeat_need_the_current_token(queue):
+    queue.enqueue({"text": "x"})
+    [old] = queue.lease("w1", visibility_timeout=0.05)
+    time.sleep(0.1)
+    [new] = queue.lease("w2", visibility_timeout=60)
+
+    assert not queue.heartbeat(old["id"], old["token"])
+    assert not queue.ack(old["id"], old["token"], {"owner": "w1"})
+    assert queue.retry(old["id"], old["token"], "late") is None
+    assert queue.heartbeat(new["id"], new["token"])
+    assert queue.ack(new["id"], new["token"], {"owner": "w2"})
+    assert not queue.ack(new["id"], new["token"])
+    assert queue.stats()["done"] == 1
+
+
+def test_retry_waits_for_the_backoff(queue):
+    queue.enqueue({"text": "x"})
+    [job] = queue.lease("w1")
+    assert queue.retry(job["id"], job["token"], "boom", delay=60) == QUEUED
+    assert queue.lease("w1") == []
+    s = queue.stats()
+    assert s["delayed"] == 1 and s["depth"] == 0
+
+
+def test_backoff_is_capped_full_jitter():
+    for attempt in range(1, 12):
+        bound = min(30.0, 2.0 * 2 ** (attempt - 1))
+        assert all(0 <= backoff_seconds(attempt, base=2.0, cap=30.0) <= bound for _ in range(50))
+
+
+def test_max_attempts_moves_the_job_to_failed(queue):
+    queue.enqueue({"text": "x"})
+    [job] = queue.lease("w1")
+    assert queue.retry(job["id"], job["token"], "boom", delay=0) == QUEUED
+    [job] = queue.lease("w1")
+    assert job["attempt"] == 2
+    assert queue.retry(job["id"], job["token"], "boom again", delay=0) == FAILED
+    assert queue.lease("w1") == []
+    assert queue.stats()["failed"] == 1
+
+    assert queue.requeue_failed() == 1
+    [job] = queue.lease("w1")
+    assert job["attempt"] == 1
+
+
+def test_expired_lease_without_attempts_left_fails(queue):
+    queue.enqueue({"text": "x"})
+    for _ in range(2):
+        assert queue.lease("w1", visibility_timeout=0.01)
+        time.sleep(0.05)
+    assert queue.lease("w2") == []
+    s = queue.stats()
+    assert s["failed"] == 1 and s["expired_leases"] == 0
+
+
+def test_ack_result_is_stored(queue):
+    queue.enqueue({"text": "x"})
+    [job] = queue.lease("w1")
+    assert queue.ack(job["id"], job["token"], {"session_id": "s"})
+    row = queue._connect().execute("SELECT status, result FROM jobs").fetchone()
+    assert row == (DONE, '{"session_id": "s"}')
+
+
+def test_run_workers_reports_workers_that_die():
+    out = run_workers(2, path="/proc/nonexistent/q.sqlite", exit_when_idle=True)
+    assert len(out) == 2
+    assert all("FileNotFoundError" in w["error"] for w in out)
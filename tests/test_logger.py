@@ -0,0 +1,22 @@
+from app import run_index
+from app.logger import BackgroundSink, FileSink
+
+
+def _envelope(session_id, agent, payload):
+    return {"session_id": session_id, "agent": agent, "timestamp_utc": "2026-09-01T10:00:00Z", "payload": payload}
+
+
+def test_background_flush_reaches_the_run_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_index, "RUN_INDEX_ENABLED", True)
+    monkeypatch.setattr(run_index, "RUN_INDEX_BATCH", 10)
+    sink = BackgroundSink(FileSink(tmp_path))
+    try:
+        sink.index_envelope(_envelope("s1", "classifier", {"classified_detectors": [
+            {"name": "Sign-in chain", "category": "ATO", "risk_score": 9, "mitre": [{"technique": "T1078"}]},
+        ]}))
+        sink.close_session("s1")
+        sink.flush()
+        assert run_index.get_index(tmp_path).indexed_sessions() == {"s1"}
+    finally:
+        sink.close()
+        run_index.get_index(tmp_path).close()
@@ -0,0 +1,135 @@
+import json
+
+import pytest
+
+from app import rescore
+from app.agents import classifier
+from app.rescore import MissingTechniques, rescore_session
+from benchmarks.bench_rescore import write_sessions
+
+
+def _detector(detector_id, name, category):
+    return {"detector_id": detector_id, "name": name, "category_hint": category, "telemetry_flags": {"idp": True}}
+
+
+def _stored(detector_id, name, category, marker, score):
+    record = {
+        "name": name, "category": category, "risk_score": score, "risk_rationale": marker,
+        "mitre": [{"technique": t, "name": f"Stored {t}"} for t in classifier.MITRE_ID_MAP.get(category, [])],
+    }
+    return {"detector_id": detector_id, **record} if detector_id else record
+
+
+def test_unchanged_fingerprints_need_no_rescore():
+    categories = list(classifier.MITRE_ID_MAP)
+    stored = classifier.scoring_fingerprints(categories)
+    assert rescore._changed_categories(stored, categories) == []
+
+
+def test_a_mapping_change_changes_only_that_fingerprint(monkeypatch):
+    stored = classifier.scoring_fingerprints(["ATO", "EXFIL"])
+    monkeypatch.setitem(classifier.MITRE_ID_MAP, "ATO", ["T1078", "T1110"])
+    assert rescore._changed_categories(stored, ["ATO", "EXFIL"]) == ["ATO"]
+
+
+def test_duplicate_names_are_joined_by_detector_id():
+    analyzer_out = {"detectors": [_detector("a", "Dup", "ATO"), _detector("b", "Dup", "EXFIL")]}
+    classifier_out = {"classified_detectors": [
+        _stored("b", "Dup", "EXFIL", "stored-b", 10), _stored("a", "Dup", "ATO", "stored-a", 5),
+    ]}
+    records, n = rescore_session(analyzer_out, classifier_out, {}, changed=[])
+    assert n == 0
+    assert [(r["detector_id"], r["risk_rationale"]) for r in records] == [("b", "stored-b"), ("a", "stored-a")]
+
+
+def test_legacy_duplicate_names_are_joined_in_order():
+    analyzer_out = {"detectors": [
+        {"name": "Dup", "category_hint": "ATO"}, {"name": "Dup", "category_hint": "EXFIL"},
+    ]}
+    classifier_out = {"classified_detectors": [
+        _stored(None, "Dup", "ATO", "first", 1), _stored(None, "Dup", "EXFIL", "second", 2),
+    ]}
+    records, _ = rescore_session(analyzer_out, classifier_out, {}, changed=[])
+    assert sorted(r["risk_rationale"] for r in records) == ["first", "second"]
+
+
+def test_only_changed_categories_are_rescored():
+    analyzer_out = {"detectors": [_detector("a", "A", "ATO"), _detector("b", "B", "EXFIL")]}
+    classifier_out = {"classified_detectors": [
+        _stored("a", "A", "ATO", "stored-a", 1), _stored("b", "B", "EXFIL", "stored-b", 1),
+    ]}
+    records, n = rescore_session(analyzer_out, classifier_out, {}, changed=["ATO"])
+    by_id = {r["detector_id"]: r for r in records}
+    assert n == 1
+    assert by_id["b"]["risk_rationale"] == "stored-b"
+    assert by_id["a"]["risk_rationale"] != "stored-a"
+    # Mapeo sin cambios: se conservan las entradas MITRE guardadas.
+    assert by_id["a"]["mitre"] == [{"technique": "T1078", "name": "Stored T1078"}]
+
+
+def test_remapped_category_needs_its_techniques(monkeypatch):
+    analyzer_out = {"detectors": [_detector("a", "A", "ATO")]}
+    classifier_out = {"classified_detectors": [_stored("a", "A", "ATO", "stored-a", 1)]}
+    monkeypatch.setitem(classifier.MITRE_ID_MAP, "ATO", ["T1078", "T1110"])
+
+    with pytest.raises(MissingTechniques) as exc:
+        rescore_session(analyzer_out, classifier_out, {}, changed=["ATO"])
+    assert exc.value.ids == ["T1078", "T1110"]
+
+    entries = {t: {"technique": t, "name": f"New {t}"} for t in ("T1078", "T1110")}
+    [record], _ = rescore_session(analyzer_out, classifier_out, entries, changed=["ATO"])
+    assert [m["name"] for m in record["mitre"]] == ["New T1078", "New T1110"]
+
+    [record], _ = rescore_session(analyzer_out, classifier_out, None, changed=["ATO"])
+    assert record["mitre"] == [{"technique": "T1078"}, {"technique": "T1110"}]
+
+
+@pytest.fixture
+def runs_dir(tmp_path):
+    write_sessions(tmp_path, 12)
+    return tmp_path
+
+
+def _classifier_files(runs_dir):
+    return {p: p.read_bytes() for p in sorted(runs_dir.glob("*/classifier.json"))}
+
+
+def test_rescore_without_changes_touches_nothing(runs_dir, monkeypatch):
+    monkeypatch.setattr(rescore, "current_mitre_entries", lambda ids, backend=None: pytest.fail("resolved MITRE"))
+    before = _classifier_files(runs_dir)
+    summary = rescore.run_rescore(runs_dir, workers=1)
+    assert summary["touched"] == 0 and summary["unchanged"] == 12 and summary["failed"] == 0
+    assert _classifier_files(runs_dir) == before
+
+
+def test_unresolved_techniques_skip_the_session(runs_dir, monkeypatch):
+    monkeypatch.setitem(classifier.MITRE_ID_MAP, "ATO", ["T1078", "T1110"])
+    monkeypatch.setattr(rescore, "current_mitre_entries", lambda ids, backend=None: {})
+    before = _classifier_files(runs_dir)
+
+    summary = rescore.run_rescore(runs_dir, workers=1)
+    assert summary["mitre_unavailable"] > 0 and summary["touched"] == 0
+    assert summary["unresolved_techniques"] == ["T1078", "T1110"]
+    assert _classifier_files(runs_dir) == before
+
+
+def test_remapped_sessions_are_rewritten_with_resolved_names(runs_dir, monkeypatch):
+    monkeypatch.setitem(classifier.MITRE_ID_MAP, "ATO", ["T1078", "T1110"])
+    requested = []
+
+    def resolve(ids, backend=None):
+        requested.extend(ids)
+        return {t: {"technique": t, "name": f"New {t}"} for t in ids}
+
+    monkeypatch.setattr(rescore, "current_mitre_entries", resolve)
+    dry = rescore.run_rescore(runs_dir, workers=1, dry_run=True)
+    assert dry["touched"] > 0 and requested == []
+
+    summary = rescore.run_rescore(runs_dir, workers=1)
+    assert summary["touched"] == dry["touched"] and summary["mitre_unavailable"] == 0
+    assert sorted(requested) == ["T1078", "T1110"]
+    for path in runs_dir.glob("*/classifier.json"):
+        payload = json.loads(path.read_text(encoding="utf-8"))["payload"]
+        for c in payload["classified_detectors"]:
+            if c["category"] == "ATO":
+                assert [m["name"] for m in c["mitre"]] == ["New T1078", "New T1110"]
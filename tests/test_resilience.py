@@ -0,0 +1,77 @@
+import time
+
+from app.mcp.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, EnrichmentBudget
+
+
+def test_breaker_opens_after_threshold_and_short_circuits():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record_failure(0.5)
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure(0.5)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    snapshot = breaker.snapshot()
+    assert snapshot["trips"] == 1 and snapshot["short_circuited"] == 1
+    assert snapshot["est_time_saved_s"] == 0.5
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.stats["trips"] == 2
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_cancellation_is_not_a_failure_and_releases_the_probe():
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.record_cancelled()
+    assert breaker.state == CLOSED and breaker.consecutive_failures == 0
+
+    breaker = CircuitBreaker(threshold=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_cancelled()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert breaker.stats["probes"] == 2
+
+
+def test_budget_caps_the_batch_deadline():
+    budget = EnrichmentBudget(10)
+    assert budget.deadline(30) <= 10
+    assert budget.deadline(1) == 1
+    assert budget.deadline(None) <= 10
+    assert not budget.exhausted
+
+
+def test_budget_exhausts():
+    budget = EnrichmentBudget(0.01)
+    time.sleep(0.02)
+    assert budget.exhausted
+    assert budget.remaining() == 0
+    assert budget.deadline(30) == 0
+
+
+def test_no_budget_keeps_the_batch_deadline():
+    for seconds in (None, 0, -1):
+        budget = EnrichmentBudget(seconds)
+        assert budget.remaining() is None and not budget.exhausted
+        assert budget.deadline(30) == 30 and budget.deadline(None) is None
@@ -0,0 +1,43 @@
+import argparse
+
+import pytest
+
+from app.run_index import RunIndex, _date_arg
+
+
+def _classifier(session_id, timestamp, scores):
+    detectors = [
+        {"name": "Sign-in chain", "category": "ATO", "risk_score": scores[0], "mitre": [{"technique": "T1078"}]},
+        {"name": "Vendor access", "category": "THIRD_PARTY", "risk_score": scores[1], "mitre": [{"technique": "T1078"}]},
+    ]
+    return {
+        "session_id": session_id, "agent": "classifier", "timestamp_utc": timestamp,
+        "payload": {"classified_detectors": detectors},
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = RunIndex(tmp_path / "index.sqlite")
+    index.record_many([
+        _classifier("s1", "2026-09-01T10:00:00Z", [9, 4]),
+        _classifier("s2", "2026-09-01T11:00:00Z", [6, 7]),
+        _classifier("s3", "2026-09-02T09:00:00Z", [5, 3]),
+    ])
+    yield index
+    index.close()
+
+
+def test_trend_counts_sessions_not_detectors(index):
+    assert len(index.technique_history("T1078")) == 6
+    assert index.technique_trend("T1078") == [
+        {"day": "2026-09-01", "sessions": 2, "min_score": 7, "avg_score": 8.0, "max_score": 9},
+        {"day": "2026-09-02", "sessions": 1, "min_score": 5, "avg_score": 5.0, "max_score": 5},
+    ]
+    assert [r["day"] for r in index.technique_trend("T1078", since="2026-09-02")] == ["2026-09-02"]
+
+
+def test_invalid_dates_are_usage_errors():
+    assert _date_arg("2026-09-01") == "2026-09-01"
+    with pytest.raises(argparse.ArgumentTypeError):
+        _date_arg("yesterday")
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from app.agents import reporter
+from app.schemas import DetectorBatch, DetectorRecord, dumps, join_key, to_jsonable
+
+DETECTORS = [
+    {"detector_id": "a", "name": "Dup", "goal": "g \"1\"", "data_needed": ["IdP logs", "ñandú"], "category_hint": "ATO",
+     "telemetry_flags": {"idp": True}, "dbir_evidence": [{"score": 1.5, "text": "é"}]},
+    {"detector_id": "b", "name": "Dup", "goal": "%s %d", "data_needed": [], "category_hint": "EXFIL",
+     "telemetry_flags": {"proxy": True, "dns": True}},
+]
+
+
+def _reference(obj, pretty):
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=to_jsonable)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=to_jsonable)
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_dumps_matches_json_dumps(pretty):
+    batch = DetectorBatch.from_dicts(DETECTORS)
+    for obj in (
+        {"detectors": batch},
+        {"payload": {"deep": [batch, {"again": batch}], "text": "línea\nnueva"}},
+        [batch],
+        {"detectors": DetectorBatch()},
+        {"record": batch[0]},
+    ):
+        assert dumps(obj, pretty) == _reference(obj, pretty)
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_dumps_falls_back_for_unhashable_values(pretty):
+    detectors = [dict(DETECTORS[0], goal={"not": "a string"})]
+    batch = DetectorBatch.from_dicts(detectors)
+    assert dumps({"d": batch}, pretty) == _reference({"d": batch}, pretty)
+
+
+def test_batch_round_trips_through_json():
+    batch = DetectorBatch.from_dicts(DETECTORS)
+    loaded = DetectorBatch.from_dicts(json.loads(dumps(batch)))
+    assert loaded.to_dicts() == batch.to_dicts()
+    assert isinstance(loaded[0], DetectorRecord) and loaded[0]["telemetry_flags"]["idp"]
+
+
+def test_join_key_prefers_the_detector_id():
+    assert join_key({"detector_id": "a", "name": "Dup"}) == ("id", "a")
+    assert join_key({"name": "Dup"}) == ("name", "Dup")
+
+
+def test_report_rows_pair_duplicate_names_by_id():
+    classified = [
+        {"detector_id": "b", "name": "Dup", "category": "EXFIL", "risk_score": 9},
+        {"detector_id": "a", "name": "Dup", "category": "ATO", "risk_score": 3},
+    ]
+    rows = list(reporter.iter_rows({"detectors": DETECTORS}, {"classified_detectors": classified}))
+    assert [(d["detector_id"], c["detector_id"]) for d, c in rows] == [("b", "b"), ("a", "a")]
+
+
+def test_report_rows_keep_legacy_duplicates():
+    detectors = [{k: v for k, v in d.items() if k != "detector_id"} for d in DETECTORS]
+    classified = [{"name": "Dup", "risk_score": 9}, {"name": "Dup", "risk_score": 3}]
+    rows = list(reporter.iter_rows({"detectors": detectors}, {"classified_detectors": classified}))
+    assert len(rows) == 2 and rows[0][0] is detectors[0] and rows[1][0] is detectors[1]
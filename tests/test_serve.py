@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.serve import PipelineService
+
+
+@pytest.fixture
+def service():
+    svc = PipelineService(persist=False, threads=1)
+    yield svc
+    svc.executor.shutdown(wait=False)
+
+
+def _exchange(service, raw: bytes) -> bytes:
+    async def run() -> bytes:
+        server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(raw)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout=5)
+            writer.close()
+            return response
+
+    return asyncio.run(run())
+
+
+def _request(body: bytes, length: str = None) -> bytes:
+    return (
+        f"POST /pipeline HTTP/1.1\r\nHost: x\r\nConnection: close\r\n"
+        f"Content-Length: {length if length is not None else len(body)}\r\n\r\n"
+    ).encode("latin-1") + body
+
+
+def test_body_that_is_not_utf8_is_a_bad_request(service):
+    response = _exchange(service, _request(b"\xff\xfe\x00"))
+    assert response.startswith(b"HTTP/1.1 400 ") and b"invalid JSON" in response
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_invalid_content_length_is_a_bad_request(service, length):
+    response = _exchange(service, _request(b"{}", length))
+    assert response.startswith(b"HTTP/1.1 400 ") and b"invalid Content-Length" in response
+
+
+def test_unexpected_errors_still_get_a_response(service, monkeypatch):
+    async def boom(method, path, raw_body):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(service, "dispatch", boom)
+    response = _exchange(service, _request(b"{}"))
+    assert response.startswith(b"HTTP/1.1 500 ") and b"boom" in response
+    assert service.stats["errors"] == 1
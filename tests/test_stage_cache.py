@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from app import pipeline, stage_cache
+from app.agents import classifier
+from app.schemas import DetectorBatch, dumps
+from app.stage_cache import StageCache, content_key
+
+TEXT = "Usamos Okta SSO, VPN, EDR en endpoints y DLP; logs de AWS CloudTrail, DNS y proxy web. " * 2
+
+
+def test_content_key_is_stable_and_length_prefixed():
+    assert content_key("s", "a", {"x": 1, "y": 2}) == content_key("s", "a", {"y": 2, "x": 1})
+    assert content_key("s", "ab", "c") != content_key("s", "a", "bc")
+    assert content_key("s", "a") != content_key("t", "a")
+
+
+def test_key_version_invalidates_old_keys(monkeypatch):
+    key = content_key("classifier", "x")
+    monkeypatch.setattr(stage_cache, "STAGE_KEY_VERSION", stage_cache.STAGE_KEY_VERSION + "-next")
+    assert content_key("classifier", "x") != key
+
+
+def test_classifier_key_is_the_same_for_batches_and_stored_json():
+    detectors = [
+        {"detector_id": "ato", "name": "Sign-in chain", "category_hint": "ATO", "telemetry_flags": {"idp": True}},
+    ]
+    batch = DetectorBatch.from_dicts(detectors)
+    loaded = json.loads(dumps({"detectors": batch}))
+    assert pipeline._classifier_key({"detectors": batch}, "mcp") == pipeline._classifier_key(loaded, "mcp")
+    assert pipeline._classifier_key({"detectors": batch}, "mcp") != pipeline._classifier_key({"detectors": batch}, "local")
+
+
+def test_classifier_key_changes_with_the_mitre_mapping(monkeypatch):
+    out = {"detectors": [{"detector_id": "ato", "name": "n", "category_hint": "ATO"}]}
+    key = pipeline._classifier_key(out, "mcp")
+    monkeypatch.setitem(classifier.MITRE_ID_MAP, "ATO", ["T1078", "T1110"])
+    assert pipeline._classifier_key(out, "mcp") != key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = StageCache(path=str(tmp_path / "stages.sqlite"))
+    yield c
+    c.close()
+
+
+def test_pipeline_does_not_memoize_by_default(mcp_client, cache):
+    pipeline.run_pipeline(TEXT, backend="mcp", stage_cache=cache)
+    assert cache.stats == {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+
+def test_memoized_hit_drops_the_per_run_stats(mcp_client, cache):
+    first = pipeline.run_pipeline(TEXT, backend="mcp", memoize=True, stage_cache=cache)
+    assert not first.classifier["stage_cache"]["hit"]
+    assert "mcp" in first.classifier and "mitre_lookup" in first.classifier
+
+    second = pipeline.run_pipeline(TEXT, backend="mcp", memoize=True, stage_cache=cache)
+    assert second.classifier["stage_cache"]["hit"] and second.analyzer["stage_cache"]["hit"]
+    for key in classifier.RUN_STATS_KEYS:
+        assert key not in second.classifier
+    assert json.loads(dumps(second.classified_detectors)) == json.loads(dumps(first.classified_detectors))
@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from app.agents.telemetry import TELEMETRY_KEYWORDS, KeywordMatcher
+
+
+def _substring_flags(text):
+    low = text.lower()
+    return {flag: any(k in low for k in kws) for flag, kws in TELEMETRY_KEYWORDS.items()}
+
+
+@pytest.mark.parametrize("text, flags", [
+    ("idproxy", {"idp", "proxy"}),
+    ("dnsso", {"dns", "idp"}),
+    ("databasendpoint", {"db", "edr"}),
+    ("nothing here", set()),
+])
+def test_overlapping_keywords_all_count(text, flags):
+    scan = KeywordMatcher().scan(text)
+    assert {f for f, hit in scan.flags.items() if hit} == flags
+
+
+def test_same_flags_as_a_substring_check():
+    rnd = random.Random(0)
+    alphabet = "abcdeilnoprstxyz -"
+    keywords = [k for kws in TELEMETRY_KEYWORDS.values() for k in kws]
+    matcher = KeywordMatcher()
+    for _ in range(300):
+        parts = [rnd.choice(keywords) if rnd.random() < 0.2 else "".join(rnd.choices(alphabet, k=rnd.randint(0, 6)))
+                 for _ in range(rnd.randint(1, 8))]
+        text = "".join(parts)
+        assert matcher.scan(text).flags == _substring_flags(text), text
+
+
+def test_matches_across_chunk_boundaries_count_once():
+    text = "okta " * 10 + "cloudtrail " * 10
+    whole = KeywordMatcher().scan(text)
+    chunked = KeywordMatcher().scan_chunks([text[i:i + 7] for i in range(0, len(text), 7)])
+    assert {f: h.count for f, h in chunked.hits.items()} == {f: h.count for f, h in whole.hits.items()}
+    assert whole.hits["idp"].count == 10 and whole.hits["cloud"].count == 10